@@ -16,13 +16,28 @@ Base resource with utility functions
 
 """
 
+import base64
 import falcon
 from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.storage import elastic
 import json
+import six
+
+# maximum number of documents fetched by id in a single request
+MAX_IDS = 1000
 
 
 class BaseResource(object):
 
+    @staticmethod
+    def is_admin(req):
+        ctxt = req.env.get('freezer.context')
+        return bool(ctxt and (ctxt.is_admin or 'admin' in ctxt.roles))
+
+    def check_admin(self, req, message):
+        if not self.is_admin(req):
+            raise freezer_api_exc.AccessForbidden(message)
+
     @staticmethod
     def json_body(req):
         if not req.content_length:
@@ -33,9 +48,145 @@ class BaseResource(object):
         except Exception:
             raise freezer_api_exc.BadDataFormat('Empty request body. A valid '
                                                 'JSON document is required.')
+        if isinstance(raw_json, bytes):
+            raw_json = raw_json.decode('utf-8')
         try:
-            json_data = json.loads(raw_json, 'utf-8')
+            json_data = json.loads(raw_json)
         except ValueError:
             raise falcon.HTTPError(falcon.HTTP_753,
                                    'Malformed JSON')
         return json_data
+
+    @staticmethod
+    def json_list_body(req):
+        """
+        Reads a list of JSON documents from the request body, given either
+        as a JSON array or as newline delimited JSON (one document per line)
+        """
+        if not req.content_length:
+            return []
+
+        try:
+            raw_data = req.stream.read()
+        except Exception:
+            raise freezer_api_exc.BadDataFormat('Empty request body. A valid '
+                                                'JSON document is required.')
+        if isinstance(raw_data, bytes):
+            raw_data = raw_data.decode('utf-8')
+        try:
+            json_data = json.loads(raw_data)
+            return json_data if isinstance(json_data, list) else [json_data]
+        except ValueError:
+            pass
+        try:
+            return [json.loads(line) for line in raw_data.splitlines()
+                    if line.strip()]
+        except ValueError:
+            raise freezer_api_exc.BadDataFormat('Malformed JSON')
+
+    @staticmethod
+    def get_cursor(req):
+        """
+        Decodes the opaque pagination cursor passed in the 'cursor'
+        query parameter
+
+        :return: the sort value of the last document of the previous page,
+                 None when no cursor is given
+        """
+        cursor = req.get_param('cursor')
+        if not cursor:
+            return None
+        try:
+            data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+            return json.loads(data.decode('utf-8'))['after']
+        except Exception:
+            raise freezer_api_exc.BadDataFormat('Invalid pagination cursor')
+
+    @staticmethod
+    def get_fields(req):
+        """
+        Reads the comma separated list of fields to return from the
+        'fields' query parameter. Fields prefixed by '-' are left out.
+
+        :return: list of fields, None when all of them are requested
+        """
+        return req.get_param_as_list('fields')
+
+    @staticmethod
+    def get_refresh(req):
+        """
+        Reads the refresh policy of a single write from the 'refresh'
+        query parameter: immediate, wait_for or none
+
+        :return: the refresh policy, None to use the configured one
+        """
+        refresh = req.get_param('refresh')
+        if refresh is None:
+            return None
+        if refresh not in elastic.REFRESH_POLICIES:
+            raise freezer_api_exc.BadDataFormat(
+                'Invalid refresh policy {0}, must be one of: {1}'.format(
+                    refresh, ', '.join(elastic.REFRESH_POLICIES)))
+        return refresh
+
+    @staticmethod
+    def check_ids(ids):
+        if len(ids) > MAX_IDS:
+            raise freezer_api_exc.BadDataFormat(
+                'At most {0} ids can be requested at once'.format(MAX_IDS))
+        return ids
+
+    def get_ids(self, req):
+        """
+        Reads the comma separated list of document ids from the 'ids'
+        query parameter
+
+        :return: list of ids, None when the parameter is not given
+        """
+        ids = req.get_param_as_list('ids')
+        if ids is None:
+            return None
+        return self.check_ids(ids)
+
+    def get_ids_body(self, req):
+        """
+        Reads the list of document ids of a {"ids": [...]} request body
+        """
+        doc = self.json_body(req)
+        ids = doc.get('ids') if isinstance(doc, dict) else None
+        if not isinstance(ids, list) or not all(
+                isinstance(i, six.string_types) for i in ids):
+            raise freezer_api_exc.BadDataFormat(
+                'The request body must be an object with a list of "ids"')
+        return self.check_ids(ids)
+
+    @staticmethod
+    def make_cursor(value):
+        """
+        Encodes the sort value of the last document of a page into an
+        opaque cursor that can be used to request the next page
+        """
+        data = json.dumps({'after': value}).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def paginate(self, resp, collection, obj_list, limit, sort_key):
+        """
+        Sets the response body with the page of documents and, when more
+        documents may follow, the cursor of the next page
+        """
+        resp.body = {collection: obj_list}
+        if obj_list and len(obj_list) == limit:
+            resp.body['next'] = self.make_cursor(sort_key(obj_list[-1]))
+
+    @staticmethod
+    def wants_total(req):
+        """
+        Whether the 'total' query parameter asks for the number of
+        documents matching the search, which costs an extra count query
+        """
+        return bool(req.get_param_as_bool('total'))
+
+    @staticmethod
+    def set_total(resp, total):
+        resp.body['total'] = total
+        resp.set_header('X-Total-Count', str(total))
@@ -18,8 +18,11 @@ limitations under the License.
 from freezer_api.api.v1 import actions
 from freezer_api.api.v1 import backups
 from freezer_api.api.v1 import clients
+from freezer_api.api.v1 import export
 from freezer_api.api.v1 import homedoc
 from freezer_api.api.v1 import jobs
+from freezer_api.api.v1 import metrics
+from freezer_api.api.v1 import retentions
 from freezer_api.api.v1 import sessions
 
 
@@ -41,21 +44,57 @@ def public_endpoints(storage_driver):
         ('/',
          homedoc.Resource()),
 
+        ('/_metrics',
+         metrics.MetricsResource()),
+
         ('/backups',
          backups.BackupsCollectionResource(storage_driver)),
 
+        ('/backups/_bulk',
+         backups.BackupsBulkResource(storage_driver)),
+
+        ('/backups/_mget',
+         backups.BackupsMgetResource(storage_driver)),
+
+        ('/backups/_count',
+         backups.BackupsCountResource(storage_driver)),
+
+        ('/backups/_stats',
+         backups.BackupsStatsResource(storage_driver)),
+
+        ('/backups/_export',
+         export.ExportResource(storage_driver, 'backups')),
+
         ('/backups/{backup_id}',
          backups.BackupsResource(storage_driver)),
 
         ('/clients',
          clients.ClientsCollectionResource(storage_driver)),
 
+        ('/clients/_mget',
+         clients.ClientsMgetResource(storage_driver)),
+
+        ('/clients/_count',
+         clients.ClientsCountResource(storage_driver)),
+
+        ('/clients/_export',
+         export.ExportResource(storage_driver, 'clients')),
+
         ('/clients/{client_id}',
          clients.ClientsResource(storage_driver)),
 
         ('/jobs',
          jobs.JobsCollectionResource(storage_driver)),
 
+        ('/jobs/_mget',
+         jobs.JobsMgetResource(storage_driver)),
+
+        ('/jobs/_count',
+         jobs.JobsCountResource(storage_driver)),
+
+        ('/jobs/_export',
+         export.ExportResource(storage_driver, 'jobs')),
+
         ('/jobs/{job_id}',
          jobs.JobsResource(storage_driver)),
 
@@ -65,12 +104,30 @@ def public_endpoints(storage_driver):
         ('/actions',
          actions.ActionsCollectionResource(storage_driver)),
 
+        ('/actions/_mget',
+         actions.ActionsMgetResource(storage_driver)),
+
+        ('/actions/_count',
+         actions.ActionsCountResource(storage_driver)),
+
+        ('/actions/_export',
+         export.ExportResource(storage_driver, 'actions')),
+
         ('/actions/{action_id}',
          actions.ActionsResource(storage_driver)),
 
         ('/sessions',
          sessions.SessionsCollectionResource(storage_driver)),
 
+        ('/sessions/_mget',
+         sessions.SessionsMgetResource(storage_driver)),
+
+        ('/sessions/_count',
+         sessions.SessionsCountResource(storage_driver)),
+
+        ('/sessions/_export',
+         export.ExportResource(storage_driver, 'sessions')),
+
         ('/sessions/{session_id}',
          sessions.SessionsResource(storage_driver)),
 
@@ -80,4 +137,13 @@ def public_endpoints(storage_driver):
         ('/sessions/{session_id}/jobs/{job_id}',
          sessions.SessionsJob(storage_driver)),
 
+        ('/retentions',
+         retentions.RetentionsCollectionResource(storage_driver)),
+
+        ('/retentions/_export',
+         export.ExportResource(storage_driver, 'retentions')),
+
+        ('/retentions/{retention_id}',
+         retentions.RetentionsResource(storage_driver)),
+
     ]
@@ -28,14 +28,26 @@ class ActionsCollectionResource(resource.BaseResource):
         self.db = storage_driver
 
     def on_get(self, req, resp):
-        # GET /v1/actions(?limit,offset)     Lists actions
+        # GET /v1/actions(?limit,offset,cursor)     Lists actions
         user_id = req.get_header('X-User-ID')
+        ids = self.get_ids(req)
+        if ids is not None:
+            resp.body = {'actions': self.db.mget_action(
+                user_id=user_id, action_ids=ids, fields=self.get_fields(req))}
+            return
         offset = req.get_param_as_int('offset') or 0
         limit = req.get_param_as_int('limit') or 10
         search = self.json_body(req)
+        after = self.get_cursor(req)
         obj_list = self.db.search_action(user_id=user_id, offset=offset,
-                                         limit=limit, search=search)
-        resp.body = {'actions': obj_list}
+                                         limit=limit, search=search,
+                                         after=after,
+                                         fields=self.get_fields(req))
+        self.paginate(resp, 'actions', obj_list, limit,
+                      lambda doc: doc['action_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_action(user_id=user_id,
+                                                      search=search))
 
     def on_post(self, req, resp):
         # POST /v1/actions    Creates action entry
@@ -44,11 +56,42 @@ class ActionsCollectionResource(resource.BaseResource):
             raise freezer_api_exc.BadDataFormat(
                 message='Missing request body')
         user_id = req.get_header('X-User-ID')
-        action_id = self.db.add_action(user_id=user_id, doc=doc)
+        action_id = self.db.add_action(user_id=user_id, doc=doc,
+                                       refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'action_id': action_id}
 
 
+class ActionsMgetResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/actions/_mget
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/actions/_mget    Gets the actions with the given ids
+        user_id = req.get_header('X-User-ID')
+        ids = self.get_ids_body(req)
+        resp.body = {'actions': self.db.mget_action(
+            user_id=user_id, action_ids=ids, fields=self.get_fields(req))}
+
+
+class ActionsCountResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/actions/_count
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/actions/_count    Counts the actions matching the search
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'count': self.db.count_action(user_id=user_id,
+                                                   search=search)}
+
+
 class ActionsResource(resource.BaseResource):
     """
     Handler for endpoint: /v1/actions/{action_id}
@@ -61,7 +104,8 @@ class ActionsResource(resource.BaseResource):
         # GET /v1/actions/{action_id}     retrieves the specified action
         # search in body
         user_id = req.get_header('X-User-ID') or ''
-        obj = self.db.get_action(user_id=user_id, action_id=action_id)
+        obj = self.db.get_action(user_id=user_id, action_id=action_id,
+                                 fields=self.get_fields(req))
         if obj:
             resp.body = obj
         else:
@@ -70,7 +114,8 @@ class ActionsResource(resource.BaseResource):
     def on_delete(self, req, resp, action_id):
         # DELETE /v1/actions/{action_id}     Deletes the specified action
         user_id = req.get_header('X-User-ID')
-        self.db.delete_action(user_id=user_id, action_id=action_id)
+        self.db.delete_action(user_id=user_id, action_id=action_id,
+                              refresh=self.get_refresh(req))
         resp.body = {'action_id': action_id}
         resp.status = falcon.HTTP_204
 
@@ -80,7 +125,8 @@ class ActionsResource(resource.BaseResource):
         doc = self.json_body(req)
         new_version = self.db.update_action(user_id=user_id,
                                             action_id=action_id,
-                                            patch_doc=doc)
+                                            patch_doc=doc,
+                                            refresh=self.get_refresh(req))
         resp.body = {'action_id': action_id, 'version': new_version}
 
     def on_post(self, req, resp, action_id):
@@ -89,6 +135,7 @@ class ActionsResource(resource.BaseResource):
         doc = self.json_body(req)
         new_version = self.db.replace_action(user_id=user_id,
                                              action_id=action_id,
-                                             doc=doc)
+                                             doc=doc,
+                                             refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'action_id': action_id, 'version': new_version}
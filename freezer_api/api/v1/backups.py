@@ -28,14 +28,32 @@ class BackupsCollectionResource(resource.BaseResource):
         self.db = storage_driver
 
     def on_get(self, req, resp):
-        # GET /v1/backups(?limit,offset)     Lists backups
+        # GET /v1/backups(?limit,offset,cursor,latest)     Lists backups
         user_id = req.get_header('X-User-ID')
+        ids = self.get_ids(req)
+        if ids is not None:
+            resp.body = {'backups': self.db.mget_backup(
+                user_id=user_id, backup_ids=ids, fields=self.get_fields(req))}
+            return
+        if req.get_param_as_bool('latest'):
+            # most recent backup of each backup set
+            resp.body = {'backups': self.db.get_latest_backups(
+                user_id=user_id, search=self.json_body(req),
+                fields=self.get_fields(req))}
+            return
         offset = req.get_param_as_int('offset') or 0
         limit = req.get_param_as_int('limit') or 10
         search = self.json_body(req)
+        after = self.get_cursor(req)
         obj_list = self.db.get_backup(user_id=user_id, offset=offset,
-                                      limit=limit, search=search)
-        resp.body = {'backups': obj_list}
+                                      limit=limit, search=search,
+                                      after=after,
+                                      fields=self.get_fields(req))
+        self.paginate(resp, 'backups', obj_list, limit,
+                      lambda doc: doc['backup_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_backup(user_id=user_id,
+                                                      search=search))
 
     def on_post(self, req, resp):
         # POST /v1/backups    Creates backup entry
@@ -46,11 +64,80 @@ class BackupsCollectionResource(resource.BaseResource):
         user_name = req.get_header('X-User-Name')
         user_id = req.get_header('X-User-ID')
         backup_id = self.db.add_backup(
-            user_id=user_id, user_name=user_name, doc=doc)
+            user_id=user_id, user_name=user_name, doc=doc,
+            refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'backup_id': backup_id}
 
 
+class BackupsBulkResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/backups/_bulk
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/backups/_bulk    Creates many backup entries
+        # the body is a JSON array or newline delimited JSON documents
+        docs = self.json_list_body(req)
+        if not docs:
+            raise freezer_api_exc.BadDataFormat(
+                message='Missing request body')
+        user_name = req.get_header('X-User-Name')
+        user_id = req.get_header('X-User-ID')
+        results = self.db.add_backups(
+            user_id=user_id, user_name=user_name, docs=docs,
+            refresh=self.get_refresh(req))
+        resp.body = {'backups': results}
+
+
+class BackupsMgetResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/backups/_mget
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/backups/_mget    Gets the backups with the given ids
+        user_id = req.get_header('X-User-ID')
+        ids = self.get_ids_body(req)
+        resp.body = {'backups': self.db.mget_backup(
+            user_id=user_id, backup_ids=ids, fields=self.get_fields(req))}
+
+
+class BackupsCountResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/backups/_count
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/backups/_count    Counts the backups matching the search
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'count': self.db.count_backup(user_id=user_id,
+                                                   search=search)}
+
+
+class BackupsStatsResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/backups/_stats
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/backups/_stats    Backup count, latest timestamp and
+        #                           total sizes of each backup set
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'backup_sets': self.db.get_backup_stats(
+            user_id=user_id, search=search)}
+
+
 class BackupsResource(resource.BaseResource):
     """
     Handler for endpoint: /v1/backups/{backup_id}
@@ -61,7 +148,8 @@ class BackupsResource(resource.BaseResource):
     def on_get(self, req, resp, backup_id):
         # GET /v1/backups/{backup_id}     Get backup details
         user_id = req.get_header('X-User-ID')
-        obj = self.db.get_backup(user_id=user_id, backup_id=backup_id)
+        obj = self.db.get_backup(user_id=user_id, backup_id=backup_id,
+                                 fields=self.get_fields(req))
         if obj:
             resp.body = obj
         else:
@@ -71,6 +159,7 @@ class BackupsResource(resource.BaseResource):
         # DELETE /v1/backups/{backup_id}     Deletes the specified backup
         user_id = req.get_header('X-User-ID')
         self.db.delete_backup(
-            user_id=user_id, backup_id=backup_id)
+            user_id=user_id, backup_id=backup_id,
+            refresh=self.get_refresh(req))
         resp.body = {'backup_id': backup_id}
         resp.status = falcon.HTTP_204
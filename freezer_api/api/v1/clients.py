@@ -28,14 +28,26 @@ class ClientsCollectionResource(resource.BaseResource):
         self.db = storage_driver
 
     def on_get(self, req, resp):
-        # GET /v1/clients(?limit,offset)     Lists backups
+        # GET /v1/clients(?limit,offset,cursor)     Lists backups
         user_id = req.get_header('X-User-ID')
+        ids = self.get_ids(req)
+        if ids is not None:
+            resp.body = {'clients': self.db.mget_client(
+                user_id=user_id, client_ids=ids, fields=self.get_fields(req))}
+            return
         offset = req.get_param_as_int('offset') or 0
         limit = req.get_param_as_int('limit') or 10
         search = self.json_body(req)
+        after = self.get_cursor(req)
         obj_list = self.db.get_client(user_id=user_id, offset=offset,
-                                      limit=limit, search=search)
-        resp.body = {'clients': obj_list}
+                                      limit=limit, search=search,
+                                      after=after,
+                                      fields=self.get_fields(req))
+        self.paginate(resp, 'clients', obj_list, limit,
+                      lambda doc: doc['client']['client_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_client(user_id=user_id,
+                                                      search=search))
 
     def on_post(self, req, resp):
         # POST /v1/clients    Creates client entry
@@ -45,11 +57,41 @@ class ClientsCollectionResource(resource.BaseResource):
                 message='Missing request body')
         user_id = req.get_header('X-User-ID')
         client_id = self.db.add_client(
-            user_id=user_id, doc=doc)
+            user_id=user_id, doc=doc, refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'client_id': client_id}
 
 
+class ClientsMgetResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/clients/_mget
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/clients/_mget    Gets the clients with the given ids
+        user_id = req.get_header('X-User-ID')
+        ids = self.get_ids_body(req)
+        resp.body = {'clients': self.db.mget_client(
+            user_id=user_id, client_ids=ids, fields=self.get_fields(req))}
+
+
+class ClientsCountResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/clients/_count
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/clients/_count    Counts the clients matching the search
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'count': self.db.count_client(user_id=user_id,
+                                                   search=search)}
+
+
 class ClientsResource(resource.BaseResource):
     """
     Handler for endpoint: /v1/clients/{client_id}
@@ -61,7 +103,8 @@ class ClientsResource(resource.BaseResource):
         # GET /v1/clients(?limit,offset)
         # search in body
         user_id = req.get_header('X-User-ID') or ''
-        obj = self.db.get_client(user_id=user_id, client_id=client_id)
+        obj = self.db.get_client(user_id=user_id, client_id=client_id,
+                                 fields=self.get_fields(req))
         if obj:
             resp.body = obj[0]
         else:
@@ -71,6 +114,7 @@ class ClientsResource(resource.BaseResource):
         # DELETE /v1/clients/{client_id}     Deletes the specified backup
         user_id = req.get_header('X-User-ID')
         self.db.delete_client(
-            user_id=user_id, client_id=client_id)
+            user_id=user_id, client_id=client_id,
+            refresh=self.get_refresh(req))
         resp.body = {'client_id': client_id}
         resp.status = falcon.HTTP_204
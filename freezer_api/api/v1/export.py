@@ -0,0 +1,46 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import falcon
+from freezer_api.api.common import resource
+from freezer_api.common import export
+
+
+class ExportResource(resource.BaseResource):
+    """
+    Handler for endpoints: /v1/{backups,clients,...}/_export
+    """
+    def __init__(self, storage_driver, doc_type):
+        self.db = storage_driver
+        self.doc_type = doc_type
+
+    def on_get(self, req, resp):
+        # GET /v1/backups/_export(?fields,all_users)
+        #    Streams the documents of the user as NDJSON, one per line
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        fields = self.get_fields(req)
+        if req.get_param_as_bool('all_users'):
+            self.check_admin(req, 'Exporting the documents of all the '
+                                  'users requires the admin role')
+            docs = self.db.export_all(self.doc_type, search=search,
+                                      fields=fields)
+        else:
+            docs = self.db.export(self.doc_type, user_id, search=search,
+                                  fields=fields)
+        resp.status = falcon.HTTP_200
+        resp.content_type = 'application/x-ndjson'
+        resp.stream = export.iter_ndjson(docs)
@@ -31,35 +31,41 @@ class JobsBaseResource(resource.BaseResource):
     def __init__(self, storage_driver):
         self.db = storage_driver
 
-    def get_action(self, user_id, action_id):
-        found_action = None
-        try:
-            found_action = self.db.get_action(
-                user_id=user_id, action_id=action_id)
-        except freezer_api_exc.DocumentNotFound:
-            pass
-        return found_action
-
     def update_actions_in_job(self, user_id, job_doc):
         """
         Looks into a job document and creates actions in the db.
-        Actions are given an action_id if they don't have one yet
+        Actions are given an action_id if they don't have one yet, and a
+        new one when they differ from the stored action with their id.
+        The stored actions are read with a single multi-get and the new
+        ones written with a single bulk request.
         """
         job = Job(job_doc)
-        for action in job.actions():
-            if action.action_id:
-                # action has action_id, let's see if it's in the db
-                found_action_doc = self.get_action(
-                    user_id=user_id, action_id=action.action_id)
-                if found_action_doc:
-                    if action == Action(found_action_doc):
-                        # action already present in the db, do nothing
-                        continue
-                    else:
-                        # action is different, generate new action_id
-                        action.action_id = ''
-                # action not found in db, leave current action_id
-            self.db.add_action(user_id=user_id, doc=action.doc)
+        actions = list(job.actions())
+        action_ids = [action.action_id for action in actions
+                      if action.action_id]
+        known_actions = {}
+        if action_ids:
+            for doc in self.db.mget_action(user_id=user_id,
+                                           action_ids=action_ids,
+                                           fields=['freezer_action']):
+                known_actions[doc['action_id']] = Action(doc)
+        new_actions = []
+        for action in actions:
+            known_action = known_actions.get(action.action_id)
+            if known_action is not None:
+                if action == known_action:
+                    # action already present in the db, do nothing
+                    continue
+                # action is different, generate new action_id
+                action.create_new_action_id()
+            elif not action.action_id:
+                action.create_new_action_id()
+            # action not found in db, leave current action_id. A later
+            # action of the job with the same id is compared to this one
+            known_actions[action.action_id] = action
+            new_actions.append(action.doc)
+        if new_actions:
+            self.db.add_actions(user_id=user_id, docs=new_actions)
 
 
 class JobsCollectionResource(JobsBaseResource):
@@ -68,14 +74,26 @@ class JobsCollectionResource(JobsBaseResource):
     """
 
     def on_get(self, req, resp):
-        # GET /v1/jobs(?limit,offset)     Lists jobs
+        # GET /v1/jobs(?limit,offset,cursor)     Lists jobs
         user_id = req.get_header('X-User-ID')
+        ids = self.get_ids(req)
+        if ids is not None:
+            resp.body = {'jobs': self.db.mget_job(
+                user_id=user_id, job_ids=ids, fields=self.get_fields(req))}
+            return
         offset = req.get_param_as_int('offset') or 0
         limit = req.get_param_as_int('limit') or 10
         search = self.json_body(req)
+        after = self.get_cursor(req)
         obj_list = self.db.search_job(user_id=user_id, offset=offset,
-                                      limit=limit, search=search)
-        resp.body = {'jobs': obj_list}
+                                      limit=limit, search=search,
+                                      after=after,
+                                      fields=self.get_fields(req))
+        self.paginate(resp, 'jobs', obj_list, limit,
+                      lambda doc: doc['job_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_job(user_id=user_id,
+                                                   search=search))
 
     def on_post(self, req, resp):
         # POST /v1/jobs    Creates job entry
@@ -87,11 +105,42 @@ class JobsCollectionResource(JobsBaseResource):
 
         user_id = req.get_header('X-User-ID')
         self.update_actions_in_job(user_id, job.doc)
-        job_id = self.db.add_job(user_id=user_id, doc=job.doc)
+        job_id = self.db.add_job(user_id=user_id, doc=job.doc,
+                                 refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'job_id': job_id}
 
 
+class JobsMgetResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/jobs/_mget
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/jobs/_mget    Gets the jobs with the given ids
+        user_id = req.get_header('X-User-ID')
+        ids = self.get_ids_body(req)
+        resp.body = {'jobs': self.db.mget_job(
+            user_id=user_id, job_ids=ids, fields=self.get_fields(req))}
+
+
+class JobsCountResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/jobs/_count
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/jobs/_count    Counts the jobs matching the search
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'count': self.db.count_job(user_id=user_id,
+                                                search=search)}
+
+
 class JobsResource(JobsBaseResource):
     """
     Handler for endpoint: /v1/jobs/{job_id}
@@ -101,7 +150,8 @@ class JobsResource(JobsBaseResource):
         # GET /v1/jobs/{job_id}     retrieves the specified job
         # search in body
         user_id = req.get_header('X-User-ID') or ''
-        obj = self.db.get_job(user_id=user_id, job_id=job_id)
+        obj = self.db.get_job(user_id=user_id, job_id=job_id,
+                              fields=self.get_fields(req))
         if obj:
             resp.body = obj
         else:
@@ -110,7 +160,8 @@ class JobsResource(JobsBaseResource):
     def on_delete(self, req, resp, job_id):
         # DELETE /v1/jobs/{job_id}     Deletes the specified job
         user_id = req.get_header('X-User-ID')
-        self.db.delete_job(user_id=user_id, job_id=job_id)
+        self.db.delete_job(user_id=user_id, job_id=job_id,
+                           refresh=self.get_refresh(req))
         resp.body = {'job_id': job_id}
         resp.status = falcon.HTTP_204
 
@@ -121,7 +172,8 @@ class JobsResource(JobsBaseResource):
         self.update_actions_in_job(user_id, job.doc)
         new_version = self.db.update_job(user_id=user_id,
                                          job_id=job_id,
-                                         patch_doc=job.doc)
+                                         patch_doc=job.doc,
+                                         refresh=self.get_refresh(req))
         resp.body = {'job_id': job_id, 'version': new_version}
 
     def on_post(self, req, resp, job_id):
@@ -131,7 +183,8 @@ class JobsResource(JobsBaseResource):
         self.update_actions_in_job(user_id, job.doc)
         new_version = self.db.replace_job(user_id=user_id,
                                           job_id=job_id,
-                                          doc=job.doc)
+                                          doc=job.doc,
+                                          refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'job_id': job_id, 'version': new_version}
 
@@ -0,0 +1,35 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+
+from freezer_api.api.common import resource
+from freezer_api.common import metrics
+
+
+class MetricsResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/_metrics
+
+    The counters are kept by each worker process: the response carries
+    the pid of the worker that served it.
+    """
+
+    def on_get(self, req, resp):
+        # GET /v1/_metrics     Counters of the worker, admin only
+        self.check_admin(req, 'Reading the metrics requires the admin role')
+        resp.body = {'pid': os.getpid(), 'counters': metrics.snapshot()}
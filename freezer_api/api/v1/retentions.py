@@ -0,0 +1,106 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import falcon
+from freezer_api.api.common import resource
+from freezer_api.common import exceptions as freezer_api_exc
+
+
+class RetentionsCollectionResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/retentions
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/retentions(?limit,offset,cursor)     Lists retention rules
+        user_id = req.get_header('X-User-ID')
+        offset = req.get_param_as_int('offset') or 0
+        limit = req.get_param_as_int('limit') or 10
+        search = self.json_body(req)
+        after = self.get_cursor(req)
+        obj_list = self.db.search_retention(user_id=user_id, offset=offset,
+                                            limit=limit, search=search,
+                                            after=after,
+                                            fields=self.get_fields(req))
+        self.paginate(resp, 'retentions', obj_list, limit,
+                      lambda doc: doc['retention_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_retention(user_id=user_id,
+                                                         search=search))
+
+    def on_post(self, req, resp):
+        # POST /v1/retentions    Creates a retention rule
+        doc = self.json_body(req)
+        if not doc:
+            raise freezer_api_exc.BadDataFormat(
+                message='Missing request body')
+        user_id = req.get_header('X-User-ID')
+        retention_id = self.db.add_retention(user_id=user_id, doc=doc,
+                                             refresh=self.get_refresh(req))
+        resp.status = falcon.HTTP_201
+        resp.body = {'retention_id': retention_id}
+
+
+class RetentionsResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/retentions/{retention_id}
+    """
+
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp, retention_id):
+        # GET /v1/retentions/{retention_id}     retrieves the retention rule
+        user_id = req.get_header('X-User-ID') or ''
+        obj = self.db.get_retention(user_id=user_id,
+                                    retention_id=retention_id,
+                                    fields=self.get_fields(req))
+        if obj:
+            resp.body = obj
+        else:
+            resp.status = falcon.HTTP_404
+
+    def on_delete(self, req, resp, retention_id):
+        # DELETE /v1/retentions/{retention_id}     Deletes the retention rule
+        user_id = req.get_header('X-User-ID')
+        self.db.delete_retention(user_id=user_id, retention_id=retention_id,
+                                 refresh=self.get_refresh(req))
+        resp.body = {'retention_id': retention_id}
+        resp.status = falcon.HTTP_204
+
+    def on_patch(self, req, resp, retention_id):
+        # PATCH /v1/retentions/{retention_id}     updates the retention rule
+        user_id = req.get_header('X-User-ID') or ''
+        doc = self.json_body(req)
+        new_version = self.db.update_retention(user_id=user_id,
+                                               retention_id=retention_id,
+                                               patch_doc=doc,
+                                               refresh=self.get_refresh(req))
+        resp.body = {'retention_id': retention_id, 'version': new_version}
+
+    def on_post(self, req, resp, retention_id):
+        # PUT /v1/retentions/{retention_id}     creates/replaces the rule
+        user_id = req.get_header('X-User-ID') or ''
+        doc = self.json_body(req)
+        new_version = self.db.replace_retention(user_id=user_id,
+                                                retention_id=retention_id,
+                                                doc=doc,
+                                                refresh=self.get_refresh(req))
+        resp.status = falcon.HTTP_201
+        resp.body = {'retention_id': retention_id, 'version': new_version}
@@ -16,12 +16,20 @@ limitations under the License.
 """
 
 import falcon
+import random
 from six import iteritems
 
 from freezer_api.api.common import resource
 from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.common import metrics
 import time
 
+# attempts of a session action when concurrent requests modify the session
+ACTION_MAX_ATTEMPTS = 10
+# upper bound, in seconds, of the random delay before the first retry,
+# growing linearly with the following ones
+ACTION_RETRY_DELAY = 0.05
+
 
 class SessionsCollectionResource(resource.BaseResource):
     """
@@ -31,14 +39,26 @@ class SessionsCollectionResource(resource.BaseResource):
         self.db = storage_driver
 
     def on_get(self, req, resp):
-        # GET /v1/sessions(?limit,offset)     Lists sessions
+        # GET /v1/sessions(?limit,offset,cursor)     Lists sessions
         user_id = req.get_header('X-User-ID')
+        ids = self.get_ids(req)
+        if ids is not None:
+            resp.body = {'sessions': self.db.mget_session(
+                user_id=user_id, session_ids=ids, fields=self.get_fields(req))}
+            return
         offset = req.get_param_as_int('offset') or 0
         limit = req.get_param_as_int('limit') or 10
         search = self.json_body(req)
+        after = self.get_cursor(req)
         obj_list = self.db.search_session(user_id=user_id, offset=offset,
-                                          limit=limit, search=search)
-        resp.body = {'sessions': obj_list}
+                                          limit=limit, search=search,
+                                          after=after,
+                                          fields=self.get_fields(req))
+        self.paginate(resp, 'sessions', obj_list, limit,
+                      lambda doc: doc['session_id'])
+        if self.wants_total(req):
+            self.set_total(resp, self.db.count_session(user_id=user_id,
+                                                       search=search))
 
     def on_post(self, req, resp):
         # POST /v1/sessions    Creates session entry
@@ -47,11 +67,42 @@ class SessionsCollectionResource(resource.BaseResource):
             raise freezer_api_exc.BadDataFormat(
                 message='Missing request body')
         user_id = req.get_header('X-User-ID')
-        session_id = self.db.add_session(user_id=user_id, doc=doc)
+        session_id = self.db.add_session(user_id=user_id, doc=doc,
+                                         refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'session_id': session_id}
 
 
+class SessionsMgetResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/sessions/_mget
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_post(self, req, resp):
+        # POST /v1/sessions/_mget    Gets the sessions with the given ids
+        user_id = req.get_header('X-User-ID')
+        ids = self.get_ids_body(req)
+        resp.body = {'sessions': self.db.mget_session(
+            user_id=user_id, session_ids=ids, fields=self.get_fields(req))}
+
+
+class SessionsCountResource(resource.BaseResource):
+    """
+    Handler for endpoint: /v1/sessions/_count
+    """
+    def __init__(self, storage_driver):
+        self.db = storage_driver
+
+    def on_get(self, req, resp):
+        # GET /v1/sessions/_count    Counts the sessions matching the search
+        user_id = req.get_header('X-User-ID')
+        search = self.json_body(req)
+        resp.body = {'count': self.db.count_session(user_id=user_id,
+                                                    search=search)}
+
+
 class SessionsResource(resource.BaseResource):
     """
     Handler for endpoint: /v1/sessions/{session_id}
@@ -64,7 +115,8 @@ class SessionsResource(resource.BaseResource):
         # GET /v1/sessions/{session_id}     retrieves the specified session
         # search in body
         user_id = req.get_header('X-User-ID') or ''
-        obj = self.db.get_session(user_id=user_id, session_id=session_id)
+        obj = self.db.get_session(user_id=user_id, session_id=session_id,
+                                  fields=self.get_fields(req))
         if obj:
             resp.body = obj
         else:
@@ -73,7 +125,8 @@ class SessionsResource(resource.BaseResource):
     def on_delete(self, req, resp, session_id):
         # DELETE /v1/sessions/{session_id}     Deletes the specified session
         user_id = req.get_header('X-User-ID')
-        self.db.delete_session(user_id=user_id, session_id=session_id)
+        self.db.delete_session(user_id=user_id, session_id=session_id,
+                               refresh=self.get_refresh(req))
         resp.body = {'session_id': session_id}
         resp.status = falcon.HTTP_204
 
@@ -83,7 +136,8 @@ class SessionsResource(resource.BaseResource):
         doc = self.json_body(req)
         new_version = self.db.update_session(user_id=user_id,
                                              session_id=session_id,
-                                             patch_doc=doc)
+                                             patch_doc=doc,
+                                             refresh=self.get_refresh(req))
         resp.body = {'session_id': session_id, 'version': new_version}
 
     def on_post(self, req, resp, session_id):
@@ -95,7 +149,8 @@ class SessionsResource(resource.BaseResource):
                 message='Missing request body')
         new_version = self.db.replace_session(user_id=user_id,
                                               session_id=session_id,
-                                              doc=doc)
+                                              doc=doc,
+                                              refresh=self.get_refresh(req))
         resp.status = falcon.HTTP_201
         resp.body = {'session_id': session_id, 'version': new_version}
 
@@ -120,15 +175,29 @@ class SessionsAction(resource.BaseResource):
         except Exception:
             raise freezer_api_exc.BadDataFormat("Bad action request format")
 
-        session_doc = self.db.get_session(user_id=user_id,
-                                          session_id=session_id)
-        session = Session(session_doc)
-        session.execute_action(action, params)
-
-        if session.need_update:
-            self.db.update_session(user_id=user_id,
-                                   session_id=session_id,
-                                   patch_doc=session.doc)
+        # the session is written back only if no other request modified
+        # it in the meantime, otherwise the action is applied again to
+        # the updated session
+        for attempt in range(1, ACTION_MAX_ATTEMPTS + 1):
+            session_doc = self.db.get_session(user_id=user_id,
+                                              session_id=session_id)
+            version = session_doc.pop('_version', None)
+            session = Session(session_doc)
+            session.execute_action(action, params)
+            if not session.need_update:
+                break
+            try:
+                self.db.update_session(user_id=user_id,
+                                       session_id=session_id,
+                                       patch_doc=session.doc,
+                                       version=version)
+                break
+            except freezer_api_exc.DocumentExists:
+                metrics.incr('session_action_conflicts')
+                if attempt == ACTION_MAX_ATTEMPTS:
+                    raise
+                metrics.incr('session_action_retries')
+                time.sleep(random.uniform(0, ACTION_RETRY_DELAY * attempt))
         resp.status = falcon.HTTP_202
         resp.body = {'result': session.action_result,
                      'session_tag': session.session_tag}
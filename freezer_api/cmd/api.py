@@ -70,6 +70,16 @@ def build_app(db=None):
     return app
 
 
+def load_eventlet():
+    try:
+        import eventlet
+        from eventlet import wsgi  # noqa
+    except ImportError:
+        raise Exception(_i18n._('The eventlet server requires the eventlet '
+                                'package'))
+    return eventlet
+
+
 def main():
     # setup opts
     config.parse_args()
@@ -79,11 +89,20 @@ def main():
     # quick simple server for testing purposes or simple scenarios
     ip = CONF.get('bind_host', '0.0.0.0')
     port = CONF.get('bind_port', 9090)
+    server = CONF.get('server', 'paste')
+    if server == 'eventlet':
+        # sockets and locks must be green before the app and its storage
+        # client are built
+        eventlet = load_eventlet()
+        eventlet.monkey_patch()
     try:
-        httpserver.serve(
-            application=deploy.loadapp('config:%s' % paste_conf, name='main'),
-            host=ip,
-            port=port)
+        application = deploy.loadapp('config:%s' % paste_conf, name='main')
+        if server == 'eventlet':
+            eventlet.wsgi.server(eventlet.listen((ip, port)),
+                                 application,
+                                 max_size=CONF.get('max_concurrency', 1000))
+        else:
+            httpserver.serve(application=application, host=ip, port=port)
         message = _i18n._('Server listening on %(ip)s:%(port)s' %
                           {'ip': ip, 'port': port})
         _LOG.info(message)
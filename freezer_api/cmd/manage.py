@@ -16,8 +16,10 @@ limitations under the License.
 """
 
 import elasticsearch
+from elasticsearch import helpers as es_helpers
 import json
 import sys
+import time
 
 from oslo_config import cfg
 from oslo_log import log
@@ -26,7 +28,11 @@ from oslo_log import log
 from freezer_api import __version__ as FREEZER_API_VERSION
 from freezer_api.common.config import setup_logging
 from freezer_api.common import db_mappings
+from freezer_api.common import export
+from freezer_api.common import retention
+from freezer_api.storage import driver
 from freezer_api.storage.driver import get_elk_opts
+from freezer_api.storage import elastic
 
 
 CONF = cfg.CONF
@@ -35,14 +41,76 @@ LOG = log.getLogger(__name__)
 DEFAULT_ES_SERVER_PORT = 9200
 DEFAULT_INDEX = 'freezer'
 DEFAULT_REPLICAS = 1
+DEFAULT_REFRESH_INTERVAL = '1s'
+DEFAULT_IMPORT_THREADS = 4
+# seconds between two progress reports of an import
+REPORT_INTERVAL = 10
 
 
 def add_db_opts(subparser):
     parser = subparser.add_parser('db')
     parser.add_argument('options',
                         choices=['sync', 'update', 'remove', 'show',
-                                 'update-settings'],
+                                 'update-settings', 'reindex'],
                         help='Create/update/delete freezer-api mappings in elk')
+    parser = subparser.add_parser('backups')
+    parser.add_argument('options',
+                        choices=['prune'],
+                        help='Delete the backups expired by the retention '
+                             'rules of the users')
+    parser.add_argument('--dry-run',
+                        dest='dry_run',
+                        action='store_true',
+                        help='Print the expired backups without deleting '
+                             'them')
+    parser.add_argument('--batch-size',
+                        dest='batch_size',
+                        type=int,
+                        default=elastic.BULK_CHUNK_SIZE,
+                        help='Number of backups deleted by each request '
+                             '(default: {0})'.format(elastic.BULK_CHUNK_SIZE))
+    parser.add_argument('--rate-limit',
+                        dest='rate_limit',
+                        type=float,
+                        default=0,
+                        help='Maximum number of backups deleted per second, '
+                             '0 for no limit (default: 0)')
+    parser = subparser.add_parser('export')
+    parser.add_argument('options',
+                        choices=export.DOC_TYPES,
+                        help='Type of the documents written as NDJSON')
+    parser.add_argument('--user-id',
+                        dest='user_id',
+                        default=None,
+                        help='Export the documents of this user only '
+                             '(default: all the users)')
+    parser.add_argument('--output',
+                        dest='output',
+                        default=None,
+                        help='File the documents are written to '
+                             '(default: standard output)')
+    parser = subparser.add_parser('import')
+    parser.add_argument('options',
+                        choices=export.DOC_TYPES,
+                        help='Type of the documents read as NDJSON')
+    parser.add_argument('files',
+                        nargs='*',
+                        default=['-'],
+                        help='Exports to load, "-" for the standard input '
+                             '(default: standard input)')
+    parser.add_argument('--threads',
+                        dest='threads',
+                        type=int,
+                        default=DEFAULT_IMPORT_THREADS,
+                        help='Number of bulk requests sent in parallel '
+                             '(default: {0})'.format(DEFAULT_IMPORT_THREADS))
+    parser.add_argument('--chunk-size',
+                        dest='chunk_size',
+                        type=int,
+                        default=elastic.BULK_CHUNK_SIZE,
+                        help='Number of documents written by each bulk '
+                             'request (default: {0})'
+                             .format(elastic.BULK_CHUNK_SIZE))
 
 
 def parse_config(mapping_choices):
@@ -108,6 +176,16 @@ def parse_config(mapping_choices):
          )
 
 
+def get_number_of_replicas():
+    """
+    :return: the configured number of replicas, 0 included, or the default
+             one when the option is not set
+    """
+    if CONF.storage.number_of_replicas is None:
+        return DEFAULT_REPLICAS
+    return CONF.storage.number_of_replicas
+
+
 class ElasticSearchManager(object):
     """
     Managing ElasticSearch mappings operations
@@ -115,6 +193,8 @@ class ElasticSearchManager(object):
     Update: Update mappings
     remove: deletes the mappings
     show: print out all the mappings
+    reindex: copy the documents to apply the routing option
+    import: load NDJSON exports
     """
     def __init__(self, mappings):
         self.mappings = mappings.copy()
@@ -197,6 +277,29 @@ class ElasticSearchManager(object):
                 print ("Couldn't update {0}. Request returned {1}".format(
                     doc_type, check.get('acknowledged')))
 
+        if (CONF.storage.backup_index_interval ==
+                elastic.BACKUP_INDEX_MONTHLY and 'backups' in _mappings):
+            check = self.sync_backup_partitions(_mappings['backups'])
+            print ("Creating or Updating the backups template is {0}".format(
+                check.get('acknowledged')))
+
+    def sync_backup_partitions(self, mapping):
+        """
+        Uploads the template of the monthly backup indices, which are
+        created by the first write of a backup of their month, and updates
+        the mapping of the existing ones
+        :param mapping: the backups mapping
+        :return: dict
+        """
+        alias = elastic.get_backup_alias(self.index)
+        template = elastic.get_backup_template(
+            self.index, mapping, get_number_of_replicas())
+        res = self.elk.indices.put_template(name=alias, body=template)
+        if self.elk.indices.exists_alias(name=alias):
+            self.elk.indices.put_mapping(index=alias, doc_type='backups',
+                                         body=mapping)
+        return res
+
     def _create_index(self):
         """
         Create the index that will allow us to put the mappings under it
@@ -305,6 +408,200 @@ class ElasticSearchManager(object):
             }
         return self.elk.indices.put_settings(body=body, index=self.index)
 
+    def get_copy_action(self, hit, index):
+        """
+        :return: bulk action writing the document of a search hit to the
+                 index, routed as configured by the routing option
+        """
+        action = {'_index': index,
+                  '_type': hit['_type'],
+                  '_id': hit['_id'],
+                  '_source': hit['_source']}
+        user_id = hit['_source'].get('user_id')
+        if CONF.storage.routing == elastic.ROUTING_USER_ID and user_id:
+            action['_routing'] = user_id
+        return action
+
+    def copy_documents(self, source, target):
+        """
+        Copies all the documents of the source index to the target index
+        :return: the number of documents copied
+        """
+        hits = es_helpers.scan(self.elk, index=source,
+                               query={'query': {'match_all': {}}})
+        copied, errors = es_helpers.bulk(
+            self.elk, (self.get_copy_action(hit, target) for hit in hits),
+            chunk_size=elastic.BULK_CHUNK_SIZE, raise_on_error=False)
+        if errors:
+            raise Exception('Unable to copy {0} documents from {1} to {2}: '
+                            '{3}'.format(len(errors), source, target,
+                                         errors[0]))
+        self.elk.indices.refresh(index=target)
+        print ("Copied {0} documents from {1} to {2}".format(
+            copied, source, target))
+        return copied
+
+    def reindex(self):
+        """
+        Copies the documents to a new index, routed as configured by the
+        routing option, and makes the index name an alias of the new index.
+        The monthly backup indices are copied to a temporary index and back.
+        Writes made while it runs are lost: the api has to be stopped.
+        :return: the name of the new index
+        """
+        if not self.prompt('All the documents of {0} are going to be copied '
+                           'with routing "{1}". Is the api stopped ? (y/n) '
+                           .format(self.index, CONF.storage.routing)):
+            return None
+        replicas = get_number_of_replicas()
+        target = '{0}-{1}'.format(self.index, time.strftime('%Y%m%d%H%M%S'))
+        self.elk.indices.create(index=target, body={
+            'settings': {'number_of_replicas': replicas},
+            'mappings': self.mappings})
+        self.copy_documents(self.index, target)
+        if self.elk.indices.exists_alias(name=self.index):
+            previous = list(self.elk.indices.get_alias(name=self.index))
+            actions = [{'remove': {'index': index, 'alias': self.index}}
+                       for index in previous]
+            actions.append({'add': {'index': target, 'alias': self.index}})
+            self.elk.indices.update_aliases(body={'actions': actions})
+            print ("Alias {0} moved from {1} to {2}, the previous indices "
+                   "can be deleted".format(self.index, ', '.join(previous),
+                                           target))
+        elif self.prompt('Index {0} is going to be deleted and replaced by an '
+                         'alias of {1}. Continue ? (y/n) '
+                         .format(self.index, target)):
+            self.delete_index()
+            self.elk.indices.put_alias(index=target, name=self.index)
+            print ("Index {0} is now an alias of {1}".format(self.index,
+                                                            target))
+        else:
+            print ("Index {0} left unchanged, the documents are copied in "
+                   "{1}".format(self.index, target))
+            return target
+        if CONF.storage.backup_index_interval == elastic.BACKUP_INDEX_MONTHLY:
+            self.reindex_backup_partitions()
+        return target
+
+    def reindex_backup_partitions(self):
+        """
+        Copies each monthly backup index to a temporary index, recreates it
+        from the template and copies the backups back
+        """
+        alias = elastic.get_backup_alias(self.index)
+        if not self.elk.indices.exists_alias(name=alias):
+            return
+        mappings = {'backups': self.mappings['backups']}
+        for partition in sorted(self.elk.indices.get_alias(name=alias)):
+            # the name of the copy must not match the template
+            copy = 'reindex-' + partition
+            self.elk.indices.create(index=copy, body={'mappings': mappings})
+            self.copy_documents(partition, copy)
+            self.elk.indices.delete(index=partition)
+            self.elk.indices.create(index=partition)
+            self.copy_documents(copy, partition)
+            self.elk.indices.delete(index=copy)
+
+    def get_import_indices(self, doc_type):
+        """
+        :return: names of the existing indices the documents of the given
+                 type are written to
+        """
+        if (doc_type == 'backups' and CONF.storage.backup_index_interval ==
+                elastic.BACKUP_INDEX_MONTHLY):
+            alias = elastic.get_backup_alias(self.index)
+            if not self.elk.indices.exists_alias(name=alias):
+                return []
+            return sorted(self.elk.indices.get_alias(name=alias))
+        return [self.index]
+
+    def disable_refresh(self, indices):
+        """
+        Stops the periodic refresh and the replication of the indices, so
+        that the bulk requests are only written once and never searched
+        :return: dict of the refresh interval of each index, to restore
+        """
+        if not indices:
+            return {}
+        settings = self.elk.indices.get_settings(index=','.join(indices),
+                                                 flat_settings=True)
+        intervals = dict(
+            (name, index['settings'].get('index.refresh_interval',
+                                         DEFAULT_REFRESH_INTERVAL))
+            for name, index in settings.items())
+        self.elk.indices.put_settings(
+            index=','.join(sorted(intervals)),
+            body={'index': {'refresh_interval': '-1',
+                            'number_of_replicas': 0}})
+        return intervals
+
+    def restore_refresh(self, intervals):
+        """
+        Restores the refresh interval of the indices, and the number of
+        replicas of the configuration, then refreshes them
+        """
+        replicas = get_number_of_replicas()
+        for name, interval in sorted(intervals.items()):
+            self.elk.indices.put_settings(
+                index=name,
+                body={'index': {'refresh_interval': interval,
+                                'number_of_replicas': replicas}})
+        if intervals:
+            self.elk.indices.refresh(index=','.join(sorted(intervals)))
+
+    def import_documents(self, doc_type, paths, thread_count=4,
+                         chunk_size=elastic.BULK_CHUNK_SIZE):
+        """
+        Loads NDJSON exports with parallel bulk requests. The documents keep
+        their ids, the existing ones are overwritten. The refresh and the
+        replicas of the indices are disabled while it runs; the monthly
+        backup indices created by the import get the template settings.
+        :return: (imported, failed) numbers of documents
+        """
+        manager = elastic.get_type_manager(
+            self.elk, doc_type, index=self.index,
+            backup_index_interval=CONF.storage.backup_index_interval,
+            routing=CONF.storage.routing)
+
+        def read_documents():
+            for path in paths:
+                if path == '-':
+                    for doc in export.read_ndjson(sys.stdin):
+                        yield doc
+                    continue
+                with open(path, 'rb') as f:
+                    for doc in export.read_ndjson(f):
+                        yield doc
+
+        actions = (manager.get_bulk_action(doc, manager.get_doc_id(doc))
+                   for doc in read_documents())
+        intervals = self.disable_refresh(self.get_import_indices(doc_type))
+        imported, errors = 0, []
+        started = reported = time.time()
+        try:
+            for ok, item in es_helpers.parallel_bulk(
+                    self.elk, actions, thread_count=thread_count,
+                    chunk_size=chunk_size, raise_on_error=False,
+                    raise_on_exception=False):
+                if ok:
+                    imported += 1
+                else:
+                    errors.append(item)
+                if time.time() - reported >= REPORT_INTERVAL:
+                    reported = time.time()
+                    print ("{0} {1} imported, {2:.0f} documents/s".format(
+                        imported, doc_type,
+                        imported / (reported - started)))
+        finally:
+            self.restore_refresh(intervals)
+        elapsed = max(time.time() - started, 0.001)
+        print ("{0} {1} imported in {2:.1f}s, {3:.0f} documents/s, {4} "
+               "failed".format(imported, doc_type, elapsed,
+                               imported / elapsed, len(errors)))
+        for item in errors[:10]:
+            print ("Failed: {0}".format(item))
+        return imported, len(errors)
+
     def prompt(self, message):
         """
         Helper function that is being used to ask the user for confirmation, ...
@@ -321,6 +618,50 @@ class ElasticSearchManager(object):
                 return False
 
 
+def prune_backups(db, dry_run=False, batch_size=elastic.BULK_CHUNK_SIZE,
+                  rate_limit=0):
+    """
+    Deletes the backups expired by the retention rules, a batch at a time.
+    With a rate limit, it waits after each batch so that no more than
+    rate_limit backups are deleted per second.
+    :return: the number of expired backups
+    """
+    total = 0
+    for user_id, backup_ids in retention.iter_expired_backups(
+            db, batch_size=batch_size):
+        total += len(backup_ids)
+        if dry_run:
+            for backup_id in backup_ids:
+                print ("Would delete backup {0} of user {1}".format(
+                    backup_id, user_id))
+            continue
+        started = time.time()
+        deleted = db.delete_backups(user_id, backup_ids)
+        print ("Deleted {0} backups of user {1}".format(deleted, user_id))
+        if rate_limit:
+            time.sleep(max(len(backup_ids) / float(rate_limit) -
+                           (time.time() - started), 0))
+    print ("{0} expired backups {1}".format(
+        total, 'found' if dry_run else 'deleted'))
+    return total
+
+
+def export_documents(db, doc_type, out, user_id=None):
+    """
+    Writes the documents as NDJSON while they are scrolled through
+    :return: the number of exported documents
+    """
+    if user_id is None:
+        docs = db.export_all(doc_type)
+    else:
+        docs = db.export(doc_type, user_id)
+    total = 0
+    for chunk in export.iter_ndjson(docs):
+        out.write(chunk)
+        total += chunk.count(b'\n')
+    return total
+
+
 def main():
     mappings = db_mappings.get_mappings()
     parse_config(mapping_choices=mappings.keys())
@@ -330,8 +671,31 @@ def main():
         sys.exit(0)
 
     try:
+        if CONF.db.name == 'backups':
+            prune_backups(driver.get_db(), dry_run=CONF.db.dry_run,
+                          batch_size=CONF.db.batch_size,
+                          rate_limit=CONF.db.rate_limit)
+            return
+        if CONF.db.name == 'export':
+            if CONF.db.output:
+                with open(CONF.db.output, 'wb') as out:
+                    total = export_documents(driver.get_db(),
+                                             CONF.db.options, out,
+                                             user_id=CONF.db.user_id)
+            else:
+                total = export_documents(
+                    driver.get_db(), CONF.db.options,
+                    getattr(sys.stdout, 'buffer', sys.stdout),
+                    user_id=CONF.db.user_id)
+            sys.stderr.write('{0} {1} exported\n'.format(
+                total, CONF.db.options))
+            return
         elk = ElasticSearchManager(mappings=mappings)
-        if CONF.db.options.lower() == 'sync':
+        if CONF.db.name == 'import':
+            elk.import_documents(CONF.db.options, CONF.db.files,
+                                 thread_count=CONF.db.threads,
+                                 chunk_size=CONF.db.chunk_size)
+        elif CONF.db.options.lower() == 'sync':
             elk.db_sync()
         elif CONF.db.options.lower() == 'update':
             elk.update_mappings()
@@ -341,6 +705,8 @@ def main():
             elk.show_mappings()
         elif CONF.db.options.lower() == 'update-settings':
             elk.update_settings()
+        elif CONF.db.options.lower() == 'reindex':
+            elk.reindex()
         else:
             raise Exception('Option {0} not found !'.format(CONF.db.options))
     except Exception as e:
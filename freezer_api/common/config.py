@@ -44,7 +44,19 @@ def api_common_opts():
                     default=9090,
                     dest='bind_port',
                     help='Port number to listen on. Default is 9090'
-                    )
+                    ),
+        cfg.StrOpt('server',
+                   default='paste',
+                   choices=['paste', 'eventlet'],
+                   help='Server used by freezer-api. "paste" serves each '
+                        'request in a thread, "eventlet" in a green thread, '
+                        'which lets a single process wait on the storage '
+                        'for many requests at once. Default is paste'),
+        cfg.IntOpt('max-concurrency',
+                   default=1000,
+                   dest='max_concurrency',
+                   help='Maximum number of requests served at once by the '
+                        'eventlet server. Default is 1000')
     ]
 
     return _COMMON
@@ -54,6 +54,10 @@ backups_mapping = {
             "index": "not_analyzed",
             "type": "string",
         },
+        "backup_set_id": {
+            "index": "not_analyzed",
+            "type": "string",
+        },
         "backup_metadata": {
             "properties": {
                 "action": {
@@ -149,6 +153,13 @@ backups_mapping = {
                 },
                 "hostname": {
                     "type": "string",
+                    # exact value, to aggregate the backups per host
+                    "fields": {
+                        "raw": {
+                            "index": "not_analyzed",
+                            "type": "string",
+                        },
+                    },
                 },
                 "level": {
                     "type": "long",
@@ -404,10 +415,45 @@ jobs_mapping = {
     }
 }
 
+retentions_mapping = {
+    "properties": {
+        "backup_name": {
+            "index": "not_analyzed",
+            "type": "string"
+        },
+        "container": {
+            "index": "not_analyzed",
+            "type": "string"
+        },
+        "description": {
+            "type": "string"
+        },
+        "hostname": {
+            "index": "not_analyzed",
+            "type": "string"
+        },
+        "keep_days": {
+            "type": "long"
+        },
+        "keep_last": {
+            "type": "long"
+        },
+        "retention_id": {
+            "index": "not_analyzed",
+            "type": "string"
+        },
+        "user_id": {
+            "index": "not_analyzed",
+            "type": "string"
+        }
+    }
+}
+
 
 def get_mappings():
     return {
         "jobs": jobs_mapping,
         "backups": backups_mapping,
-        "clients": clients_mapping
+        "clients": clients_mapping,
+        "retentions": retentions_mapping
     }
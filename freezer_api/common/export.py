@@ -0,0 +1,64 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Export of the documents as newline delimited JSON (NDJSON), one document
+per line. The documents are serialized lazily as they are read from the
+storage, a batch of lines at a time, so that an export of any size is
+streamed with a bounded memory usage. The exports are read back the same
+way, a line at a time.
+"""
+
+import json
+
+from freezer_api.common import exceptions as freezer_api_exc
+
+# types of the documents that can be exported
+DOC_TYPES = ['backups', 'clients', 'jobs', 'actions', 'sessions',
+             'retentions']
+
+# lines serialized in each chunk written to the output
+BATCH_SIZE = 100
+
+
+def iter_ndjson(docs, batch_size=BATCH_SIZE):
+    """
+    Yields the documents serialized as NDJSON, in utf-8 encoded chunks of
+    batch_size lines
+    """
+    lines = []
+    for doc in docs:
+        lines.append(json.dumps(doc, sort_keys=True))
+        if len(lines) >= batch_size:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def read_ndjson(lines):
+    """
+    Yields the documents of the lines of an NDJSON export, skipping the
+    blank lines
+    """
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            raise freezer_api_exc.BadDataFormat(
+                'Malformed JSON on line {0}'.format(number))
@@ -419,3 +419,64 @@ session_patch_schema = {
     },
     "additionalProperties": True
 }
+
+retention_properties = {
+    "retention_id": {
+        "id": "retention_id",
+        "pattern": "^[\w-]+$",
+        "type": "string"
+    },
+    "user_id": {
+        "id": "user_id",
+        "pattern": "^[\w-]+$",
+        "type": "string"
+    },
+    "description": {
+        "id": "description",
+        "type": "string"
+    },
+    "container": {
+        "id": "container",
+        "type": "string"
+    },
+    "hostname": {
+        "id": "hostname",
+        "type": "string"
+    },
+    "backup_name": {
+        "id": "backup_name",
+        "type": "string"
+    },
+    "keep_last": {
+        "id": "keep_last",
+        "type": "integer",
+        "minimum": 1
+    },
+    "keep_days": {
+        "id": "keep_days",
+        "type": "integer",
+        "minimum": 1
+    },
+}
+
+retention_schema = {
+    "id": "/",
+    "type": "object",
+    "properties": retention_properties,
+    "additionalProperties": True,
+    "required": [
+        "retention_id",
+        "user_id"
+    ],
+    "anyOf": [
+        {"required": ["keep_last"]},
+        {"required": ["keep_days"]}
+    ]
+}
+
+retention_patch_schema = {
+    "id": "/",
+    "type": "object",
+    "properties": retention_properties,
+    "additionalProperties": True
+}
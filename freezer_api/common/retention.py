@@ -0,0 +1,159 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Retention of the backup metadata.
+
+A retention rule of a user applies to the backup sets matching its
+container, hostname and backup_name (a missing field matches any value).
+The backups of a set are grouped in chains, each made of a level 0 backup
+and the incremental backups following it. keep_last keeps the most recent
+chains, keep_days the chains holding a backup newer than that. A chain is
+expired when none of the rules matching its set keeps it: the backups of
+the sets matched by no rule are never expired, and a chain is removed as
+a whole, so an incremental backup never outlives its level 0 backup.
+"""
+
+import itertools
+import time
+
+DAY = 24 * 3600
+
+BACKUP_SET_FIELDS = ['container', 'hostname', 'backup_name']
+
+# fields of the backups read to apply the rules
+BACKUP_FIELDS = ['backup_id',
+                 'backup_metadata.container',
+                 'backup_metadata.hostname',
+                 'backup_metadata.backup_name',
+                 'backup_metadata.timestamp',
+                 'backup_metadata.time_stamp',
+                 'backup_metadata.curr_backup_level']
+
+
+def get_backup_time(backup):
+    metadata = backup.get('backup_metadata') or {}
+    for name in ['timestamp', 'time_stamp']:
+        try:
+            return int(metadata[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return 0
+
+
+def get_backup_level(backup):
+    metadata = backup.get('backup_metadata') or {}
+    try:
+        return int(metadata.get('curr_backup_level') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_backup_set(backup):
+    metadata = backup.get('backup_metadata') or {}
+    return tuple(metadata.get(name) or '' for name in BACKUP_SET_FIELDS)
+
+
+def matches(retention, backup):
+    metadata = backup.get('backup_metadata') or {}
+    return all(retention.get(name) in (None, metadata.get(name))
+               for name in BACKUP_SET_FIELDS)
+
+
+def get_chains(backups):
+    """
+    Groups the backups of a set in chains starting at a level 0 backup
+
+    :return: list of the chains, oldest first, each chain being the list
+             of its backups in time order
+    """
+    chains = []
+    for backup in sorted(backups, key=lambda b: (get_backup_time(b),
+                                                 get_backup_level(b))):
+        if not chains or get_backup_level(backup) == 0:
+            chains.append([])
+        chains[-1].append(backup)
+    return chains
+
+
+def get_kept_chains(retention, chains, now):
+    """
+    :return: set of the indexes of the chains kept by the rule
+    """
+    kept = set()
+    keep_last = retention.get('keep_last')
+    if keep_last:
+        kept.update(range(max(len(chains) - keep_last, 0), len(chains)))
+    keep_days = retention.get('keep_days')
+    if keep_days:
+        oldest = now - keep_days * DAY
+        kept.update(i for i, chain in enumerate(chains)
+                    if get_backup_time(chain[-1]) >= oldest)
+    return kept
+
+
+def get_expired_backups(retentions, backups, now=None):
+    """
+    Applies the retention rules of a user to the backups of the user
+
+    :return: sorted list of the ids of the expired backups
+    """
+    now = time.time() if now is None else now
+    expired = []
+    backups = sorted(backups, key=get_backup_set)
+    for _, backup_set in itertools.groupby(backups, key=get_backup_set):
+        backup_set = list(backup_set)
+        rules = [r for r in retentions if matches(r, backup_set[0])]
+        if not rules:
+            continue
+        chains = get_chains(backup_set)
+        kept = set()
+        for rule in rules:
+            kept.update(get_kept_chains(rule, chains, now))
+        for i, chain in enumerate(chains):
+            if i not in kept:
+                expired.extend(backup['backup_id'] for backup in chain)
+    return sorted(expired)
+
+
+def get_user_backups(db, user_id, page_size=500):
+    """
+    Pages through all the backups of the user, reading the fields used by
+    the retention rules only
+    """
+    after = None
+    while True:
+        page = db.get_backup(user_id, limit=page_size, after=after,
+                             fields=BACKUP_FIELDS)
+        for backup in page:
+            yield backup
+        if len(page) < page_size:
+            return
+        after = page[-1]['backup_id']
+
+
+def iter_expired_backups(db, batch_size=500, now=None):
+    """
+    Yields (user_id, backup_ids) tuples with at most batch_size of the
+    expired backups of a user, for all the users having retention rules
+    """
+    user_retentions = {}
+    for retention in db.scan_retentions():
+        user_retentions.setdefault(retention['user_id'], []).append(retention)
+    for user_id in sorted(user_retentions):
+        expired = get_expired_backups(user_retentions[user_id],
+                                      get_user_backups(db, user_id),
+                                      now=now)
+        for start in range(0, len(expired), batch_size):
+            yield user_id, expired[start:start + batch_size]
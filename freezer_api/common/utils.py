@@ -42,6 +42,7 @@ class BackupMetadataDoc:
 
     def serialize(self):
         return {'backup_id': self.backup_id,
+                'backup_set_id': self.backup_set_id,
                 'backup_uuid': self.backup_uuid,
                 'user_id': self.user_id,
                 'user_name': self.user_name,
@@ -220,3 +221,50 @@ class SessionDoc:
         })
         SessionDoc.validate(doc)
         return doc
+
+
+class RetentionDoc:
+    retention_doc_validator = jsonschema.Draft4Validator(
+        schema=json_schemas.retention_schema)
+    retention_patch_validator = jsonschema.Draft4Validator(
+        schema=json_schemas.retention_patch_schema)
+
+    @staticmethod
+    def validate(doc):
+        try:
+            RetentionDoc.retention_doc_validator.validate(doc)
+        except Exception as e:
+            raise freezer_api_exc.BadDataFormat(str(e).splitlines()[0])
+
+    @staticmethod
+    def validate_patch(doc):
+        try:
+            RetentionDoc.retention_patch_validator.validate(doc)
+        except Exception as e:
+            raise freezer_api_exc.BadDataFormat(str(e).splitlines()[0])
+
+    @staticmethod
+    def create_patch(doc):
+        # changes in user_id or retention_id are not allowed
+        doc.pop('user_id', None)
+        doc.pop('retention_id', None)
+        RetentionDoc.validate_patch(doc)
+        return doc
+
+    @staticmethod
+    def create(doc, user_id):
+        doc.update({
+            'user_id': user_id,
+            'retention_id': uuid.uuid4().hex,
+        })
+        RetentionDoc.validate(doc)
+        return doc
+
+    @staticmethod
+    def update(doc, user_id, retention_id):
+        doc.update({
+            'user_id': user_id,
+            'retention_id': retention_id,
+        })
+        RetentionDoc.validate(doc)
+        return doc
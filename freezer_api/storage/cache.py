@@ -0,0 +1,170 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+In-process read-through cache of the documents of a type manager.
+
+Only the writes made through this process invalidate the cached
+documents: changes made by other api processes are seen once the cached
+copy expires, after cache_ttl seconds.
+"""
+
+import collections
+import copy
+import threading
+import time
+
+from freezer_api.common import metrics
+
+# minimum version of a deleted document: no read can bring it back
+DELETED = float('inf')
+
+
+class DocumentCache(object):
+    """
+    LRU cache of documents keyed by (user_id, doc_id), whose entries
+    expire after ttl seconds.
+
+    Each entry holds the _version of the document. An invalidation leaves
+    the version written in place of the document, so that a read started
+    before the write can not put the older version back in the cache.
+    """
+
+    def __init__(self, name, size, ttl):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (expiry time, version, doc or None)
+        self.entries = collections.OrderedDict()
+
+    def incr(self, counter):
+        metrics.incr('{0}_cache_{1}'.format(self.name, counter))
+
+    def get(self, user_id, doc_id):
+        key = (user_id, doc_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self.entries[key]
+                entry = None
+            if entry is None or entry[2] is None:
+                doc = None
+            else:
+                # most recently used entries are at the end
+                del self.entries[key]
+                self.entries[key] = entry
+                doc = copy.deepcopy(entry[2])
+        self.incr('misses' if doc is None else 'hits')
+        return doc
+
+    def set(self, key, version, doc):
+        evicted = 0
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] >= time.time() and \
+                    entry[1] > version:
+                self.entries[key] = entry
+                return
+            self.entries[key] = (time.time() + self.ttl, version, doc)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self.incr('evictions')
+
+    def put(self, user_id, doc_id, doc):
+        """
+        Caches a document read from the storage, unless a newer version
+        was written meanwhile
+        """
+        self.set((user_id, doc_id), doc.get('_version', 0),
+                 copy.deepcopy(doc))
+
+    def invalidate(self, user_id, doc_id, version=DELETED):
+        """
+        Drops the cached document after a write of the given version
+        """
+        self.set((user_id, doc_id), version, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class CachedTypeManager(object):
+    """
+    Type manager serving the reads of whole documents from a cache, which
+    its writes invalidate. The other calls go to the wrapped manager.
+    """
+
+    def __init__(self, manager, size, ttl):
+        self.manager = manager
+        self.cache = DocumentCache(manager.doc_type, size, ttl)
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def get(self, user_id, doc_id, fields=None):
+        if fields:
+            return self.manager.get(user_id, doc_id, fields=fields)
+        doc = self.cache.get(user_id, doc_id)
+        if doc is None:
+            doc = self.manager.get(user_id, doc_id)
+            self.cache.put(user_id, doc_id, doc)
+        return doc
+
+    def insert(self, doc, doc_id=None, refresh=None, op_type=None):
+        res = self.manager.insert(doc, doc_id, refresh=refresh,
+                                  op_type=op_type)
+        if doc_id is not None:
+            self.cache.invalidate(doc.get('user_id'), doc_id, res[1])
+        return res
+
+    def bulk_insert(self, docs, refresh=None, op_type='index'):
+        docs = list(docs)
+        results = self.manager.bulk_insert(docs, refresh=refresh,
+                                           op_type=op_type)
+        for (doc_id, doc), (ok, item) in zip(docs, results):
+            if doc_id is not None and ok:
+                self.cache.invalidate(doc.get('user_id'), doc_id,
+                                      item.get('_version', DELETED))
+        return results
+
+    def update(self, user_id, doc_id, update_doc, refresh=None,
+               version=None):
+        try:
+            new_version = self.manager.update(user_id, doc_id, update_doc,
+                                              refresh=refresh,
+                                              version=version)
+        except Exception:
+            self.cache.invalidate(user_id, doc_id)
+            raise
+        self.cache.invalidate(user_id, doc_id, new_version)
+        return new_version
+
+    def replace(self, user_id, doc_id, doc, refresh=None):
+        try:
+            res = self.manager.replace(user_id, doc_id, doc, refresh=refresh)
+        except Exception:
+            self.cache.invalidate(user_id, doc_id)
+            raise
+        self.cache.invalidate(user_id, doc_id, res[1])
+        return res
+
+    def delete(self, user_id, doc_id, refresh=None):
+        try:
+            return self.manager.delete(user_id, doc_id, refresh=refresh)
+        finally:
+            self.cache.invalidate(user_id, doc_id)
@@ -22,15 +22,29 @@ from oslo_config import cfg
 
 from freezer_api.common import _i18n
 from freezer_api.storage import elastic
+from freezer_api.storage import logfile
+from freezer_api.storage import memory
+from freezer_api.storage import sqlite
 
 CONF = cfg.CONF
 
+# options used only by one of the engines storing the documents locally
+ENGINE_OPTS = {
+    'sqlite': ['sqlite_path'],
+    'logfile': ['logfile_path', 'logfile_sync', 'logfile_compact_after'],
+}
+
 
 def get_elk_opts():
     storage_opts = [
         cfg.StrOpt('db',
                    default='elasticsearch',
-                   help='specify the storage db to use (default: elasticsearch'),
+                   help='specify the storage db to use: elasticsearch '
+                        '(default), sqlite, which keeps the documents in the '
+                        'database file set by sqlite_path, logfile, which '
+                        'serves them from memory and logs the changes in '
+                        'logfile_path, or memory, which keeps them in the '
+                        'api process and loses them when it stops'),
         # use of 'endpoint' parameter name is deprecated, please use 'hosts'
         cfg.StrOpt('endpoint',
                    default='',
@@ -56,10 +70,89 @@ def get_elk_opts():
         cfg.StrOpt('ca_certs',
                    default=None,
                    help='path to CA certs on disk'),
+        cfg.IntOpt('connection_pool_maxsize',
+                   default=10,
+                   help='number of http connections kept open to each '
+                        'elasticsearch node'),
+        cfg.BoolOpt('keep_alive',
+                    default=True,
+                    help='reuse the http connections to elasticsearch '
+                         'across requests'),
+        cfg.BoolOpt('http_compress',
+                    default=False,
+                    help='ask elasticsearch for gzip compressed responses'),
+        cfg.BoolOpt('sniff_on_start',
+                    default=False,
+                    help='discover the nodes of the elasticsearch cluster '
+                         'when the api starts, and spread the requests '
+                         'across all of them'),
+        cfg.BoolOpt('sniff_on_connection_fail',
+                    default=False,
+                    help='discover the nodes of the elasticsearch cluster '
+                         'again when a node fails'),
+        cfg.IntOpt('sniffer_timeout',
+                   default=0,
+                   help='seconds between two discoveries of the nodes of '
+                        'the elasticsearch cluster. Use 0 to disable them'),
+        cfg.IntOpt('dead_timeout',
+                   default=60,
+                   help='seconds a failed elasticsearch node is left out '
+                        'before being tried again, doubled on each '
+                        'consecutive failure'),
+        cfg.IntOpt('cache_size',
+                   default=0,
+                   help='number of jobs, and of actions, kept in the cache '
+                        'of each api process. Use 0 to disable the cache'),
+        cfg.IntOpt('cache_ttl',
+                   default=30,
+                   help='seconds a cached job or action is used before '
+                        'being read again. Changes made through other api '
+                        'processes are seen after this delay'),
         cfg.IntOpt('number_of_replicas',
                    default=2,
                    help='Number of replicas for elk cluster. Default is 2. '
-                        'Use 0 for no replicas')
+                        'Use 0 for no replicas'),
+        cfg.StrOpt('refresh_policy',
+                   default='immediate',
+                   choices=['immediate', 'wait_for', 'none'],
+                   help='When written documents become visible to searches. '
+                        '"immediate" refreshes the shards touched by each '
+                        'write, "wait_for" waits for the next scheduled '
+                        'refresh, "none" does not wait for any refresh. '
+                        'Before Elasticsearch 5.0, "wait_for" behaves like '
+                        '"immediate"'),
+        cfg.StrOpt('backup_index_interval',
+                   default='none',
+                   choices=['none', 'month'],
+                   help='How the backups are spread over elasticsearch '
+                        'indices. "none" keeps them in the main index, '
+                        '"month" writes them to an index per month of their '
+                        'timestamp, read through the <index>_backups alias. '
+                        'Run freezer-manage db sync after changing it'),
+        cfg.StrOpt('routing',
+                   default='none',
+                   choices=['none', 'user_id'],
+                   help='Shard routing of the elasticsearch documents. '
+                        '"user_id" stores all the documents of a user on one '
+                        'shard, so that the reads of a user only query that '
+                        'shard. Run freezer-manage db reindex after changing '
+                        'it'),
+        cfg.StrOpt('sqlite_path',
+                   default='/var/lib/freezer/freezer-api.db',
+                   help='path of the database file used by the sqlite db'),
+        cfg.StrOpt('logfile_path',
+                   default='/var/lib/freezer/freezer-api',
+                   help='directory of the log and snapshot files used by '
+                        'the logfile db'),
+        cfg.BoolOpt('logfile_sync',
+                    default=True,
+                    help='flush each change of the logfile db to disk '
+                         'before answering the request'),
+        cfg.IntOpt('logfile_compact_after',
+                   default=10000,
+                   help='number of changes after which the logfile db '
+                        'writes a snapshot and empties its log. Use 0 to '
+                        'compact only at startup')
     ]
     return storage_opts
 
@@ -91,9 +184,22 @@ def get_options():
 def get_db():
     opts = get_options()
     db_engine = opts.pop('db')
+    engine_opts = {}
+    for engine, names in ENGINE_OPTS.items():
+        for name in names:
+            if name in opts:
+                value = opts.pop(name)
+                if engine == db_engine:
+                    engine_opts[name] = value
     if db_engine == 'elasticsearch':
         logging.debug(_i18n._LI('Elastichsearch config options: %s') % str(opts))
         db = elastic.ElasticSearchEngine(**opts)
+    elif db_engine == 'memory':
+        db = memory.MemoryEngine(**opts)
+    elif db_engine == 'sqlite':
+        db = sqlite.SqliteEngine(**dict(opts, **engine_opts))
+    elif db_engine == 'logfile':
+        db = logfile.LogFileEngine(**dict(opts, **engine_opts))
     else:
         raise Exception(_i18n._('Database Engine %s not supported') % db_engine)
     return db
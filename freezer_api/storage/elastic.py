@@ -15,10 +15,15 @@ limitations under the License.
 
 """
 
+import datetime
 import elasticsearch
+from elasticsearch import connection as es_connection
 from elasticsearch import helpers as es_helpers
 
 import logging
+import os
+import threading
+import time
 import uuid
 
 from freezer_api.common import _i18n
@@ -26,42 +31,297 @@ from freezer_api.common import exceptions as freezer_api_exc
 from freezer_api.common.utils import ActionDoc
 from freezer_api.common.utils import BackupMetadataDoc
 from freezer_api.common.utils import JobDoc
+from freezer_api.common.utils import RetentionDoc
 from freezer_api.common.utils import SessionDoc
+from freezer_api.storage import cache
+from freezer_api.storage import query
+
+
+REFRESH_IMMEDIATE = 'immediate'
+REFRESH_WAIT_FOR = 'wait_for'
+REFRESH_NONE = 'none'
+REFRESH_POLICIES = [REFRESH_IMMEDIATE, REFRESH_WAIT_FOR, REFRESH_NONE]
+
+BULK_CHUNK_SIZE = 500
+# documents read by each scroll request of an export, per shard
+EXPORT_SIZE = 100
+
+# fields identifying a backup set, as in BackupMetadataDoc.backup_set_id,
+# with the not_analyzed field holding their value
+BACKUP_SET_FIELDS = [('container', 'backup_metadata.container'),
+                     ('hostname', 'backup_metadata.hostname.raw'),
+                     ('backup_name', 'backup_metadata.backup_name')]
+# sizes summed over the backups of a set
+BACKUP_SIZE_FIELDS = ['backup_size_compressed', 'backup_size_uncompressed',
+                      'total_backup_session_size']
+
+# how the backups are spread over indices: all in the main index, or in
+# an index per month behind an alias
+BACKUP_INDEX_NONE = 'none'
+BACKUP_INDEX_MONTHLY = 'month'
+BACKUP_INDEX_INTERVALS = [BACKUP_INDEX_NONE, BACKUP_INDEX_MONTHLY]
+
+# shard routing of the documents: by document id, or all the documents of
+# a user on the same shard
+ROUTING_NONE = 'none'
+ROUTING_USER_ID = 'user_id'
+ROUTINGS = [ROUTING_NONE, ROUTING_USER_ID]
+
+# Groovy scripts used to check the owner of a document and modify it within
+# the same update request. Documents of other users are left untouched
+# (ctx.op = 'none'); the owner returned with the response tells them apart.
+OWNED_UPDATE_SCRIPT = (
+    "if (ctx._source.user_id != user_id) { ctx.op = 'none' } else { "
+    "def merge; merge = { dst, src -> src.each { k, v -> "
+    "if (v instanceof Map && dst[k] instanceof Map) { merge(dst[k], v) } "
+    "else { dst[k] = v } } }; "
+    "merge(ctx._source, doc) }")
+OWNED_REPLACE_SCRIPT = (
+    "if (ctx._source.user_id != user_id) { ctx.op = 'none' } "
+    "else { ctx._source = doc }")
+
+
+class HttpConnection(es_connection.Urllib3HttpConnection):
+    """
+    Connection to an elasticsearch node which can close the http
+    connection after each request and ask for compressed responses
+    """
+
+    def __init__(self, keep_alive=True, http_compress=False, **kwargs):
+        es_connection.Urllib3HttpConnection.__init__(self, **kwargs)
+        if not keep_alive:
+            self.headers['connection'] = 'close'
+        if http_compress:
+            self.headers['accept-encoding'] = 'gzip,deflate'
+
+
+def get_client_options(connection_pool_maxsize=10, keep_alive=True,
+                       http_compress=False, sniffer_timeout=0, retries=None,
+                       **kwargs):
+    """
+    :return: the arguments of the elasticsearch client for the given
+             storage options
+    """
+    kwargs.update(connection_class=HttpConnection,
+                  maxsize=connection_pool_maxsize,
+                  keep_alive=keep_alive,
+                  http_compress=http_compress,
+                  sniffer_timeout=sniffer_timeout or None)
+    if retries is not None:
+        kwargs['max_retries'] = retries
+    return kwargs
+
+
+class ClientProxy(object):
+    """
+    Elasticsearch client created on first use in each process. A client
+    inherited through fork would share its connections with the parent
+    process, and the sniffed nodes would be those seen by the parent.
+    """
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self.pid = None
+        self.client = None
+
+    def get_client(self):
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.client = elasticsearch.Elasticsearch(**self.kwargs)
+                    self.pid = os.getpid()
+        return self.client
+
+    def __getattr__(self, name):
+        return getattr(self.get_client(), name)
+
+
+def unique(values):
+    """
+    :return: list of the values without duplicates, in the same order
+    """
+    seen = set()
+    return [v for v in values if not (v in seen or seen.add(v))]
+
+
+def get_backup_alias(index):
+    """
+    :return: name of the alias reading the monthly indices of the backups
+    """
+    return '{0}_backups'.format(index)
+
+
+def get_backup_timestamp(doc):
+    try:
+        return int(doc['backup_metadata']['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def get_month(timestamp):
+    """
+    :return: (year, month) tuple of the timestamp, None when out of range
+    """
+    try:
+        date = datetime.datetime.utcfromtimestamp(timestamp)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    return date.year, date.month
+
+
+def get_backup_partition(index, month=None):
+    """
+    :param month: (year, month) tuple, None for the backups without
+                  timestamp
+    :return: name of the index holding the backups of the month
+    """
+    if month is None:
+        return '{0}-undated'.format(get_backup_alias(index))
+    return '{0}-{1:04d}.{2:02d}'.format(get_backup_alias(index), *month)
+
+
+def get_backup_template(index, mapping, number_of_replicas):
+    """
+    :return: index template applied to the monthly indices of the backups
+             when they are created by their first write
+    """
+    return {'template': get_backup_alias(index) + '-*',
+            'settings': {'number_of_replicas': number_of_replicas},
+            'mappings': {'backups': mapping},
+            'aliases': {get_backup_alias(index): {}}}
+
+
+def sort_backup_stats(stats):
+    return sorted(stats, key=lambda backup_set: [
+        backup_set[name] for name, _ in BACKUP_SET_FIELDS])
 
 
 class TypeManager:
-    def __init__(self, es, doc_type, index):
+    # unique (per user) field used to sort search results and to resume
+    # a paginated search after a given document
+    sort_field = None
+    # whether the sort field is only unique per user, the user id is then
+    # part of the document ids
+    ids_per_user = False
+
+    def __init__(self, es, doc_type, index, refresh_policy=REFRESH_IMMEDIATE,
+                 routing=ROUTING_NONE):
         self.es = es
         self.index = index
         self.doc_type = doc_type
-
-    @staticmethod
-    def get_base_search_filter(user_id, search=None):
-        search = search or {}
-        user_id_filter = {"term": {"user_id": user_id}}
-        base_filter = [user_id_filter]
-        match_list = [{"match": m} for m in search.get('match', [])]
-        match_not_list = [{"match": m} for m in search.get('match_not', [])]
-        base_filter.append({"query": {"bool": {"must": match_list,
-                                               "must_not": match_not_list}}})
-        return base_filter
-
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
+        self.refresh_policy = refresh_policy
+        self.routing = routing
+        # cleared when the cluster does not allow dynamic scripts
+        self.scripted_writes = True
+        self.query_builder = query.QueryBuilder.for_doc_type(
+            doc_type, self.sort_field)
+
+    def get_refresh_param(self, refresh=None):
+        """
+        Returns the refresh argument to pass along with a write request.
+        'immediate' refreshes only the shards touched by the request,
+        'wait_for' is sent as is (ES < 5.0 handles it as 'immediate')
+        and 'none' relies on the periodic index refresh.
+
+        :param refresh: per-request override of the configured policy
+        :return: dict of keyword arguments for the write request
+        """
+        policy = refresh or self.refresh_policy
+        if policy == REFRESH_IMMEDIATE:
+            return {'refresh': True}
+        if policy == REFRESH_WAIT_FOR:
+            return {'refresh': REFRESH_WAIT_FOR}
+        if policy == REFRESH_NONE:
+            return {}
+        raise freezer_api_exc.StorageEngineError(
+            message=_i18n._('Unknown refresh policy %s') % policy)
+
+    def get_search_filters(self, search):
+        """
+        :return: additional filters derived from the search parameters
+        """
+        return []
+
+    def get_read_target(self, search=None):
+        """
+        :return: keyword arguments of the read requests selecting the
+                 indices that may hold the documents matching the search
+        """
+        return {'index': self.index}
+
+    def get_write_index(self, doc):
+        """
+        :return: name of the index the document is written to
+        """
+        return self.index
+
+    def get_routing(self, user_id):
+        """
+        :return: keyword arguments sending a request on the documents of
+                 the user to their shard only, when they are routed by user
+        """
+        if self.routing == ROUTING_USER_ID and user_id:
+            return {'routing': user_id}
+        return {}
+
+    def get_read_params(self, user_id, search=None):
+        """
+        :return: keyword arguments of a search on the documents of the user
+        """
+        params = self.get_read_target(search)
+        params.update(self.get_routing(user_id))
+        return params
+
+    def get_search_query(self, user_id, doc_id, search=None,
+                         all_users=False):
         search = search or {}
         try:
-            base_filter = TypeManager.get_base_search_filter(user_id, search)
-            query_filter = {"filter": {"bool": {"must": base_filter}}}
-            return {'query': {'filtered': query_filter}}
+            return self.query_builder.build(
+                user_id, doc_id, search,
+                filters=self.get_search_filters(search),
+                all_users=all_users)
         except Exception:
             raise freezer_api_exc.StorageEngineError(
                 message=_i18n._('search operation failed: query not valid'))
 
-    def get(self, user_id, doc_id):
+    def get_source_filter(self, fields=None):
+        """
+        Translates the list of fields requested by the client into _source
+        includes and excludes. Fields prefixed by '-' are excluded.
+        user_id and the sort field are always returned, they are needed
+        to check the owner and to build the pagination cursor: excluding
+        them, or a parent of them, is ignored.
+
+        :return: (includes, excludes) tuple of lists
+        """
+        required = [f for f in ['user_id', self.sort_field] if f]
+        includes, excludes = [], []
+        for field in fields or []:
+            field = field.strip()
+            if field.startswith('-'):
+                field = field[1:]
+                if field and not any(r == field or r.startswith(field + '.')
+                                     for r in required):
+                    excludes.append(field)
+            elif field and field not in includes:
+                includes.append(field)
+        if includes:
+            includes.extend([f for f in required if f not in includes])
+        return includes, excludes
+
+    def get(self, user_id, doc_id, fields=None):
+        includes, excludes = self.get_source_filter(fields)
+        params = {}
+        if includes:
+            params['_source_include'] = includes
+        if excludes:
+            params['_source_exclude'] = excludes
         try:
+            params.update(self.get_routing(user_id))
             res = self.es.get(index=self.index,
                               doc_type=self.doc_type,
-                              id=doc_id)
+                              id=doc_id, **params)
             doc = res['_source']
         except elasticsearch.TransportError:
             raise freezer_api_exc.DocumentNotFound(
@@ -76,12 +336,96 @@ class TypeManager:
             doc['_version'] = res['_version']
         return doc
 
-    def search(self, user_id, doc_id=None, search=None, offset=0, limit=10):
+    def mget(self, user_id, doc_ids, fields=None):
+        """
+        Gets many documents of the user with a single request. The ids
+        not found, or of documents owned by other users, are left out.
+
+        :return: list of the documents, in the order of doc_ids
+        """
+        doc_ids = unique(doc_ids)
+        if not doc_ids:
+            return []
+        includes, excludes = self.get_source_filter(fields)
+        params = {}
+        if includes:
+            params['_source_include'] = includes
+        if excludes:
+            params['_source_exclude'] = excludes
+        routing = self.get_routing(user_id).get('routing')
+        if routing:
+            body = {'docs': [{'_id': doc_id, '_routing': routing}
+                             for doc_id in doc_ids]}
+        else:
+            body = {'ids': doc_ids}
+        try:
+            res = self.es.mget(index=self.index, doc_type=self.doc_type,
+                               body=body, **params)
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('mget operation failed: %s') % e)
+        return [doc['_source'] for doc in res['docs']
+                if doc.get('found') and
+                doc['_source'].get('user_id') == user_id]
+
+    def get_sort_key(self, doc):
+        value = doc
+        for name in self.sort_field.split('.'):
+            value = value.get(name) if isinstance(value, dict) else None
+        return value
+
+    def mget_by_search(self, user_id, doc_ids, fields=None):
+        """
+        Like mget, for the documents whose id is not the value of their
+        sort field: they are selected with a single terms search
+        """
+        doc_ids = unique(doc_ids)
+        if not doc_ids:
+            return []
+        query_dsl = self.get_search_query(user_id, None)
+        query.add_filter(query_dsl, {'terms': {self.sort_field: doc_ids}})
+        includes, excludes = self.get_source_filter(fields)
+        if includes or excludes:
+            query_dsl['_source'] = {'include': includes, 'exclude': excludes}
+        try:
+            res = self.es.search(doc_type=self.doc_type, size=len(doc_ids),
+                                 body=query_dsl,
+                                 **self.get_read_params(user_id))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('mget operation failed: %s') % e)
+        docs = dict((self.get_sort_key(hit['_source']), hit['_source'])
+                    for hit in res['hits']['hits'])
+        return [docs[doc_id] for doc_id in doc_ids if doc_id in docs]
+
+    def get_sorted_query(self, query_dsl, after=None):
+        """
+        Sorts the results on sort_field and, when after is given, only
+        selects the documents following it. This keeps the cost of deep
+        pages constant, unlike from/size pagination.
+        """
+        if not self.sort_field:
+            return query_dsl
+        if after is not None:
+            query.add_filter(query_dsl,
+                             {'range': {self.sort_field: {'gt': after}}})
+        query_dsl['sort'] = [{self.sort_field: {'order': 'asc'}}]
+        return query_dsl
+
+    def search(self, user_id, doc_id=None, search=None, offset=0, limit=10,
+               after=None, fields=None):
         search = search or {}
         query_dsl = self.get_search_query(user_id, doc_id, search)
+        query_dsl = self.get_sorted_query(query_dsl, after)
+        includes, excludes = self.get_source_filter(fields)
+        if includes or excludes:
+            query_dsl['_source'] = {'include': includes, 'exclude': excludes}
+        if after is not None:
+            offset = 0
         try:
-            res = self.es.search(index=self.index, doc_type=self.doc_type,
-                                 size=limit, from_=offset, body=query_dsl)
+            res = self.es.search(doc_type=self.doc_type, size=limit,
+                                 from_=offset, body=query_dsl,
+                                 **self.get_read_params(user_id, search))
         except elasticsearch.ConnectionError:
             raise freezer_api_exc.StorageEngineError(
                 message=_i18n._('unable to connect to db server'))
@@ -91,15 +435,39 @@ class TypeManager:
         hit_list = res['hits']['hits']
         return [x['_source'] for x in hit_list]
 
-    def insert(self, doc, doc_id=None):
+    def count(self, user_id, doc_id=None, search=None):
+        """
+        :return: the number of documents of the user matching the search
+        """
+        query_dsl = self.get_search_query(user_id, doc_id, search)
+        try:
+            res = self.es.count(doc_type=self.doc_type, body=query_dsl,
+                                **self.get_read_params(user_id, search))
+        except elasticsearch.ConnectionError:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('unable to connect to db server'))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('count operation failed: %s') % e)
+        return res['count']
+
+    def insert(self, doc, doc_id=None, refresh=None, op_type=None):
+        """
+        Indexes the document. With op_type 'create' the write fails with
+        DocumentExists when a document with the same id is already there.
+        """
+        params = self.get_refresh_param(refresh)
+        if op_type:
+            params['op_type'] = op_type
+        params.update(self.get_routing(doc.get('user_id')))
         try:
             # remove _version from the document
             doc.pop('_version', None)
-            res = self.es.index(index=self.index, doc_type=self.doc_type,
-                                body=doc, id=doc_id)
+            res = self.es.index(index=self.get_write_index(doc),
+                                doc_type=self.doc_type,
+                                body=doc, id=doc_id, **params)
             created = res['created']
             version = res['_version']
-            self.es.indices.refresh(index=self.index)
         except elasticsearch.TransportError as e:
             if e.status_code == 409:
                 raise freezer_api_exc.DocumentExists(message=e.error)
@@ -110,275 +478,798 @@ class TypeManager:
                 message=_i18n._('index operation failed %s') % e)
         return (created, version)
 
-    def delete(self, user_id, doc_id):
+    def owned_write(self, user_id, doc_id, script, doc, upsert=None,
+                    refresh=None, version=None):
+        """
+        Runs one of the OWNED_* scripts against the document, so that the
+        ownership check and the write take a single request.
+
+        :return: the update response, or None when dynamic scripting
+                 is disabled on the cluster
+        """
+        body = {'script': script,
+                'lang': 'groovy',
+                'params': {'user_id': user_id, 'doc': doc}}
+        if upsert is not None:
+            body['upsert'] = upsert
+        params = self.get_refresh_param(refresh)
+        if version is not None:
+            params['version'] = version
+        params.update(self.get_routing(user_id))
+        try:
+            res = self.es.update(index=self.index, doc_type=self.doc_type,
+                                 id=doc_id, body=body, fields='user_id',
+                                 **params)
+        except elasticsearch.TransportError as e:
+            if e.status_code == 400 and 'disabled' in str(e.error):
+                logging.warning(_i18n._LW('Dynamic scripting is disabled, '
+                                          'checking owner of %s documents '
+                                          'with a separate request') %
+                                self.doc_type)
+                self.scripted_writes = False
+                return None
+            raise
+        owner = res.get('get', {}).get('fields', {}).get('user_id')
+        if isinstance(owner, list):
+            owner = owner[0] if owner else None
+        if owner != user_id:
+            raise freezer_api_exc.AccessForbidden(
+                _i18n._("Document access forbidden"))
+        return res
+
+    def update(self, user_id, doc_id, update_doc, refresh=None,
+               version=None):
+        """
+        Merges update_doc into the document owned by user_id
+
+        :param version: when given, the update is only applied if the
+                        stored document still has this version, otherwise
+                        DocumentExists is raised
+        :return: the new version of the document
+        """
+        # remove _version from the document
+        update_doc.pop('_version', 0)
+        try:
+            res = None
+            if self.scripted_writes:
+                res = self.owned_write(user_id, doc_id, OWNED_UPDATE_SCRIPT,
+                                       update_doc, refresh=refresh,
+                                       version=version)
+            if res is None:
+                self.get(user_id, doc_id)
+                params = self.get_refresh_param(refresh)
+                if version is not None:
+                    params['version'] = version
+                params.update(self.get_routing(user_id))
+                res = self.es.update(index=self.index,
+                                     doc_type=self.doc_type, id=doc_id,
+                                     body={"doc": update_doc}, **params)
+            version = res['_version']
+        except freezer_api_exc.FreezerAPIException:
+            raise
+        except elasticsearch.TransportError as e:
+            if e.status_code == 409:
+                raise freezer_api_exc.DocumentExists(message=e.error)
+            raise freezer_api_exc.DocumentNotFound(
+                message=_i18n._('Unable to find document to update '
+                                'with id %(id)s. %(e)s') %
+                {'id': doc_id, 'e': e})
+        except Exception:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('Unable to update document with id %s') %
+                doc_id)
+        return version
+
+    def replace(self, user_id, doc_id, doc, refresh=None):
+        """
+        Stores doc with the given id, overwriting the existing document
+        only when it is owned by user_id
+
+        :return: (created, version) tuple
+        """
+        # remove _version from the document
+        doc.pop('_version', None)
+        try:
+            res = None
+            if self.scripted_writes:
+                res = self.owned_write(user_id, doc_id, OWNED_REPLACE_SCRIPT,
+                                       doc, upsert=doc, refresh=refresh)
+            if res is None:
+                try:
+                    self.get(user_id, doc_id)
+                except freezer_api_exc.DocumentNotFound:
+                    pass
+                return self.insert(doc, doc_id, refresh=refresh)
+            version = res['_version']
+        except freezer_api_exc.FreezerAPIException:
+            raise
+        except elasticsearch.TransportError as e:
+            if e.status_code == 409:
+                raise freezer_api_exc.DocumentExists(message=e.error)
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('replace operation failed %s') % e)
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('replace operation failed %s') % e)
+        return (res.get('created', version == 1), version)
+
+    def get_doc_id(self, doc):
+        """
+        :return: id of the document in the index
+        """
+        if self.ids_per_user:
+            return '{0}_{1}'.format(doc.get('user_id'), self.get_sort_key(doc))
+        return self.get_sort_key(doc)
+
+    def get_bulk_action(self, doc, doc_id=None, op_type='index'):
+        """
+        :return: bulk helpers action writing the document to its index
+        """
+        # remove _version from the document
+        doc.pop('_version', None)
+        action = {'_op_type': op_type,
+                  '_index': self.get_write_index(doc),
+                  '_type': self.doc_type,
+                  '_source': doc}
+        if doc_id is not None:
+            action['_id'] = doc_id
+        routing = self.get_routing(doc.get('user_id'))
+        if routing:
+            action['_routing'] = routing['routing']
+        return action
+
+    def bulk_insert(self, docs, refresh=None, op_type='index'):
+        """
+        Writes many documents using bulk requests
+
+        :param docs: list of (doc_id, doc) tuples, doc_id can be None
+        :param op_type: 'index' or 'create' to reject existing ids
+        :return: list of (success, item) tuples in the same order as docs,
+                 item being the bulk response entry of the document
+        """
+        refresh_param = self.get_refresh_param(refresh)
+        actions = [self.get_bulk_action(doc, doc_id, op_type=op_type)
+                   for doc_id, doc in docs]
+        try:
+            results = es_helpers.streaming_bulk(self.es, actions,
+                                                chunk_size=BULK_CHUNK_SIZE,
+                                                raise_on_error=False,
+                                                raise_on_exception=False,
+                                                **refresh_param)
+            return [(ok, list(item.values())[0]) for ok, item in results]
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('bulk operation failed %s') % e)
+
+    def delete(self, user_id, doc_id, refresh=None):
+        """
+        Deletes all the documents of the user matching doc_id using a
+        single bulk request, so that the index is refreshed at most once.
+
+        :return: the number of deleted documents
+        """
         query_dsl = self.get_search_query(user_id, doc_id)
+        return self.delete_by_query(user_id, query_dsl, refresh=refresh)
+
+    def mdelete(self, user_id, doc_ids, refresh=None):
+        """
+        Deletes the documents of the user with the given ids (values of
+        the sort field) using a single bulk request
+
+        :return: the number of deleted documents
+        """
+        doc_ids = unique(doc_ids)
+        if not doc_ids:
+            return 0
+        query_dsl = self.get_search_query(user_id, None)
+        query.add_filter(query_dsl, {'terms': {self.sort_field: doc_ids}})
+        return self.delete_by_query(user_id, query_dsl, refresh=refresh)
+
+    def export(self, user_id, search=None, fields=None):
+        """
+        Yields all the documents of the user matching the search, read
+        with a scroll a batch at a time, in no particular order
+        """
+        query_dsl = self.get_search_query(user_id, None, search)
+        return self.scroll(query_dsl, fields,
+                           **self.get_read_params(user_id, search))
+
+    def export_all(self, search=None, fields=None):
+        """
+        Like export, for the documents of all the users
+        """
+        query_dsl = self.get_search_query(None, None, search, all_users=True)
+        return self.scroll(query_dsl, fields, **self.get_read_target(search))
+
+    def scroll(self, query_dsl, fields=None, **params):
+        includes, excludes = self.get_source_filter(fields)
+        if includes or excludes:
+            query_dsl['_source'] = {'include': includes, 'exclude': excludes}
         try:
-            results = es_helpers.scan(self.es, index=self.index,
-                                      doc_type=self.doc_type, query=query_dsl)
+            for hit in es_helpers.scan(self.es, doc_type=self.doc_type,
+                                       query=query_dsl, size=EXPORT_SIZE,
+                                       **params):
+                yield hit['_source']
         except Exception as e:
             raise freezer_api_exc.StorageEngineError(
                 message=_i18n._('Scan operation failed: %s') % e)
-        id = None
-        for res in results:
-            id = res.get('_id')
-            try:
-                self.es.delete(index=self.index, doc_type=self.doc_type, id=id)
-                self.es.indices.refresh(index=self.index)
-            except Exception as e:
-                raise freezer_api_exc.StorageEngineError(
-                    message=_i18n._('Delete operation failed: %s') % e)
-        return id
+
+    def delete_by_query(self, user_id, query_dsl, refresh=None):
+        """
+        Deletes the documents of the user selected by the query
+        """
+        refresh_param = self.get_refresh_param(refresh)
+        query_dsl['_source'] = False
+        try:
+            read_params = self.get_read_params(user_id)
+            results = es_helpers.scan(self.es, doc_type=self.doc_type,
+                                      query=query_dsl, **read_params)
+            actions = [{'_op_type': 'delete',
+                        '_index': res.get('_index', self.index),
+                        '_type': self.doc_type,
+                        '_id': res.get('_id')} for res in results]
+            if 'routing' in read_params:
+                for action in actions:
+                    action['_routing'] = read_params['routing']
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('Scan operation failed: %s') % e)
+        if not actions:
+            return 0
+        try:
+            deleted, errors = es_helpers.bulk(self.es, actions,
+                                              chunk_size=len(actions),
+                                              raise_on_error=False,
+                                              **refresh_param)
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('Delete operation failed: %s') % e)
+        # documents removed in the meantime are not an error
+        errors = [e for e in errors
+                  if e.get('delete', {}).get('status') != 404]
+        if errors:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('Delete operation failed: %s') % errors)
+        return deleted
 
 
 class BackupTypeManager(TypeManager):
-    def __init__(self, es, doc_type, index='freezer'):
-        TypeManager.__init__(self, es, doc_type, index=index)
+    sort_field = 'backup_id'
+    ids_per_user = True
+
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
+
+    def get(self, user_id, doc_id, fields=None):
+        # the ids of the backup documents are not the backup ids (and are
+        # random for the older ones)
+        docs = self.search(user_id, doc_id, limit=1, fields=fields)
+        if not docs:
+            raise freezer_api_exc.DocumentNotFound(
+                message=_i18n._('No document found with ID %s') % doc_id)
+        return docs[0]
 
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
-        search = search or {}
-        base_filter = TypeManager.get_base_search_filter(user_id, search)
-        if doc_id is not None:
-            base_filter.append({"term": {"backup_id": doc_id}})
+    def mget(self, user_id, doc_ids, fields=None):
+        return self.mget_by_search(user_id, doc_ids, fields=fields)
 
+    def get_search_filters(self, search):
+        search_filters = []
         if 'time_after' in search:
-            base_filter.append(
+            search_filters.append(
                 {"range": {"timestamp": {"gte": int(search['time_after'])}}}
             )
 
         if 'time_before' in search:
-            base_filter.append(
+            search_filters.append(
                 {"range": {"timestamp": {"lte": int(search['time_before'])}}}
             )
-        query_filter = {"filter": {"bool": {"must": base_filter}}}
-        return {'query': {'filtered': query_filter}}
+        return search_filters
+
+    def get_stats_aggregations(self):
+        """
+        Nested terms aggregations grouping the backups by backup set, with
+        the metrics of each set
+        """
+        metrics = {'latest_timestamp': {
+            'max': {'field': 'backup_metadata.timestamp'}}}
+        for field in BACKUP_SIZE_FIELDS:
+            metrics[field] = {'sum': {'field': 'backup_metadata.' + field}}
+        aggregations = metrics
+        for name, field in reversed(BACKUP_SET_FIELDS):
+            # size 0 returns all the buckets
+            aggregations = {name: {'terms': {'field': field, 'size': 0},
+                                   'aggs': aggregations}}
+        return aggregations
+
+    def stats(self, user_id, search=None):
+        """
+        Counts the backups of the user matching the search, per backup set
+        (container, hostname and backup_name), along with the latest
+        timestamp and the total sizes of each set. The result is computed
+        by the shards and kept in their query cache until the next refresh.
+
+        :return: list of dicts, one per backup set, sorted by set
+        """
+        query_dsl = self.get_search_query(user_id, None, search)
+        query_dsl['aggs'] = self.get_stats_aggregations()
+        try:
+            res = self.es.search(doc_type=self.doc_type, body=query_dsl,
+                                 search_type='count',
+                                 params={'query_cache': 'true'},
+                                 **self.get_read_params(user_id, search))
+        except elasticsearch.ConnectionError:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('unable to connect to db server'))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('stats operation failed: %s') % e)
+        return sort_backup_stats(self.get_stats(
+            res.get('aggregations', {}), {},
+            [name for name, _ in BACKUP_SET_FIELDS]))
+
+    def latest(self, user_id, search=None, fields=None):
+        """
+        Gets the most recent backup, by timestamp, of each backup set
+        among the backups of the user matching the search, with a terms
+        aggregation on backup_set_id keeping the top hit of each bucket.
+
+        :return: list of the backups, sorted by backup_set_id
+        """
+        query_dsl = self.get_search_query(user_id, None, search)
+        top_hits = {'size': 1,
+                    'sort': [{'backup_metadata.timestamp': {
+                        'order': 'desc', 'ignore_unmapped': True}}]}
+        includes, excludes = self.get_source_filter(fields)
+        if includes or excludes:
+            top_hits['_source'] = {'include': includes, 'exclude': excludes}
+        query_dsl['aggs'] = {'backup_sets': {
+            'terms': {'field': 'backup_set_id', 'size': 0,
+                      'order': {'_term': 'asc'}},
+            'aggs': {'latest': {'top_hits': top_hits}}}}
+        try:
+            res = self.es.search(doc_type=self.doc_type, body=query_dsl,
+                                 search_type='count',
+                                 **self.get_read_params(user_id, search))
+        except elasticsearch.ConnectionError:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('unable to connect to db server'))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('search operation failed: %s') % e)
+        buckets = res.get('aggregations', {}).get(
+            'backup_sets', {}).get('buckets', [])
+        return [bucket['latest']['hits']['hits'][0]['_source']
+                for bucket in buckets]
+
+    def get_stats(self, aggregation, backup_set, names):
+        """
+        Flattens the buckets of the nested terms aggregations
+        """
+        if not names:
+            stats = dict(backup_set)
+            stats['count'] = aggregation['doc_count']
+            latest = aggregation['latest_timestamp']['value']
+            stats['latest_timestamp'] = \
+                int(latest) if latest is not None else None
+            for field in BACKUP_SIZE_FIELDS:
+                stats[field] = int(aggregation[field]['value'] or 0)
+            return [stats]
+        results = []
+        for bucket in aggregation.get(names[0], {}).get('buckets', []):
+            backup_set[names[0]] = bucket['key']
+            results.extend(self.get_stats(bucket, backup_set, names[1:]))
+        return results
+
+
+class MonthlyBackupTypeManager(BackupTypeManager):
+    """
+    Backup type manager writing each backup to the index of the month of
+    its timestamp. The monthly indices are created by their first write,
+    from the template uploaded by freezer-manage, which also adds them to
+    the alias used for the reads. The searches on a time range only read
+    the indices of the months in the range, and the backups of a month are
+    removed by dropping its index.
+
+    A document can not be read or updated by id through an alias of many
+    indices: the backups are never updated.
+    """
+    # seconds the list of the existing monthly indices is kept
+    partitions_ttl = 300
+
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        BackupTypeManager.__init__(self, es, doc_type, index=index,
+                                   refresh_policy=refresh_policy,
+                                   routing=routing)
+        self.alias = get_backup_alias(index)
+        self.lock = threading.Lock()
+        # (expiry time, sorted months of the existing indices)
+        self.partitions = None
+
+    def get_write_index(self, doc):
+        return get_backup_partition(
+            self.index, get_month(get_backup_timestamp(doc)))
+
+    def get_partitions(self):
+        """
+        :return: sorted list of the (year, month) tuples of the existing
+                 monthly indices
+        """
+        with self.lock:
+            if self.partitions is None or self.partitions[0] < time.time():
+                try:
+                    names = self.es.indices.get_alias(name=self.alias)
+                except elasticsearch.NotFoundError:
+                    names = {}
+                prefix = self.alias + '-'
+                months = []
+                for name in names:
+                    try:
+                        year, month = name[len(prefix):].split('.')
+                        months.append((int(year), int(month)))
+                    except ValueError:
+                        continue
+                self.partitions = (time.time() + self.partitions_ttl,
+                                   sorted(months))
+            return self.partitions[1]
+
+    def get_read_target(self, search=None):
+        search = search or {}
+        if 'time_after' not in search and 'time_before' not in search:
+            return {'index': self.alias}
+        partitions = self.get_partitions()
+        # indices created since the list was read can only be recent ones,
+        # no index exists after the newest or before the oldest one
+        next_month = get_month(time.time() + 31 * 24 * 3600)
+        newest = max(partitions[-1:] + [next_month])
+        last = newest
+        if 'time_before' in search:
+            last = min(last, get_month(int(search['time_before'])) or last)
+        first = partitions[0] if partitions else last
+        if 'time_after' in search:
+            first = max(first, get_month(int(search['time_after'])) or first)
+            first = min(first, newest)
+        months = []
+        month = first
+        while month <= last:
+            months.append(month)
+            month = (month[0] + month[1] // 12, month[1] % 12 + 1)
+        # no month at all would read every index
+        indices = [get_backup_partition(self.index, month)
+                   for month in months or [first]]
+        return {'index': ','.join(indices),
+                'ignore_unavailable': True,
+                'allow_no_indices': True}
 
 
 class ClientTypeManager(TypeManager):
-    def __init__(self, es, doc_type, index='freezer'):
-        TypeManager.__init__(self, es, doc_type, index=index)
+    sort_field = 'client.client_id'
+    ids_per_user = True
 
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
-        search = search or {}
-        base_filter = TypeManager.get_base_search_filter(user_id, search)
-        if doc_id is not None:
-            base_filter.append({"term": {"client_id": doc_id}})
-        query_filter = {"filter": {"bool": {"must": base_filter}}}
-        return {'query': {'filtered': query_filter}}
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
 
+    def mget(self, user_id, doc_ids, fields=None):
+        # the ids of the client documents are not the client ids (and are
+        # random for the older ones)
+        return self.mget_by_search(user_id, doc_ids, fields=fields)
 
-class JobTypeManager(TypeManager):
-    def __init__(self, es, doc_type, index='freezer'):
-        TypeManager.__init__(self, es, doc_type, index=index)
 
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
-        search = search or {}
-        base_filter = TypeManager.get_base_search_filter(user_id, search)
-        if doc_id is not None:
-            base_filter.append({"term": {"job_id": doc_id}})
-        query_filter = {"filter": {"bool": {"must": base_filter}}}
-        return {'query': {'filtered': query_filter}}
+class JobTypeManager(TypeManager):
+    sort_field = 'job_id'
 
-    def update(self, job_id, job_update_doc):
-        # remove _version from the document
-        job_update_doc.pop('_version', 0)
-        update_doc = {"doc": job_update_doc}
-        try:
-            res = self.es.update(index=self.index, doc_type=self.doc_type,
-                                 id=job_id, body=update_doc)
-            version = res['_version']
-            self.es.indices.refresh(index=self.index)
-        except elasticsearch.TransportError as e:
-            if e.status_code == 409:
-                raise freezer_api_exc.DocumentExists(message=e.error)
-            raise freezer_api_exc.DocumentNotFound(
-                message=_i18n._('Unable to find job to update '
-                          'with id %(id)s. %(e)s') % {'id': job_id, 'e': e})
-        except Exception:
-            raise freezer_api_exc.StorageEngineError(
-                message=_i18n._('Unable to update job with id %s') % job_id)
-        return version
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
 
 
 class ActionTypeManager(TypeManager):
-    def __init__(self, es, doc_type, index='freezer'):
-        TypeManager.__init__(self, es, doc_type, index=index)
+    sort_field = 'action_id'
 
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
-        search = search or {}
-        base_filter = TypeManager.get_base_search_filter(user_id, search)
-        if doc_id is not None:
-            base_filter.append({"term": {"action_id": doc_id}})
-        query_filter = {"filter": {"bool": {"must": base_filter}}}
-        return {'query': {'filtered': query_filter}}
-
-    def update(self, action_id, action_update_doc):
-        # remove _version from the document
-        action_update_doc.pop('_version', 0)
-        update_doc = {"doc": action_update_doc}
-        try:
-            res = self.es.update(index=self.index, doc_type=self.doc_type,
-                                 id=action_id, body=update_doc)
-            version = res['_version']
-            self.es.indices.refresh(index=self.index)
-        except elasticsearch.TransportError as e:
-            if e.status_code == 409:
-                raise freezer_api_exc.DocumentExists(message=e.error)
-            raise freezer_api_exc.DocumentNotFound(
-                message=_i18n._('Unable to find action to update '
-                          'with id %s') % action_id)
-        except Exception:
-            raise freezer_api_exc.StorageEngineError(
-                message=_i18n._('Unable to update action with id %s') % action_id)
-        return version
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
 
 
 class SessionTypeManager(TypeManager):
-    def __init__(self, es, doc_type, index='freezer'):
-        TypeManager.__init__(self, es, doc_type, index=index)
-
-    @staticmethod
-    def get_search_query(user_id, doc_id, search=None):
-        search = search or {}
-        base_filter = TypeManager.get_base_search_filter(user_id, search)
-        if doc_id is not None:
-            base_filter.append({"term": {"session_id": doc_id}})
-        query_filter = {"filter": {"bool": {"must": base_filter}}}
-        return {'query': {'filtered': query_filter}}
-
-    def update(self, session_id, session_update_doc):
-        # remove _version from the document
-        session_update_doc.pop('_version', 0)
-        update_doc = {"doc": session_update_doc}
-        try:
-            res = self.es.update(index=self.index, doc_type=self.doc_type,
-                                 id=session_id, body=update_doc)
-            version = res['_version']
-            self.es.indices.refresh(index=self.index)
-        except elasticsearch.TransportError as e:
-            if e.status_code == 409:
-                raise freezer_api_exc.DocumentExists(message=e.error)
-            raise freezer_api_exc.DocumentNotFound(
-                message=_i18n._(('Unable to update session '
-                           '%s. %s') % (session_id, e)))
-
-        except Exception:
-            raise freezer_api_exc.StorageEngineError(
-                message=_i18n._('Unable to update session with id %s') % session_id)
-        return version
+    sort_field = 'session_id'
+
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
+
+
+class RetentionTypeManager(TypeManager):
+    sort_field = 'retention_id'
+
+    def __init__(self, es, doc_type, index='freezer',
+                 refresh_policy=REFRESH_IMMEDIATE, routing=ROUTING_NONE):
+        TypeManager.__init__(self, es, doc_type, index=index,
+                             refresh_policy=refresh_policy, routing=routing)
+
+
+def get_type_manager(es, doc_type, index='freezer',
+                     backup_index_interval=BACKUP_INDEX_NONE,
+                     routing=ROUTING_NONE):
+    """
+    :return: type manager of the documents of the given type
+    """
+    managers = {'clients': ClientTypeManager,
+                'jobs': JobTypeManager,
+                'actions': ActionTypeManager,
+                'sessions': SessionTypeManager,
+                'retentions': RetentionTypeManager}
+    if doc_type == 'backups':
+        if backup_index_interval == BACKUP_INDEX_MONTHLY:
+            return MonthlyBackupTypeManager(es, doc_type, index=index,
+                                            routing=routing)
+        return BackupTypeManager(es, doc_type, index=index, routing=routing)
+    if doc_type not in managers:
+        raise freezer_api_exc.BadDataFormat(
+            message=_i18n._('Unknown document type %s') % doc_type)
+    return managers[doc_type](es, doc_type, index=index, routing=routing)
 
 
 class ElasticSearchEngine(object):
 
-    def __init__(self, index='freezer', **kwargs):
+    def __init__(self, index='freezer', refresh_policy=REFRESH_IMMEDIATE,
+                 cache_size=0, cache_ttl=30,
+                 backup_index_interval=BACKUP_INDEX_NONE,
+                 routing=ROUTING_NONE, **kwargs):
         self.index = index
-        self.es = elasticsearch.Elasticsearch(**kwargs)
+        self.es = ClientProxy(**get_client_options(**kwargs))
         logging.info(_i18n._LI('Storage backend: Elasticsearch '
                          'at %s') % kwargs['hosts'])
-        self.backup_manager = BackupTypeManager(self.es, 'backups')
-        self.client_manager = ClientTypeManager(self.es, 'clients')
-        self.job_manager = JobTypeManager(self.es, 'jobs')
-        self.action_manager = ActionTypeManager(self.es, 'actions')
-        self.session_manager = SessionTypeManager(self.es, 'sessions')
+        if backup_index_interval == BACKUP_INDEX_MONTHLY:
+            self.backup_manager = MonthlyBackupTypeManager(
+                self.es, 'backups', index=index,
+                refresh_policy=refresh_policy, routing=routing)
+        else:
+            self.backup_manager = BackupTypeManager(
+                self.es, 'backups', refresh_policy=refresh_policy,
+                routing=routing)
+        self.client_manager = ClientTypeManager(
+            self.es, 'clients', refresh_policy=refresh_policy,
+            routing=routing)
+        self.job_manager = JobTypeManager(
+            self.es, 'jobs', refresh_policy=refresh_policy, routing=routing)
+        self.action_manager = ActionTypeManager(
+            self.es, 'actions', refresh_policy=refresh_policy,
+            routing=routing)
+        self.session_manager = SessionTypeManager(
+            self.es, 'sessions', refresh_policy=refresh_policy,
+            routing=routing)
+        self.retention_manager = RetentionTypeManager(
+            self.es, 'retentions', refresh_policy=refresh_policy,
+            routing=routing)
+        if cache_size:
+            # jobs and actions are read far more often than written
+            self.job_manager = cache.CachedTypeManager(
+                self.job_manager, cache_size, cache_ttl)
+            self.action_manager = cache.CachedTypeManager(
+                self.action_manager, cache_size, cache_ttl)
+
+    def get_manager(self, doc_type):
+        """
+        :return: the type manager of the documents of the given type
+        """
+        managers = {'backups': self.backup_manager,
+                    'clients': self.client_manager,
+                    'jobs': self.job_manager,
+                    'actions': self.action_manager,
+                    'sessions': self.session_manager,
+                    'retentions': self.retention_manager}
+        if doc_type not in managers:
+            raise freezer_api_exc.BadDataFormat(
+                message=_i18n._('Unknown document type %s') % doc_type)
+        return managers[doc_type]
+
+    def export(self, doc_type, user_id, search=None, fields=None):
+        """
+        :return: iterator on the documents of the user of the given type
+        """
+        return self.get_manager(doc_type).export(user_id, search=search,
+                                                 fields=fields)
+
+    def export_all(self, doc_type, search=None, fields=None):
+        """
+        :return: iterator on the documents of all the users of the given
+                 type
+        """
+        return self.get_manager(doc_type).export_all(search=search,
+                                                     fields=fields)
 
     def get_backup(self, user_id, backup_id=None,
-                   offset=0, limit=10, search=None):
+                   offset=0, limit=10, search=None, after=None, fields=None):
         search = search or {}
         return self.backup_manager.search(user_id,
                                           backup_id,
                                           search=search,
                                           offset=offset,
-                                          limit=limit)
+                                          limit=limit,
+                                          after=after,
+                                          fields=fields)
+
+    def mget_backup(self, user_id, backup_ids, fields=None):
+        return self.backup_manager.mget(user_id, backup_ids, fields=fields)
+
+    def count_backup(self, user_id, search=None):
+        return self.backup_manager.count(user_id, search=search)
+
+    def get_latest_backups(self, user_id, search=None, fields=None):
+        return self.backup_manager.latest(user_id, search=search,
+                                          fields=fields)
 
-    def add_backup(self, user_id, user_name, doc):
+    def get_backup_stats(self, user_id, search=None):
+        return self.backup_manager.stats(user_id, search=search)
+
+    def add_backup(self, user_id, user_name, doc, refresh=None):
         # raises if data is malformed (HTTP_400) or already present (HTTP_409)
         backup_metadata_doc = BackupMetadataDoc(user_id, user_name, doc)
         if not backup_metadata_doc.is_valid():
             raise freezer_api_exc.BadDataFormat(message=_i18n._('Bad Data Format'))
         backup_id = backup_metadata_doc.backup_id
-        existing = self.backup_manager.search(user_id, backup_id)
-        if existing:
+        # the user and backup ids make the document id: a single
+        # create-only write both checks for duplicates and stores the backup
+        backup = backup_metadata_doc.serialize()
+        try:
+            self.backup_manager.insert(
+                backup, self.backup_manager.get_doc_id(backup),
+                op_type='create', refresh=refresh)
+        except freezer_api_exc.DocumentExists:
             raise freezer_api_exc.DocumentExists(
                 message=_i18n._('Backup data already existing with ID %s') %
                 backup_id)
-        self.backup_manager.insert(backup_metadata_doc.serialize())
         return backup_id
 
-    def delete_backup(self, user_id, backup_id):
-        return self.backup_manager.delete(user_id, backup_id)
+    def add_backups(self, user_id, user_name, docs, refresh=None):
+        """
+        Stores many backups using bulk requests. Every document is handled
+        on its own: malformed or already existing backups are reported
+        without preventing the others from being stored.
+
+        :return: one dict per document, in order, with the backup_id and
+                 a status among 'created', 'conflict' and 'error'
+        """
+        results = []
+        to_insert = []
+        for doc in docs:
+            backup_metadata_doc = BackupMetadataDoc(user_id, user_name, doc)
+            if not backup_metadata_doc.is_valid():
+                results.append({'backup_id': None,
+                                'status': 'error',
+                                'error': _i18n._('Bad Data Format')})
+                continue
+            results.append({'backup_id': backup_metadata_doc.backup_id,
+                            'status': 'created'})
+            to_insert.append((results[-1], backup_metadata_doc))
+        if not to_insert:
+            return results
+
+        backups = [b.serialize() for _, b in to_insert]
+        outcome = self.backup_manager.bulk_insert(
+            [(self.backup_manager.get_doc_id(b), b) for b in backups],
+            op_type='create', refresh=refresh)
+        for (result, _), (ok, item) in zip(to_insert, outcome):
+            if ok:
+                continue
+            if item.get('status') == 409:
+                result['status'] = 'conflict'
+                result['error'] = _i18n._('Backup data already existing '
+                                          'with ID %s') % result['backup_id']
+            else:
+                result['status'] = 'error'
+                result['error'] = str(item.get('error'))
+        logging.info(_i18n._LI('Bulk backup registration, %(created)s of '
+                               '%(total)s created') %
+                     {'created': len([r for r in results
+                                      if r['status'] == 'created']),
+                      'total': len(results)})
+        return results
+
+    def delete_backup(self, user_id, backup_id, refresh=None):
+        return self.backup_manager.delete(user_id, backup_id, refresh=refresh)
+
+    def delete_backups(self, user_id, backup_ids, refresh=REFRESH_NONE):
+        """
+        Deletes many backups with a single bulk request. Unless the caller
+        asks for a refresh, the index is left to its periodic refresh.
+
+        :return: the number of deleted backups
+        """
+        return self.backup_manager.mdelete(user_id, backup_ids,
+                                           refresh=refresh)
 
     def get_client(self, user_id, client_id=None,
-                   offset=0, limit=10, search=None):
+                   offset=0, limit=10, search=None, after=None, fields=None):
         search = search or {}
         return self.client_manager.search(user_id,
                                           client_id,
                                           search=search,
                                           offset=offset,
-                                          limit=limit)
+                                          limit=limit,
+                                          after=after,
+                                          fields=fields)
+
+    def mget_client(self, user_id, client_ids, fields=None):
+        return self.client_manager.mget(user_id, client_ids, fields=fields)
 
-    def add_client(self, user_id, doc):
+    def count_client(self, user_id, search=None):
+        return self.client_manager.count(user_id, search=search)
+
+    def add_client(self, user_id, doc, refresh=None):
         client_id = doc.get('client_id', None)
         if client_id is None:
             raise freezer_api_exc.BadDataFormat(message=_i18n._('Missing client ID'))
-        existing = self.client_manager.search(user_id, client_id)
-        if existing:
-            raise freezer_api_exc.DocumentExists(
-                message=_i18n._('Client already registered with ID %s') % client_id)
         client_doc = {'client': doc,
                       'user_id': user_id,
                       'uuid': uuid.uuid4().hex}
-        self.client_manager.insert(client_doc)
+        # client ids are unique per user: the document id is made of both
+        # so that a single create-only write rejects duplicates
+        try:
+            self.client_manager.insert(client_doc,
+                                       '{0}_{1}'.format(user_id, client_id),
+                                       op_type='create', refresh=refresh)
+        except freezer_api_exc.DocumentExists:
+            raise freezer_api_exc.DocumentExists(
+                message=_i18n._('Client already registered with ID %s') % client_id)
         logging.info(_i18n._LI('Client registered, client_id: %s') % client_id)
         return client_id
 
-    def delete_client(self, user_id, client_id):
-        return self.client_manager.delete(user_id, client_id)
+    def delete_client(self, user_id, client_id, refresh=None):
+        return self.client_manager.delete(user_id, client_id, refresh=refresh)
+
+    def get_job(self, user_id, job_id, fields=None):
+        return self.job_manager.get(user_id, job_id, fields=fields)
 
-    def get_job(self, user_id, job_id):
-        return self.job_manager.get(user_id, job_id)
+    def mget_job(self, user_id, job_ids, fields=None):
+        return self.job_manager.mget(user_id, job_ids, fields=fields)
 
-    def search_job(self, user_id, offset=0, limit=10, search=None):
+    def count_job(self, user_id, search=None):
+        return self.job_manager.count(user_id, search=search)
+
+    def search_job(self, user_id, offset=0, limit=10, search=None,
+                   after=None, fields=None):
         search = search or {}
         return self.job_manager.search(user_id,
                                        search=search,
                                        offset=offset,
-                                       limit=limit)
+                                       limit=limit,
+                                       after=after,
+                                       fields=fields)
 
-    def add_job(self, user_id, doc):
+    def add_job(self, user_id, doc, refresh=None):
         jobdoc = JobDoc.create(doc, user_id)
         job_id = jobdoc['job_id']
-        self.job_manager.insert(jobdoc, job_id)
+        self.job_manager.insert(jobdoc, job_id, refresh=refresh)
         logging.info(_i18n._LI('Job registered, job id: %s') % job_id)
         return job_id
 
-    def delete_job(self, user_id, job_id):
-        return self.job_manager.delete(user_id, job_id)
+    def delete_job(self, user_id, job_id, refresh=None):
+        return self.job_manager.delete(user_id, job_id, refresh=refresh)
 
-    def update_job(self, user_id, job_id, patch_doc):
+    def update_job(self, user_id, job_id, patch_doc, refresh=None):
         valid_patch = JobDoc.create_patch(patch_doc)
 
-        # check that document exists
-        assert (self.job_manager.get(user_id, job_id))
-
-        version = self.job_manager.update(job_id, valid_patch)
+        version = self.job_manager.update(user_id, job_id, valid_patch,
+                                          refresh=refresh)
         logging.info(_i18n._LI('Job %(id)s updated to version %(version)s') %
                      {'id': job_id, 'version': version})
         return version
 
-    def replace_job(self, user_id, job_id, doc):
-        # check that no document exists with
-        # same job_id and different user_id
-        try:
-            self.job_manager.get(user_id, job_id)
-        except freezer_api_exc.DocumentNotFound:
-            pass
-
+    def replace_job(self, user_id, job_id, doc, refresh=None):
         valid_doc = JobDoc.update(doc, user_id, job_id)
 
-        (created, version) = self.job_manager.insert(valid_doc, job_id)
+        (created, version) = self.job_manager.replace(user_id, job_id,
+                                                      valid_doc,
+                                                      refresh=refresh)
         if created:
             logging.info(_i18n._LI('Job %s created') % job_id)
         else:
@@ -386,48 +1277,78 @@ class ElasticSearchEngine(object):
                          {'id': job_id, 'version': version}))
         return version
 
-    def get_action(self, user_id, action_id):
-        return self.action_manager.get(user_id, action_id)
+    def get_action(self, user_id, action_id, fields=None):
+        return self.action_manager.get(user_id, action_id, fields=fields)
+
+    def mget_action(self, user_id, action_ids, fields=None):
+        return self.action_manager.mget(user_id, action_ids, fields=fields)
 
-    def search_action(self, user_id, offset=0, limit=10, search=None):
+    def count_action(self, user_id, search=None):
+        return self.action_manager.count(user_id, search=search)
+
+    def search_action(self, user_id, offset=0, limit=10, search=None,
+                      after=None, fields=None):
         search = search or {}
         return self.action_manager.search(user_id,
                                           search=search,
                                           offset=offset,
-                                          limit=limit)
+                                          limit=limit,
+                                          after=after,
+                                          fields=fields)
 
-    def add_action(self, user_id, doc):
+    def add_action(self, user_id, doc, refresh=None):
         actiondoc = ActionDoc.create(doc, user_id)
         action_id = actiondoc['action_id']
-        self.action_manager.insert(actiondoc, action_id)
+        self.action_manager.insert(actiondoc, action_id, refresh=refresh)
         logging.info(_i18n._LI('Action registered, action id: %s') % action_id)
         return action_id
 
-    def delete_action(self, user_id, action_id):
-        return self.action_manager.delete(user_id, action_id)
+    def add_actions(self, user_id, docs, refresh=None):
+        """
+        Stores many new actions with a single bulk request, refreshing the
+        index at most once. Action ids already in use are rejected.
+
+        :return: list of the action ids
+        """
+        action_docs = [ActionDoc.create(doc, user_id) for doc in docs]
+        if not action_docs:
+            return []
+        outcome = self.action_manager.bulk_insert(
+            [(doc['action_id'], doc) for doc in action_docs],
+            op_type='create', refresh=refresh)
+        for doc, (ok, item) in zip(action_docs, outcome):
+            if ok:
+                continue
+            if item.get('status') == 409:
+                raise freezer_api_exc.DocumentExists(
+                    message=_i18n._('Action already existing with ID %s') %
+                    doc['action_id'])
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('Unable to store action %(id)s: %(error)s') %
+                {'id': doc['action_id'], 'error': item.get('error')})
+        action_ids = [doc['action_id'] for doc in action_docs]
+        logging.info(_i18n._LI('Actions registered, action ids: %s') %
+                     ', '.join(action_ids))
+        return action_ids
 
-    def update_action(self, user_id, action_id, patch_doc):
-        valid_patch = ActionDoc.create_patch(patch_doc)
+    def delete_action(self, user_id, action_id, refresh=None):
+        return self.action_manager.delete(user_id, action_id, refresh=refresh)
 
-        # check that document exists
-        assert (self.action_manager.get(user_id, action_id))
+    def update_action(self, user_id, action_id, patch_doc, refresh=None):
+        valid_patch = ActionDoc.create_patch(patch_doc)
 
-        version = self.action_manager.update(action_id, valid_patch)
+        version = self.action_manager.update(user_id, action_id, valid_patch,
+                                             refresh=refresh)
         logging.info(_i18n._LI('Action %(id)s updated to version %(version)s' %
                      {'id': action_id, 'version': version}))
         return version
 
-    def replace_action(self, user_id, action_id, doc):
-        # check that no document exists with
-        # same action_id and different user_id
-        try:
-            self.action_manager.get(user_id, action_id)
-        except freezer_api_exc.DocumentNotFound:
-            pass
-
+    def replace_action(self, user_id, action_id, doc, refresh=None):
         valid_doc = ActionDoc.update(doc, user_id, action_id)
 
-        (created, version) = self.action_manager.insert(valid_doc, action_id)
+        (created, version) = self.action_manager.replace(user_id, action_id,
+                                                         valid_doc,
+                                                         refresh=refresh)
         if created:
             logging.info(_i18n._LI('Action %s created') % action_id)
         else:
@@ -435,51 +1356,112 @@ class ElasticSearchEngine(object):
                          % {'id': action_id, 'version': version}))
         return version
 
-    def get_session(self, user_id, session_id):
-        return self.session_manager.get(user_id, session_id)
+    def get_session(self, user_id, session_id, fields=None):
+        return self.session_manager.get(user_id, session_id, fields=fields)
+
+    def mget_session(self, user_id, session_ids, fields=None):
+        return self.session_manager.mget(user_id, session_ids, fields=fields)
+
+    def count_session(self, user_id, search=None):
+        return self.session_manager.count(user_id, search=search)
 
-    def search_session(self, user_id, offset=0, limit=10, search=None):
+    def search_session(self, user_id, offset=0, limit=10, search=None,
+                       after=None, fields=None):
         search = search or {}
         return self.session_manager.search(user_id,
                                            search=search,
                                            offset=offset,
-                                           limit=limit)
+                                           limit=limit,
+                                           after=after,
+                                           fields=fields)
 
-    def add_session(self, user_id, doc):
+    def add_session(self, user_id, doc, refresh=None):
         session_doc = SessionDoc.create(doc, user_id)
         session_id = session_doc['session_id']
-        self.session_manager.insert(session_doc, session_id)
+        self.session_manager.insert(session_doc, session_id, refresh=refresh)
         logging.info(_i18n._LI('Session registered, session id: %s') % session_id)
         return session_id
 
-    def delete_session(self, user_id, session_id):
-        return self.session_manager.delete(user_id, session_id)
+    def delete_session(self, user_id, session_id, refresh=None):
+        return self.session_manager.delete(user_id, session_id,
+                                           refresh=refresh)
 
-    def update_session(self, user_id, session_id, patch_doc):
+    def update_session(self, user_id, session_id, patch_doc, version=None,
+                       refresh=None):
         valid_patch = SessionDoc.create_patch(patch_doc)
 
-        # check that document exists
-        assert (self.session_manager.get(user_id, session_id))
-
-        version = self.session_manager.update(session_id, valid_patch)
+        version = self.session_manager.update(user_id, session_id, valid_patch,
+                                              version=version, refresh=refresh)
         logging.info(_i18n._LI('Session %(id)s updated to version %(version)s' %
                      {'id': session_id, 'version': version}))
         return version
 
-    def replace_session(self, user_id, session_id, doc):
-        # check that no document exists with
-        # same session_id and different user_id
-        try:
-            self.session_manager.get(user_id, session_id)
-        except freezer_api_exc.DocumentNotFound:
-            pass
-
+    def replace_session(self, user_id, session_id, doc, refresh=None):
         valid_doc = SessionDoc.update(doc, user_id, session_id)
 
-        (created, version) = self.session_manager.insert(valid_doc, session_id)
+        (created, version) = self.session_manager.replace(user_id, session_id,
+                                                          valid_doc,
+                                                          refresh=refresh)
         if created:
             logging.info(_i18n._LI('Session %s created') % session_id)
         else:
             logging.info(_i18n._LI('Session %(id)s replaced with version %(version)s'
                          % {'id': session_id, 'version': version}))
         return version
+
+    def get_retention(self, user_id, retention_id, fields=None):
+        return self.retention_manager.get(user_id, retention_id,
+                                          fields=fields)
+
+    def count_retention(self, user_id, search=None):
+        return self.retention_manager.count(user_id, search=search)
+
+    def search_retention(self, user_id, offset=0, limit=10, search=None,
+                         after=None, fields=None):
+        search = search or {}
+        return self.retention_manager.search(user_id,
+                                             search=search,
+                                             offset=offset,
+                                             limit=limit,
+                                             after=after,
+                                             fields=fields)
+
+    def scan_retentions(self):
+        """
+        :return: iterator on the retention rules of all the users
+        """
+        return self.retention_manager.export_all()
+
+    def add_retention(self, user_id, doc, refresh=None):
+        retention_doc = RetentionDoc.create(doc, user_id)
+        retention_id = retention_doc['retention_id']
+        self.retention_manager.insert(retention_doc, retention_id,
+                                      refresh=refresh)
+        logging.info(_i18n._LI('Retention registered, retention id: %s') %
+                     retention_id)
+        return retention_id
+
+    def delete_retention(self, user_id, retention_id, refresh=None):
+        return self.retention_manager.delete(user_id, retention_id,
+                                             refresh=refresh)
+
+    def update_retention(self, user_id, retention_id, patch_doc, refresh=None):
+        valid_patch = RetentionDoc.create_patch(patch_doc)
+        version = self.retention_manager.update(user_id, retention_id,
+                                                valid_patch, refresh=refresh)
+        logging.info(_i18n._LI('Retention %(id)s updated to version '
+                               '%(version)s') %
+                     {'id': retention_id, 'version': version})
+        return version
+
+    def replace_retention(self, user_id, retention_id, doc, refresh=None):
+        valid_doc = RetentionDoc.update(doc, user_id, retention_id)
+        (created, version) = self.retention_manager.replace(
+            user_id, retention_id, valid_doc, refresh=refresh)
+        if created:
+            logging.info(_i18n._LI('Retention %s created') % retention_id)
+        else:
+            logging.info(_i18n._LI('Retention %(id)s replaced with version '
+                                   '%(version)s') %
+                         {'id': retention_id, 'version': version})
+        return version
@@ -0,0 +1,209 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Append-only log storage engine.
+
+Reads are served by the indexes of the memory engine. Every change is
+first appended to a log file in the logfile_path directory, one json
+entry per line, and written to disk before the request completes. Once
+the log holds logfile_compact_after entries, all the documents are
+written to a new snapshot file and the log is emptied. At startup the
+snapshot is loaded, the log is replayed on top of it and compacted.
+
+Entries set a document and its version, or remove a document: replaying
+an entry twice gives the same result, so a crash while compacting loses
+nothing.
+"""
+
+import contextlib
+import json
+import logging
+import mmap
+import os
+import threading
+
+from freezer_api.common import _i18n
+from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.storage import memory
+
+LOG_FILE = 'freezer-api.log'
+SNAPSHOT_FILE = 'freezer-api.snapshot'
+
+
+def encode(entry):
+    return (json.dumps(entry) + '\n').encode('utf-8')
+
+
+def read_entries(path):
+    """
+    Reads the entries of a log or snapshot file, mapped in memory. An
+    incomplete last entry, left by a crash while writing it, is skipped
+    """
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for line in iter(data.readline, b''):
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except ValueError:
+                    if data.tell() < data.size():
+                        raise freezer_api_exc.StorageEngineError(
+                            message=_i18n._('Corrupted entry in %s') % path)
+                    logging.warning(_i18n._LW('Skipping incomplete last '
+                                              'entry of %s') % path)
+        finally:
+            data.close()
+
+
+class Journal(object):
+    """
+    Records the changes of the type managers. The documents are only
+    changed while the journal lock is held, so a snapshot taken under
+    the lock is consistent.
+    """
+
+    def __init__(self, path, sync=True, compact_after=10000):
+        self.path = path
+        self.log_path = os.path.join(path, LOG_FILE)
+        self.snapshot_path = os.path.join(path, SNAPSHOT_FILE)
+        self.sync = sync
+        self.compact_after = compact_after
+        self.lock = threading.RLock()
+        self.managers = {}
+        self.log = None
+        self.entries = 0
+        self.batch_depth = 0
+
+    def open(self, managers):
+        """
+        Loads the documents of the managers from the snapshot and the log
+        """
+        with self.lock:
+            self.managers = dict((m.doc_type, m) for m in managers)
+            if not os.path.isdir(self.path):
+                os.makedirs(self.path)
+            self.load(self.snapshot_path)
+            replayed = self.load(self.log_path)
+            self.log = open(self.log_path, 'ab')
+            if replayed:
+                self.compact()
+
+    def close(self):
+        with self.lock:
+            if self.log is not None:
+                self.log.close()
+                self.log = None
+
+    def load(self, path):
+        """
+        :return: the number of entries applied
+        """
+        count = 0
+        for entry in read_entries(path):
+            manager = self.managers[entry['type']]
+            if 'doc' in entry:
+                manager.load(entry['id'], entry['doc'], entry['version'])
+            else:
+                manager.unload(entry['id'])
+            count += 1
+        return count
+
+    def flush(self):
+        self.log.flush()
+        if self.sync:
+            os.fsync(self.log.fileno())
+
+    @contextlib.contextmanager
+    def record(self, doc_type, doc_id, doc=None, version=None):
+        """
+        Appends the change to the log. The block applying the change is
+        run while the lock is held.
+        """
+        entry = {'type': doc_type, 'id': doc_id}
+        if doc is not None:
+            entry['doc'] = doc
+            entry['version'] = version
+        with self.lock:
+            position = self.log.tell()
+            try:
+                self.log.write(encode(entry))
+                if not self.batch_depth:
+                    self.flush()
+            except (IOError, OSError) as e:
+                self.log.truncate(position)
+                raise freezer_api_exc.StorageEngineError(
+                    message=_i18n._('Unable to write the log: %s') % e)
+            yield
+            self.entries += 1
+            if not self.batch_depth:
+                self.compact_if_due()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        Writes the changes recorded in the block to disk at once
+        """
+        with self.lock:
+            self.batch_depth += 1
+            try:
+                yield
+            finally:
+                self.batch_depth -= 1
+                if not self.batch_depth:
+                    self.flush()
+                    self.compact_if_due()
+
+    def compact_if_due(self):
+        if self.compact_after and self.entries >= self.compact_after:
+            self.compact()
+
+    def compact(self):
+        """
+        Writes all the documents to a new snapshot and empties the log
+        """
+        with self.lock:
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                for doc_type, manager in self.managers.items():
+                    for doc_id, doc in manager.docs.items():
+                        f.write(encode({'type': doc_type,
+                                        'id': doc_id,
+                                        'doc': doc,
+                                        'version': manager.versions[doc_id]}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.snapshot_path)
+            self.log.close()
+            self.log = open(self.log_path, 'wb')
+            self.entries = 0
+
+
+class LogFileEngine(memory.MemoryEngine):
+    """
+    Storage engine keeping the documents in memory and recording the
+    changes on disk. The elasticsearch connection options are accepted
+    and ignored.
+    """
+
+    def __init__(self, logfile_path, logfile_sync=True,
+                 logfile_compact_after=10000, index='freezer', **kwargs):
+        logging.info(_i18n._LI('Storage backend: log files in %s') %
+                     logfile_path)
+        self.journal = Journal(logfile_path, sync=logfile_sync,
+                               compact_after=logfile_compact_after)
+        memory.MemoryEngine.__init__(self, index=index, journal=self.journal)
+        self.journal.open(self.get_managers())
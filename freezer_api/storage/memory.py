@@ -0,0 +1,573 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+In-memory storage engine.
+
+Documents are kept in the api process and are lost when it stops: the
+engine is meant for tests, load tests of the api layer and single process
+deployments. It answers the same calls as the elasticsearch engine and
+mimics its search semantics: exact matches on the not_analyzed fields,
+matches on any word for the other ones.
+"""
+
+import bisect
+import contextlib
+import copy
+import logging
+import re
+import threading
+import uuid
+
+import six
+
+from freezer_api.common import _i18n
+from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.storage import elastic
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def get_words(value):
+    return set(_WORD_RE.findall(six.text_type(value).lower()))
+
+
+def get_field_values(doc, path):
+    """
+    :return: list of the values of a dotted field of the document. As in
+             elasticsearch 1.x a field can also be referred to by its
+             name only when it is nested in an object
+    """
+    values = [doc]
+    for name in path.split('.'):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and name in value:
+                found.append(value[name])
+        values = []
+        for value in found:
+            values.extend(value if isinstance(value, list) else [value])
+    if values or '.' in path:
+        return values
+    for value in doc.values():
+        if isinstance(value, dict) and path in value:
+            nested = value[path]
+            return nested if isinstance(nested, list) else [nested]
+    return []
+
+
+def set_field(doc, path, value):
+    names = path.split('.')
+    for name in names[:-1]:
+        doc = doc.setdefault(name, {})
+    doc[names[-1]] = value
+
+
+def del_field(doc, path):
+    names = path.split('.')
+    for name in names[:-1]:
+        doc = doc.get(name)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(names[-1], None)
+
+
+def get_backup_timestamp(doc):
+    values = get_field_values(doc, 'backup_metadata.timestamp')
+    try:
+        return int(values[0])
+    except (IndexError, TypeError, ValueError):
+        return None
+
+
+def get_backup_stats(docs):
+    """
+    Aggregates the backups per backup set, as BackupTypeManager.stats.
+    Like the terms aggregations, the backups missing a field of the set
+    are left out.
+    """
+    names = [name for name, _ in elastic.BACKUP_SET_FIELDS]
+    backup_sets = {}
+    for doc in docs:
+        metadata = doc.get('backup_metadata') or {}
+        key = tuple(metadata.get(name) for name in names)
+        if None in key:
+            continue
+        stats = backup_sets.get(key)
+        if stats is None:
+            stats = backup_sets[key] = dict(zip(names, key))
+            stats.update(count=0, latest_timestamp=None)
+            stats.update((field, 0) for field in elastic.BACKUP_SIZE_FIELDS)
+        stats['count'] += 1
+        timestamp = get_backup_timestamp(doc)
+        if timestamp is not None and (stats['latest_timestamp'] is None or
+                                      timestamp > stats['latest_timestamp']):
+            stats['latest_timestamp'] = timestamp
+        for field in elastic.BACKUP_SIZE_FIELDS:
+            try:
+                stats[field] += int(metadata.get(field) or 0)
+            except (TypeError, ValueError):
+                pass
+    return elastic.sort_backup_stats(backup_sets.values())
+
+
+def get_latest_backups(docs):
+    """
+    Keeps the most recent backup of each backup set, as
+    BackupTypeManager.latest. The backups without backup_set_id are left
+    out.
+
+    :return: list of the backups, sorted by backup_set_id
+    """
+    latest = {}
+    for doc in docs:
+        backup_set_id = doc.get('backup_set_id')
+        if backup_set_id is None:
+            continue
+        timestamp = get_backup_timestamp(doc)
+        if timestamp is None:
+            timestamp = float('-inf')
+        if backup_set_id not in latest or timestamp > latest[backup_set_id][0]:
+            latest[backup_set_id] = (timestamp, doc)
+    return [latest[key][1] for key in sorted(latest)]
+
+
+def merge(dst, src):
+    """
+    Recursively merges src into dst, like a partial document update
+    """
+    for key, value in src.items():
+        if isinstance(value, dict) and isinstance(dst.get(key), dict):
+            merge(dst[key], value)
+        else:
+            dst[key] = copy.deepcopy(value)
+
+
+class NoJournal(object):
+    """
+    Journal of the memory engine: the changes are not recorded anywhere
+    """
+
+    @contextlib.contextmanager
+    def record(self, doc_type, doc_id, doc=None, version=None):
+        yield
+
+    @contextlib.contextmanager
+    def batch(self):
+        yield
+
+
+class LocalTypeManager(elastic.TypeManager):
+    """
+    Base of the type managers storing the documents by themselves in place
+    of elasticsearch. Ownership checks, searches and field selection are
+    done in python with the semantics of the elasticsearch type managers.
+    """
+
+    def __init__(self, doc_type):
+        elastic.TypeManager.__init__(self, None, doc_type, None)
+
+    @staticmethod
+    def check_owner(user_id, doc_id, doc):
+        if doc is None:
+            raise freezer_api_exc.DocumentNotFound(
+                message=_i18n._('No document found with ID %s') % doc_id)
+        if doc.get('user_id') != user_id:
+            raise freezer_api_exc.AccessForbidden(
+                _i18n._("Document access forbidden"))
+        return doc
+
+    def project(self, doc, fields):
+        """
+        :return: a copy of the document limited to the requested fields
+        """
+        includes, excludes = self.get_source_filter(fields)
+        if includes:
+            projected = {}
+            for path in includes:
+                values = get_field_values(doc, path)
+                if values:
+                    set_field(projected, path, copy.deepcopy(
+                        values[0] if len(values) == 1 else values))
+        else:
+            projected = copy.deepcopy(doc)
+        for path in excludes:
+            del_field(projected, path)
+        return projected
+
+    def field_matches(self, doc, field, value):
+        values = get_field_values(doc, field)
+        if field in self.query_builder.keyword_fields:
+            return value in values
+        words = get_words(value)
+        return any(words & get_words(v) for v in values)
+
+    def get_user_ids(self):
+        """
+        :return: sorted list of the users owning documents
+        """
+        raise NotImplementedError()
+
+    def export(self, user_id, search=None, fields=None):
+        """
+        Yields the documents a page at a time, so that the lock is not
+        held while the caller handles them
+        """
+        after = None
+        while True:
+            page = self.search(user_id, search=search, after=after,
+                               limit=elastic.BULK_CHUNK_SIZE, fields=fields)
+            for doc in page:
+                yield doc
+            if len(page) < elastic.BULK_CHUNK_SIZE:
+                return
+            after = self.get_sort_key(page[-1])
+
+    def export_all(self, search=None, fields=None):
+        for user_id in self.get_user_ids():
+            for doc in self.export(user_id, search=search, fields=fields):
+                yield doc
+
+    def matches(self, doc, search):
+        for condition in search.get('match', []):
+            for field, value in condition.items():
+                if not self.field_matches(doc, field, value):
+                    return False
+        for condition in search.get('match_not', []):
+            for field, value in condition.items():
+                if self.field_matches(doc, field, value):
+                    return False
+        return True
+
+
+class MemoryTypeManager(LocalTypeManager):
+    """
+    Stores the documents of one type. Besides the documents, keyed by id,
+    it keeps for each user a hash index from the value of sort_field to
+    the document id and the sorted list of those values, used to page
+    through the documents of the user in order.
+
+    Each change is recorded in the journal before being applied.
+    """
+
+    def __init__(self, doc_type, journal=None):
+        LocalTypeManager.__init__(self, doc_type)
+        self.journal = journal or NoJournal()
+        self.lock = threading.RLock()
+        self.docs = {}
+        self.versions = {}
+        self.user_docs = {}
+        self.user_keys = {}
+
+    def get_key(self, doc, doc_id):
+        if not self.sort_field:
+            return doc_id
+        values = get_field_values(doc, self.sort_field)
+        return values[0] if values else doc_id
+
+    def add_to_index(self, doc_id, doc):
+        user_id = doc.get('user_id')
+        key = self.get_key(doc, doc_id)
+        keys = self.user_keys.setdefault(user_id, [])
+        user_docs = self.user_docs.setdefault(user_id, {})
+        if key not in user_docs:
+            bisect.insort(keys, key)
+        user_docs[key] = doc_id
+
+    def remove_from_index(self, doc_id, doc):
+        user_id = doc.get('user_id')
+        key = self.get_key(doc, doc_id)
+        user_docs = self.user_docs.get(user_id, {})
+        if user_docs.get(key) != doc_id:
+            return
+        del user_docs[key]
+        keys = self.user_keys[user_id]
+        del keys[bisect.bisect_left(keys, key)]
+
+    def load(self, doc_id, doc, version):
+        """
+        Sets the document and its version, without recording the change
+        """
+        old_doc = self.docs.get(doc_id)
+        if old_doc is not None:
+            self.remove_from_index(doc_id, old_doc)
+        self.docs[doc_id] = doc
+        self.versions[doc_id] = version
+        self.add_to_index(doc_id, doc)
+
+    def unload(self, doc_id):
+        """
+        Removes the document, without recording the change
+        """
+        doc = self.docs.pop(doc_id, None)
+        if doc is not None:
+            self.remove_from_index(doc_id, doc)
+            del self.versions[doc_id]
+
+    def store(self, doc_id, doc):
+        """
+        Stores or overwrites the document
+
+        :return: (created, version) tuple
+        """
+        created = doc_id not in self.docs
+        version = self.versions.get(doc_id, 0) + 1
+        with self.journal.record(self.doc_type, doc_id, doc, version):
+            self.load(doc_id, doc, version)
+        return created, version
+
+    def get_owned(self, user_id, doc_id):
+        return self.check_owner(user_id, doc_id, self.docs.get(doc_id))
+
+    def get_user_ids(self):
+        with self.lock:
+            return sorted(user_id for user_id, keys in self.user_keys.items()
+                          if keys)
+
+    def get_candidate_keys(self, user_id, keys, search):
+        """
+        Narrows down the sorted keys to scan using the type indexes
+        """
+        return keys
+
+    def get(self, user_id, doc_id, fields=None):
+        with self.lock:
+            doc = self.project(self.get_owned(user_id, doc_id), fields)
+            doc['_version'] = self.versions[doc_id]
+        return doc
+
+    def mget(self, user_id, doc_ids, fields=None):
+        with self.lock:
+            user_docs = self.user_docs.get(user_id, {})
+            return [self.project(self.docs[user_docs[doc_id]], fields)
+                    for doc_id in elastic.unique(doc_ids)
+                    if doc_id in user_docs]
+
+    def scan(self, user_id, doc_id, search, after=None):
+        """
+        Yields, in sort order, the documents of the user matching the
+        search. To be called while the lock is held.
+        """
+        user_docs = self.user_docs.get(user_id, {})
+        keys = self.user_keys.get(user_id, [])
+        if doc_id is not None:
+            keys = [doc_id] if doc_id in user_docs else []
+        if after is not None:
+            keys = keys[bisect.bisect_right(keys, after):]
+        for key in self.get_candidate_keys(user_id, keys, search):
+            doc = self.docs[user_docs[key]]
+            if self.matches(doc, search):
+                yield doc
+
+    def search(self, user_id, doc_id=None, search=None, offset=0, limit=10,
+               after=None, fields=None):
+        search = search or {}
+        if after is not None:
+            offset = 0
+        results = []
+        try:
+            with self.lock:
+                for doc in self.scan(user_id, doc_id, search, after):
+                    if offset:
+                        offset -= 1
+                        continue
+                    if len(results) == limit:
+                        break
+                    results.append(self.project(doc, fields))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('search operation failed: %s') % e)
+        return results
+
+    def count(self, user_id, doc_id=None, search=None):
+        search = search or {}
+        try:
+            with self.lock:
+                return sum(1 for _ in self.scan(user_id, doc_id, search))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('count operation failed: %s') % e)
+
+    def insert(self, doc, doc_id=None, refresh=None, op_type=None):
+        doc = copy.deepcopy(doc)
+        doc.pop('_version', None)
+        doc_id = doc_id or uuid.uuid4().hex
+        with self.lock:
+            if op_type == 'create' and doc_id in self.docs:
+                raise freezer_api_exc.DocumentExists(
+                    message=_i18n._('Document already existing with ID %s') %
+                    doc_id)
+            return self.store(doc_id, doc)
+
+    def bulk_insert(self, docs, refresh=None, op_type='index'):
+        results = []
+        with self.lock, self.journal.batch():
+            for doc_id, doc in docs:
+                doc_id = doc_id or uuid.uuid4().hex
+                try:
+                    created, version = self.insert(doc, doc_id,
+                                                   op_type=op_type)
+                    results.append((True, {'_id': doc_id,
+                                           '_version': version,
+                                           'status': 201 if created else 200}))
+                except freezer_api_exc.DocumentExists as e:
+                    results.append((False, {'_id': doc_id,
+                                            'status': 409,
+                                            'error': e.message}))
+        return results
+
+    def delete(self, user_id, doc_id, refresh=None):
+        with self.lock:
+            user_docs = self.user_docs.get(user_id, {})
+            if doc_id not in user_docs:
+                return 0
+            internal_id = user_docs[doc_id]
+            with self.journal.record(self.doc_type, internal_id):
+                self.unload(internal_id)
+        return 1
+
+    def mdelete(self, user_id, doc_ids, refresh=None):
+        with self.lock, self.journal.batch():
+            return sum(self.delete(user_id, doc_id)
+                       for doc_id in elastic.unique(doc_ids))
+
+    def update(self, user_id, doc_id, update_doc, refresh=None,
+               version=None):
+        update_doc.pop('_version', 0)
+        with self.lock:
+            doc = self.get_owned(user_id, doc_id)
+            if version is not None and version != self.versions[doc_id]:
+                raise freezer_api_exc.DocumentExists(
+                    message=_i18n._('Version conflict updating document '
+                                    'with ID %s') % doc_id)
+            doc = copy.deepcopy(doc)
+            merge(doc, update_doc)
+            return self.store(doc_id, doc)[1]
+
+    def replace(self, user_id, doc_id, doc, refresh=None):
+        with self.lock:
+            try:
+                self.get_owned(user_id, doc_id)
+            except freezer_api_exc.DocumentNotFound:
+                pass
+            return self.insert(doc, doc_id)
+
+
+class MemoryBackupManager(MemoryTypeManager):
+    """
+    Also keeps, for each user, the sorted list of the backup timestamps
+    to select time ranges without scanning all the backups
+    """
+    sort_field = 'backup_id'
+    ids_per_user = True
+
+    def __init__(self, doc_type, journal=None):
+        MemoryTypeManager.__init__(self, doc_type, journal)
+        self.user_timestamps = {}
+
+    def add_to_index(self, doc_id, doc):
+        MemoryTypeManager.add_to_index(self, doc_id, doc)
+        timestamp = get_backup_timestamp(doc)
+        if timestamp is not None:
+            bisect.insort(self.user_timestamps.setdefault(doc['user_id'], []),
+                          (timestamp, self.get_key(doc, doc_id)))
+
+    def remove_from_index(self, doc_id, doc):
+        MemoryTypeManager.remove_from_index(self, doc_id, doc)
+        timestamp = get_backup_timestamp(doc)
+        if timestamp is None:
+            return
+        timestamps = self.user_timestamps.get(doc.get('user_id'), [])
+        entry = (timestamp, self.get_key(doc, doc_id))
+        pos = bisect.bisect_left(timestamps, entry)
+        if pos < len(timestamps) and timestamps[pos] == entry:
+            del timestamps[pos]
+
+    def get_candidate_keys(self, user_id, keys, search):
+        if 'time_after' not in search and 'time_before' not in search:
+            return keys
+        timestamps = self.user_timestamps.get(user_id, [])
+        start, end = 0, len(timestamps)
+        if 'time_after' in search:
+            start = bisect.bisect_left(
+                timestamps, (int(search['time_after']),))
+        if 'time_before' in search:
+            end = bisect.bisect_left(
+                timestamps, (int(search['time_before']) + 1,))
+        in_range = set(key for _, key in timestamps[start:end])
+        return [key for key in keys if key in in_range]
+
+    def latest(self, user_id, search=None, fields=None):
+        search = search or {}
+        try:
+            with self.lock:
+                return [self.project(doc, fields) for doc in
+                        get_latest_backups(self.scan(user_id, None, search))]
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('search operation failed: %s') % e)
+
+    def stats(self, user_id, search=None):
+        search = search or {}
+        try:
+            with self.lock:
+                return get_backup_stats(self.scan(user_id, None, search))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('stats operation failed: %s') % e)
+
+
+class MemoryClientManager(MemoryTypeManager):
+    sort_field = 'client.client_id'
+    ids_per_user = True
+
+
+class MemoryJobManager(MemoryTypeManager):
+    sort_field = 'job_id'
+
+
+class MemoryActionManager(MemoryTypeManager):
+    sort_field = 'action_id'
+
+
+class MemorySessionManager(MemoryTypeManager):
+    sort_field = 'session_id'
+
+
+class MemoryRetentionManager(MemoryTypeManager):
+    sort_field = 'retention_id'
+
+
+class MemoryEngine(elastic.ElasticSearchEngine):
+    """
+    Storage engine keeping the documents in memory. The elasticsearch
+    connection options are accepted and ignored.
+    """
+
+    def __init__(self, index='freezer', journal=None, **kwargs):
+        self.index = index
+        if journal is None:
+            logging.info(_i18n._LI('Storage backend: in memory'))
+        self.backup_manager = MemoryBackupManager('backups', journal)
+        self.client_manager = MemoryClientManager('clients', journal)
+        self.job_manager = MemoryJobManager('jobs', journal)
+        self.action_manager = MemoryActionManager('actions', journal)
+        self.session_manager = MemorySessionManager('sessions', journal)
+        self.retention_manager = MemoryRetentionManager('retentions',
+                                                        journal)
+
+    def get_managers(self):
+        return [self.backup_manager, self.client_manager, self.job_manager,
+                self.action_manager, self.session_manager,
+                self.retention_manager]
@@ -0,0 +1,118 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Builds the elasticsearch queries used to search the documents of a user.
+
+Conditions on not_analyzed fields (user_id, the ids, ...) are exact matches:
+they are sent as term filters, which are not scored and are cached by
+elasticsearch across requests. Only the conditions on analyzed fields are
+left to match queries.
+"""
+
+from freezer_api.common import db_mappings
+
+
+def get_keyword_fields(mapping, prefix=''):
+    """
+    :param mapping: mapping of a document type, as in db_mappings
+    :return: set of the dotted names of the not_analyzed fields
+    """
+    fields = set()
+    for name, prop in mapping.get('properties', {}).items():
+        path = prefix + name
+        if 'properties' in prop:
+            fields.update(get_keyword_fields(prop, path + '.'))
+        elif prop.get('index') == 'not_analyzed':
+            fields.add(path)
+    return fields
+
+
+def add_filter(query_dsl, query_filter):
+    """
+    Adds a filter to a query made by QueryBuilder.build
+    """
+    query_dsl['query']['filtered']['filter']['bool']['must'].append(
+        query_filter)
+    return query_dsl
+
+
+class QueryBuilder(object):
+    """
+    Builds the search queries of a document type. The set of keyword
+    fields is computed once, when the builder is created.
+    """
+
+    def __init__(self, id_field=None, keyword_fields=None):
+        self.id_field = id_field
+        self.keyword_fields = set(keyword_fields or [])
+        self.keyword_fields.add('user_id')
+        if id_field:
+            self.keyword_fields.add(id_field)
+
+    @classmethod
+    def for_doc_type(cls, doc_type, id_field=None):
+        mapping = db_mappings.get_mappings().get(doc_type, {})
+        return cls(id_field, get_keyword_fields(mapping))
+
+    def get_clauses(self, conditions):
+        """
+        Splits a list of {field: value} conditions into term filters,
+        for the keyword fields, and match queries for the other ones
+
+        :return: (filters, queries) tuple of lists
+        """
+        filters, queries = [], []
+        for condition in conditions:
+            for field, value in condition.items():
+                if field in self.keyword_fields:
+                    filters.append({'term': {field: value}})
+                else:
+                    queries.append({'match': {field: value}})
+        return filters, queries
+
+    def build(self, user_id, doc_id=None, search=None, filters=None,
+              all_users=False):
+        """
+        :param search: dict with the optional 'match' and 'match_not'
+                       lists of {field: value} conditions
+        :param user_id: owner of the documents, a None user_id matches
+                        no document
+        :param filters: additional filters the documents must match
+        :param all_users: leaves out the owner filter, for the admin tasks
+        :return: the query dsl
+        """
+        search = search or {}
+        must_filters = []
+        if not all_users:
+            must_filters.append({'term': {'user_id': user_id}})
+        if doc_id is not None and self.id_field:
+            must_filters.append({'term': {self.id_field: doc_id}})
+        match_filters, match_queries = self.get_clauses(
+            search.get('match', []))
+        not_filters, not_queries = self.get_clauses(
+            search.get('match_not', []))
+        must_filters.extend(match_filters)
+        must_filters.extend(filters or [])
+        if not must_filters:
+            must_filters.append({'match_all': {}})
+
+        bool_filter = {'must': must_filters}
+        if not_filters:
+            bool_filter['must_not'] = not_filters
+        filtered = {'filter': {'bool': bool_filter}}
+        if match_queries or not_queries:
+            filtered['query'] = {'bool': {'must': match_queries,
+                                          'must_not': not_queries}}
+        return {'query': {'filtered': filtered}}
@@ -0,0 +1,428 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+SQLite storage engine.
+
+Meant for the deployments running a single freezer-api, where an
+elasticsearch cluster is not worth its memory. Each document type has its
+table in the database file: the documents are stored as json next to the
+indexed columns used to select them, that is the user_id, the resource id
+used to sort and page the listings and, for backups, the timestamp.
+The match and match_not conditions are evaluated on the documents
+selected through those columns, with the elasticsearch semantics.
+"""
+
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import uuid
+
+from freezer_api.common import _i18n
+from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.storage import elastic
+from freezer_api.storage import memory
+
+IN_MEMORY = ':memory:'
+MAX_PARAMS = 500
+
+
+class Database(object):
+    """
+    Connection to the database, shared by the type managers. A sqlite
+    connection can not be used by several threads at once, so the
+    transactions are serialized by a lock.
+    """
+
+    def __init__(self, path=IN_MEMORY):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != IN_MEMORY:
+            # readers do not block the writer, and the other way round
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            self.conn.execute("SELECT json_extract('{}', '$')")
+            self.json1 = True
+        except sqlite3.OperationalError:
+            self.json1 = False
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Commits the statements executed in the block, or rolls them back
+        when it raises
+        """
+        with self.lock:
+            with self.conn:
+                yield self.conn
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SqliteTypeManager(memory.LocalTypeManager):
+
+    def __init__(self, db, doc_type):
+        memory.LocalTypeManager.__init__(self, doc_type)
+        self.db = db
+        self.table = doc_type
+        self.create_table()
+
+    def create_table(self):
+        with self.db.transaction() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS {0} ('
+                'id TEXT PRIMARY KEY, '
+                'user_id TEXT NOT NULL, '
+                'sort_key TEXT NOT NULL, '
+                'timestamp INTEGER, '
+                'version INTEGER NOT NULL, '
+                'doc TEXT NOT NULL)'.format(self.table))
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_user_sort_key '
+                'ON {0} (user_id, sort_key)'.format(self.table))
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS {0}_user_timestamp '
+                'ON {0} (user_id, timestamp)'.format(self.table))
+
+    def get_key(self, doc, doc_id):
+        values = memory.get_field_values(doc, self.sort_field)
+        return values[0] if values else doc_id
+
+    def get_timestamp(self, doc):
+        return None
+
+    def get_conditions(self, search):
+        """
+        :return: (conditions, params) tuple, the sql conditions on the
+                 indexed columns derived from the search parameters
+        """
+        return [], []
+
+    def get_match_conditions(self, search):
+        """
+        Conditions selecting, with the json1 extension, the documents
+        matching the keyword fields of the search. The documents holding
+        an array on the path of a field, the field itself included, are
+        left to the match in python.
+
+        :return: (conditions, params) tuple
+        """
+        conditions, params = [], []
+        if not self.db.json1:
+            return conditions, params
+        for condition in search.get('match', []):
+            for field, value in condition.items():
+                if field not in self.query_builder.keyword_fields:
+                    continue
+                names = field.split('.')
+                paths = ['$.' + '.'.join(names[:i + 1])
+                         for i in range(len(names))]
+                conditions.append('(json_extract(doc, ?) = ?{0})'.format(
+                    "".join(" OR json_type(doc, ?) = 'array'"
+                            for _ in paths)))
+                params.extend([paths[-1], value] + paths)
+        return conditions, params
+
+    def read(self, conn, doc_id):
+        """
+        :return: (doc, version) tuple, (None, None) when not found
+        """
+        row = conn.execute(
+            'SELECT doc, version FROM {0} WHERE id = ?'.format(self.table),
+            (doc_id,)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def write(self, conn, doc_id, doc, op_type=None):
+        """
+        Stores or overwrites the document
+
+        :return: (created, version) tuple
+        """
+        row = conn.execute(
+            'SELECT version FROM {0} WHERE id = ?'.format(self.table),
+            (doc_id,)).fetchone()
+        if row is not None and op_type == 'create':
+            raise freezer_api_exc.DocumentExists(
+                message=_i18n._('Document already existing with ID %s') %
+                doc_id)
+        version = row[0] + 1 if row is not None else 1
+        conn.execute(
+            'INSERT OR REPLACE INTO {0} '
+            '(id, user_id, sort_key, timestamp, version, doc) '
+            'VALUES (?, ?, ?, ?, ?, ?)'.format(self.table),
+            (doc_id, doc.get('user_id'), self.get_key(doc, doc_id),
+             self.get_timestamp(doc), version, json.dumps(doc)))
+        return row is None, version
+
+    def get(self, user_id, doc_id, fields=None):
+        with self.db.transaction() as conn:
+            doc, version = self.read(conn, doc_id)
+        doc = self.project(self.check_owner(user_id, doc_id, doc), fields)
+        doc['_version'] = version
+        return doc
+
+    def mget(self, user_id, doc_ids, fields=None):
+        doc_ids = elastic.unique(doc_ids)
+        docs = {}
+        try:
+            with self.db.transaction() as conn:
+                # stay below the limit on the number of sql parameters
+                for start in range(0, len(doc_ids), MAX_PARAMS):
+                    chunk = doc_ids[start:start + MAX_PARAMS]
+                    rows = conn.execute(
+                        'SELECT sort_key, doc FROM {0} WHERE user_id = ? '
+                        'AND sort_key IN ({1})'.format(
+                            self.table, ', '.join('?' * len(chunk))),
+                        [user_id] + chunk)
+                    for key, doc in rows:
+                        docs[key] = doc
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('mget operation failed: %s') % e)
+        return [self.project(json.loads(docs[doc_id]), fields)
+                for doc_id in doc_ids if doc_id in docs]
+
+    def get_where(self, user_id, doc_id, search, after=None):
+        """
+        :return: (where clause, params) tuple selecting the documents of
+                 the user, narrowed down by the search where possible
+        """
+        conditions, params = ['user_id = ?'], [user_id]
+        if doc_id is not None:
+            conditions.append('sort_key = ?')
+            params.append(doc_id)
+        if after is not None:
+            conditions.append('sort_key > ?')
+            params.append(after)
+        for get_conditions in [self.get_conditions,
+                               self.get_match_conditions]:
+            search_conditions, search_params = get_conditions(search)
+            conditions.extend(search_conditions)
+            params.extend(search_params)
+        return ' AND '.join(conditions), params
+
+    def search(self, user_id, doc_id=None, search=None, offset=0, limit=10,
+               after=None, fields=None):
+        search = search or {}
+        if after is not None:
+            offset = 0
+        try:
+            where, params = self.get_where(user_id, doc_id, search, after)
+            sql = 'SELECT doc FROM {0} WHERE {1} ORDER BY sort_key'.format(
+                self.table, where)
+            # without match conditions sqlite does the paging by itself
+            matching = search.get('match') or search.get('match_not')
+            if not matching:
+                sql += ' LIMIT ? OFFSET ?'
+                params.extend([limit, offset])
+            results = []
+            with self.db.transaction() as conn:
+                for row in conn.execute(sql, params):
+                    doc = json.loads(row[0])
+                    if matching:
+                        if not self.matches(doc, search):
+                            continue
+                        if offset:
+                            offset -= 1
+                            continue
+                        if len(results) == limit:
+                            break
+                    results.append(self.project(doc, fields))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('search operation failed: %s') % e)
+        return results
+
+    def count(self, user_id, doc_id=None, search=None):
+        search = search or {}
+        try:
+            where, params = self.get_where(user_id, doc_id, search)
+            with self.db.transaction() as conn:
+                if not (search.get('match') or search.get('match_not')):
+                    return conn.execute(
+                        'SELECT COUNT(*) FROM {0} WHERE {1}'.format(
+                            self.table, where), params).fetchone()[0]
+                rows = conn.execute('SELECT doc FROM {0} WHERE {1}'.format(
+                    self.table, where), params)
+                return sum(1 for row in rows
+                           if self.matches(json.loads(row[0]), search))
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('count operation failed: %s') % e)
+
+    def insert(self, doc, doc_id=None, refresh=None, op_type=None):
+        doc = dict(doc)
+        doc.pop('_version', None)
+        doc_id = doc_id or uuid.uuid4().hex
+        with self.db.transaction() as conn:
+            return self.write(conn, doc_id, doc, op_type)
+
+    def bulk_insert(self, docs, refresh=None, op_type='index'):
+        # all the documents are written in a single transaction
+        results = []
+        with self.db.transaction() as conn:
+            for doc_id, doc in docs:
+                doc = dict(doc)
+                doc.pop('_version', None)
+                doc_id = doc_id or uuid.uuid4().hex
+                try:
+                    created, version = self.write(conn, doc_id, doc, op_type)
+                    results.append((True, {'_id': doc_id,
+                                           '_version': version,
+                                           'status': 201 if created else 200}))
+                except freezer_api_exc.DocumentExists as e:
+                    results.append((False, {'_id': doc_id,
+                                            'status': 409,
+                                            'error': e.message}))
+        return results
+
+    def delete(self, user_id, doc_id, refresh=None):
+        with self.db.transaction() as conn:
+            cursor = conn.execute(
+                'DELETE FROM {0} WHERE user_id = ? AND sort_key = ?'.format(
+                    self.table), (user_id, doc_id))
+        return cursor.rowcount
+
+    def mdelete(self, user_id, doc_ids, refresh=None):
+        doc_ids = elastic.unique(doc_ids)
+        deleted = 0
+        with self.db.transaction() as conn:
+            # stay below the limit on the number of sql parameters
+            for start in range(0, len(doc_ids), MAX_PARAMS):
+                chunk = doc_ids[start:start + MAX_PARAMS]
+                cursor = conn.execute(
+                    'DELETE FROM {0} WHERE user_id = ? AND sort_key IN ({1})'
+                    .format(self.table, ', '.join('?' * len(chunk))),
+                    [user_id] + chunk)
+                deleted += cursor.rowcount
+        return deleted
+
+    def get_user_ids(self):
+        with self.db.transaction() as conn:
+            return [row[0] for row in conn.execute(
+                'SELECT DISTINCT user_id FROM {0} ORDER BY user_id'.format(
+                    self.table))]
+
+    def update(self, user_id, doc_id, update_doc, refresh=None,
+               version=None):
+        update_doc.pop('_version', 0)
+        with self.db.transaction() as conn:
+            doc, current_version = self.read(conn, doc_id)
+            self.check_owner(user_id, doc_id, doc)
+            if version is not None and version != current_version:
+                raise freezer_api_exc.DocumentExists(
+                    message=_i18n._('Version conflict updating document '
+                                    'with ID %s') % doc_id)
+            memory.merge(doc, update_doc)
+            return self.write(conn, doc_id, doc)[1]
+
+    def replace(self, user_id, doc_id, doc, refresh=None):
+        doc = dict(doc)
+        doc.pop('_version', None)
+        with self.db.transaction() as conn:
+            old_doc, _ = self.read(conn, doc_id)
+            if old_doc is not None:
+                self.check_owner(user_id, doc_id, old_doc)
+            return self.write(conn, doc_id, doc)
+
+
+class SqliteBackupManager(SqliteTypeManager):
+    sort_field = 'backup_id'
+    ids_per_user = True
+
+    def get_timestamp(self, doc):
+        return memory.get_backup_timestamp(doc)
+
+    def get_conditions(self, search):
+        conditions, params = [], []
+        if 'time_after' in search:
+            conditions.append('timestamp >= ?')
+            params.append(int(search['time_after']))
+        if 'time_before' in search:
+            conditions.append('timestamp <= ?')
+            params.append(int(search['time_before']))
+        return conditions, params
+
+    def select(self, user_id, search, operation):
+        """
+        :return: list of all the documents of the user matching the search
+        """
+        try:
+            where, params = self.get_where(user_id, None, search)
+            with self.db.transaction() as conn:
+                docs = [json.loads(row[0]) for row in conn.execute(
+                    'SELECT doc FROM {0} WHERE {1}'.format(self.table, where),
+                    params)]
+        except Exception as e:
+            raise freezer_api_exc.StorageEngineError(
+                message=_i18n._('%(operation)s operation failed: %(error)s') %
+                {'operation': operation, 'error': e})
+        return [doc for doc in docs if self.matches(doc, search)]
+
+    def latest(self, user_id, search=None, fields=None):
+        docs = self.select(user_id, search or {}, 'search')
+        return [self.project(doc, fields)
+                for doc in memory.get_latest_backups(docs)]
+
+    def stats(self, user_id, search=None):
+        return memory.get_backup_stats(
+            self.select(user_id, search or {}, 'stats'))
+
+
+class SqliteClientManager(SqliteTypeManager):
+    sort_field = 'client.client_id'
+    ids_per_user = True
+
+
+class SqliteJobManager(SqliteTypeManager):
+    sort_field = 'job_id'
+
+
+class SqliteActionManager(SqliteTypeManager):
+    sort_field = 'action_id'
+
+
+class SqliteSessionManager(SqliteTypeManager):
+    sort_field = 'session_id'
+
+
+class SqliteRetentionManager(SqliteTypeManager):
+    sort_field = 'retention_id'
+
+
+class SqliteEngine(elastic.ElasticSearchEngine):
+    """
+    Storage engine keeping the documents in a sqlite database file. The
+    elasticsearch connection options are accepted and ignored.
+    """
+
+    def __init__(self, sqlite_path=IN_MEMORY, index='freezer', **kwargs):
+        self.index = index
+        logging.info(_i18n._LI('Storage backend: sqlite database at %s') %
+                     sqlite_path)
+        self.db = Database(sqlite_path)
+        self.backup_manager = SqliteBackupManager(self.db, 'backups')
+        self.client_manager = SqliteClientManager(self.db, 'clients')
+        self.job_manager = SqliteJobManager(self.db, 'jobs')
+        self.action_manager = SqliteActionManager(self.db, 'actions')
+        self.session_manager = SqliteSessionManager(self.db, 'sessions')
+        self.retention_manager = SqliteRetentionManager(self.db, 'retentions')
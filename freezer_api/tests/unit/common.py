@@ -103,6 +103,11 @@ fake_malformed_data_0_backup_metadata = {
     "cli": ""
 }
 
+def get_fake_backup_metadata(**kwargs):
+    backup_metadata = copy.deepcopy(fake_data_0_backup_metadata)
+    backup_metadata.update(kwargs)
+    return backup_metadata
+
 
 fake_data_0_elasticsearch_hit = {
     "_shards": {
@@ -402,6 +407,19 @@ def get_fake_session_1():
     return copy.deepcopy(fake_session_1)
 
 
+fake_retention_0 = {
+    "retention_id": "keepthreechains",
+    "user_id": "f4db4da085f043059441565720b217c7",
+    "description": "three full backups of alpha",
+    "hostname": "alpha",
+    "keep_last": 3
+}
+
+
+def get_fake_retention_0():
+    return copy.deepcopy(fake_retention_0)
+
+
 class FakeReqResp:
 
     def __init__(self, method='GET', body=''):
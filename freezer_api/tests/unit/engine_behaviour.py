@@ -0,0 +1,425 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Tests of the behaviour expected from every storage engine, shared by the
+test cases of the engines storing documents by themselves. A test case
+mixes StorageEngineBehaviour in and sets self.eng in setUp.
+"""
+
+from mock import patch
+
+from freezer_api.common.exceptions import AccessForbidden
+from freezer_api.common.exceptions import BadDataFormat
+from freezer_api.common.exceptions import DocumentExists
+from freezer_api.common.exceptions import DocumentNotFound
+from freezer_api.common.utils import BackupMetadataDoc
+
+from .common import fake_client_info_0
+from .common import fake_client_info_1
+from .common import fake_data_0_backup_metadata
+from .common import fake_data_0_user_id
+from .common import fake_data_0_user_name
+from .common import fake_malformed_data_0_backup_metadata
+from .common import get_fake_action_0
+from .common import get_fake_backup_metadata
+from .common import get_fake_job_0
+from .common import get_fake_retention_0
+from .common import get_fake_session_0
+
+OTHER_USER_ID = 'somebody_else'
+
+
+class StorageEngineBehaviour(object):
+
+    def add_backups(self, *time_stamps):
+        docs = [get_fake_backup_metadata(time_stamp=t, timestamp=t)
+                for t in time_stamps]
+        self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name, docs)
+        return [BackupMetadataDoc(fake_data_0_user_id, '', doc).backup_id
+                for doc in docs]
+
+    def test_add_backup_and_get_it_back(self):
+        backup_id = self.eng.add_backup(fake_data_0_user_id,
+                                        fake_data_0_user_name,
+                                        get_fake_backup_metadata())
+        res = self.eng.get_backup(fake_data_0_user_id, backup_id)
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['backup_id'], backup_id)
+        self.assertEqual(res[0]['backup_metadata'], fake_data_0_backup_metadata)
+
+    def test_add_backup_raises_DocumentExists_on_duplicate(self):
+        self.eng.add_backup(fake_data_0_user_id, fake_data_0_user_name,
+                            get_fake_backup_metadata())
+        self.assertRaises(DocumentExists, self.eng.add_backup,
+                          fake_data_0_user_id, fake_data_0_user_name,
+                          get_fake_backup_metadata())
+
+    def test_backup_ids_are_unique_per_user(self):
+        backup_id = self.eng.add_backup(fake_data_0_user_id,
+                                        fake_data_0_user_name,
+                                        get_fake_backup_metadata())
+        self.assertEqual(self.eng.add_backup(OTHER_USER_ID, 'other',
+                                             get_fake_backup_metadata()),
+                         backup_id)
+        self.assertEqual(self.eng.delete_backup(OTHER_USER_ID, backup_id), 1)
+        self.assertEqual(len(self.eng.get_backup(fake_data_0_user_id,
+                                                 backup_id)), 1)
+        self.assertEqual(self.eng.get_backup(OTHER_USER_ID, backup_id), [])
+
+    def test_add_backup_raises_BadDataFormat_on_malformed_doc(self):
+        self.assertRaises(BadDataFormat, self.eng.add_backup,
+                          fake_data_0_user_id, fake_data_0_user_name,
+                          fake_malformed_data_0_backup_metadata)
+
+    def test_add_backups_reports_status_of_each_document(self):
+        ids = self.add_backups(1)
+        docs = [get_fake_backup_metadata(time_stamp=1),
+                get_fake_backup_metadata(time_stamp=2),
+                fake_malformed_data_0_backup_metadata]
+        res = self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name,
+                                   docs)
+        self.assertEqual([r['status'] for r in res],
+                         ['conflict', 'created', 'error'])
+        self.assertEqual(res[0]['backup_id'], ids[0])
+
+    def test_get_backup_lists_backups_of_the_user_sorted_by_id(self):
+        ids = self.add_backups(3, 1, 2)
+        self.eng.add_backup(OTHER_USER_ID, '', get_fake_backup_metadata())
+        res = self.eng.get_backup(fake_data_0_user_id)
+        self.assertEqual([b['backup_id'] for b in res], sorted(ids))
+
+    def test_get_backup_pages_with_offset_and_after(self):
+        ids = sorted(self.add_backups(1, 2, 3, 4, 5))
+        res = self.eng.get_backup(fake_data_0_user_id, offset=1, limit=2)
+        self.assertEqual([b['backup_id'] for b in res], ids[1:3])
+        res = self.eng.get_backup(fake_data_0_user_id, offset=3, limit=2,
+                                  after=ids[2])
+        self.assertEqual([b['backup_id'] for b in res], ids[3:5])
+
+    def test_get_backup_filters_on_time_range(self):
+        ids = self.add_backups(10, 20, 30, 40)
+        res = self.eng.get_backup(fake_data_0_user_id,
+                                  search={'time_after': 20,
+                                          'time_before': 30})
+        self.assertEqual(sorted(b['backup_id'] for b in res),
+                         sorted(ids[1:3]))
+
+    def test_get_backup_matches_exact_keyword_and_any_word(self):
+        self.add_backups(1)
+        search = {'match': [{'backup_metadata.container': 'freezer_container'}]}
+        self.assertEqual(len(self.eng.get_backup(fake_data_0_user_id,
+                                                 search=search)), 1)
+        search = {'match': [{'backup_metadata.container': 'freezer'}]}
+        self.assertEqual(self.eng.get_backup(fake_data_0_user_id,
+                                             search=search), [])
+        search = {'match': [{'backup_metadata.fs_real_path': 'blabla'}]}
+        self.assertEqual(len(self.eng.get_backup(fake_data_0_user_id,
+                                                 search=search)), 1)
+        search = {'match_not': [{'backup_metadata.fs_real_path': 'blabla'}]}
+        self.assertEqual(self.eng.get_backup(fake_data_0_user_id,
+                                             search=search), [])
+
+    def test_count_backup_counts_the_matching_backups_of_the_user(self):
+        self.add_backups(10, 20, 30)
+        self.eng.add_backup(OTHER_USER_ID, '',
+                            get_fake_backup_metadata(time_stamp=40))
+        self.assertEqual(self.eng.count_backup(fake_data_0_user_id), 3)
+        self.assertEqual(self.eng.count_backup(
+            fake_data_0_user_id, search={'time_after': 20}), 2)
+        search = {'match': [{'backup_metadata.fs_real_path': 'blabla'}],
+                  'time_before': 10}
+        self.assertEqual(self.eng.count_backup(fake_data_0_user_id,
+                                               search=search), 1)
+        search = {'match_not': [{'backup_metadata.fs_real_path': 'blabla'}]}
+        self.assertEqual(self.eng.count_backup(fake_data_0_user_id,
+                                               search=search), 0)
+
+    def test_get_backup_stats_aggregates_per_backup_set(self):
+        self.add_backups(10, 20)
+        docs = [get_fake_backup_metadata(time_stamp=30, timestamp=30,
+                                         hostname='beta'),
+                get_fake_backup_metadata(time_stamp=40, timestamp=40,
+                                         hostname='beta',
+                                         backup_size_compressed=None)]
+        self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name, docs)
+        self.eng.add_backup(OTHER_USER_ID, '', get_fake_backup_metadata())
+        res = self.eng.get_backup_stats(fake_data_0_user_id)
+        backup_set = {'container': 'freezer_container',
+                      'backup_name': 'important_data_backup'}
+        self.assertEqual(res, [
+            dict(backup_set, hostname='alpha', count=2, latest_timestamp=20,
+                 backup_size_compressed=2424, backup_size_uncompressed=9134,
+                 total_backup_session_size=13578),
+            dict(backup_set, hostname='beta', count=2, latest_timestamp=40,
+                 backup_size_compressed=1212, backup_size_uncompressed=9134,
+                 total_backup_session_size=13578)])
+        res = self.eng.get_backup_stats(fake_data_0_user_id,
+                                        search={'time_after': 20,
+                                                'time_before': 30})
+        self.assertEqual([(s['hostname'], s['count']) for s in res],
+                         [('alpha', 1), ('beta', 1)])
+
+    def test_get_latest_backups_returns_one_backup_per_set(self):
+        docs = [get_fake_backup_metadata(time_stamp=t, timestamp=t,
+                                         hostname=host, curr_backup_level=level)
+                for t, host, level in [(10, 'alpha', 0), (30, 'alpha', 1),
+                                       (20, 'alpha', 2), (15, 'beta', 0),
+                                       (25, 'beta', 0)]]
+        self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name, docs)
+        self.eng.add_backup(OTHER_USER_ID, '',
+                            get_fake_backup_metadata(time_stamp=50,
+                                                     timestamp=50))
+        res = self.eng.get_latest_backups(fake_data_0_user_id)
+        self.assertEqual([(b['backup_set_id'],
+                           b['backup_metadata']['timestamp']) for b in res],
+                         [('freezer_container_alpha_important_data_backup', 30),
+                          ('freezer_container_beta_important_data_backup', 25)])
+        # newest level 0 of a set
+        search = {'match': [
+            {'backup_set_id': 'freezer_container_alpha_important_data_backup'},
+            {'backup_metadata.curr_backup_level': 0}]}
+        res = self.eng.get_latest_backups(fake_data_0_user_id, search=search,
+                                          fields=['backup_metadata.timestamp'])
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['backup_metadata'], {'timestamp': 10})
+
+    def test_get_backup_returns_only_requested_fields(self):
+        self.add_backups(1)
+        res = self.eng.get_backup(fake_data_0_user_id,
+                                  fields=['backup_metadata.container'])
+        self.assertEqual(res[0], {
+            'backup_id': res[0]['backup_id'],
+            'user_id': fake_data_0_user_id,
+            'backup_metadata': {'container': 'freezer_container'}})
+
+    def test_mget_backup_returns_the_found_backups_of_the_user(self):
+        ids = self.add_backups(1, 2)
+        self.eng.add_backup(OTHER_USER_ID, '',
+                            get_fake_backup_metadata(time_stamp=3))
+        other_id = self.eng.get_backup(OTHER_USER_ID)[0]['backup_id']
+        res = self.eng.mget_backup(fake_data_0_user_id,
+                                   [ids[1], 'nothere', other_id, ids[0],
+                                    ids[1]])
+        self.assertEqual([b['backup_id'] for b in res], [ids[1], ids[0]])
+        res = self.eng.mget_backup(fake_data_0_user_id, ids,
+                                   fields=['backup_id'])
+        self.assertEqual(res, [{'backup_id': i, 'user_id': fake_data_0_user_id}
+                               for i in ids])
+
+    def test_mget_client_uses_the_client_ids(self):
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_1))
+        res = self.eng.mget_client(fake_data_0_user_id,
+                                   [fake_client_info_1['client_id'],
+                                    fake_client_info_0['client_id']])
+        self.assertEqual([c['client'] for c in res],
+                         [fake_client_info_1, fake_client_info_0])
+
+    def test_delete_backup_removes_only_the_backup(self):
+        ids = self.add_backups(1, 2)
+        self.eng.delete_backup(fake_data_0_user_id, ids[0])
+        res = self.eng.get_backup(fake_data_0_user_id)
+        self.assertEqual([b['backup_id'] for b in res], [ids[1]])
+        self.assertEqual(self.eng.get_backup(
+            fake_data_0_user_id, search={'time_before': 1}), [])
+
+    def test_add_client_and_get_it_back(self):
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_1))
+        res = self.eng.get_client(fake_data_0_user_id,
+                                  fake_client_info_1['client_id'])
+        self.assertEqual(len(res), 1)
+        self.assertEqual(res[0]['client'], fake_client_info_1)
+        self.assertEqual(len(self.eng.get_client(fake_data_0_user_id)), 2)
+
+    def test_get_client_keeps_the_client_id_when_client_is_excluded(self):
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        res = self.eng.get_client(fake_data_0_user_id, fields=['-client'])
+        self.assertEqual(res[0]['client']['client_id'],
+                         fake_client_info_0['client_id'])
+
+    def test_add_client_raises_DocumentExists_on_duplicate(self):
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        self.assertRaises(DocumentExists, self.eng.add_client,
+                          fake_data_0_user_id, dict(fake_client_info_0))
+        # client ids are unique per user only
+        self.eng.add_client(OTHER_USER_ID, dict(fake_client_info_0))
+
+    def test_delete_client(self):
+        self.eng.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        self.eng.delete_client(fake_data_0_user_id,
+                               fake_client_info_0['client_id'])
+        self.assertEqual(self.eng.get_client(fake_data_0_user_id), [])
+
+    def test_add_job_and_get_it_back(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        job = self.eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['job_id'], job_id)
+        self.assertEqual(job['user_id'], fake_data_0_user_id)
+        self.assertIn('_version', job)
+
+    def test_get_job_raises_AccessForbidden_for_other_user(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.assertRaises(AccessForbidden, self.eng.get_job,
+                          OTHER_USER_ID, job_id)
+
+    def test_get_job_raises_DocumentNotFound_when_missing(self):
+        self.assertRaises(DocumentNotFound, self.eng.get_job,
+                          fake_data_0_user_id, 'nothere')
+
+    def test_update_job_merges_patch_and_increments_version(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        version = self.eng.get_job(fake_data_0_user_id, job_id)['_version']
+        new_version = self.eng.update_job(
+            fake_data_0_user_id, job_id,
+            {'job_schedule': {'status': 'running'}})
+        self.assertEqual(new_version, version + 1)
+        job = self.eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['job_schedule']['status'], 'running')
+        self.assertEqual(job['job_schedule']['result'], 'success')
+
+    def test_update_job_raises_AccessForbidden_for_other_user(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.assertRaises(AccessForbidden, self.eng.update_job,
+                          OTHER_USER_ID, job_id, {'description': 'mine'})
+        job = self.eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['description'], 'test action 4')
+
+    def test_update_job_raises_DocumentNotFound_when_missing(self):
+        self.assertRaises(DocumentNotFound, self.eng.update_job,
+                          fake_data_0_user_id, 'nothere',
+                          {'description': 'new'})
+
+    def test_replace_job_creates_then_overwrites(self):
+        job_id = 'my_job_id'
+        self.eng.replace_job(fake_data_0_user_id, job_id, get_fake_job_0())
+        doc = get_fake_job_0()
+        doc['description'] = 'replaced'
+        self.eng.replace_job(fake_data_0_user_id, job_id, doc)
+        job = self.eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['description'], 'replaced')
+        self.assertRaises(AccessForbidden, self.eng.replace_job,
+                          OTHER_USER_ID, job_id, get_fake_job_0())
+
+    def test_search_job_and_delete_job(self):
+        job_ids = [self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+                   for _ in range(3)]
+        res = self.eng.search_job(fake_data_0_user_id, fields=['job_id'])
+        self.assertEqual(res, [{'job_id': j, 'user_id': fake_data_0_user_id}
+                               for j in sorted(job_ids)])
+        self.eng.delete_job(fake_data_0_user_id, job_ids[0])
+        self.assertEqual(len(self.eng.search_job(fake_data_0_user_id)), 2)
+
+    def test_search_job_matches_keyword_fields_under_arrays(self):
+        doc = get_fake_job_0()
+        doc['job_actions'][1]['user_id'] = 'action_owner'
+        doc['job_actions'][1]['freezer_action']['ssh_key'] = '/root/key'
+        self.eng.add_job(fake_data_0_user_id, doc)
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        for condition in [{'job_actions.user_id': 'action_owner'},
+                          {'job_actions.freezer_action.ssh_key':
+                           '/root/key'}]:
+            search = {'match': [condition]}
+            self.assertEqual(len(self.eng.search_job(fake_data_0_user_id,
+                                                     search=search)), 1)
+            self.assertEqual(self.eng.count_job(fake_data_0_user_id,
+                                                search=search), 1)
+
+    def test_action_lifecycle(self):
+        action_id = self.eng.add_action(fake_data_0_user_id,
+                                        get_fake_action_0())
+        self.eng.update_action(fake_data_0_user_id, action_id,
+                               {'max_retries': 5})
+        action = self.eng.get_action(fake_data_0_user_id, action_id)
+        self.assertEqual(action['max_retries'], 5)
+        self.assertEqual(
+            [a['action_id'] for a in self.eng.search_action(
+                fake_data_0_user_id)], [action_id])
+        self.eng.delete_action(fake_data_0_user_id, action_id)
+        self.assertEqual(self.eng.search_action(fake_data_0_user_id), [])
+
+    def test_add_actions_stores_new_actions_only(self):
+        action_ids = self.eng.add_actions(
+            fake_data_0_user_id, [get_fake_action_0(), {'freezer_action': {}}])
+        res = self.eng.mget_action(fake_data_0_user_id, action_ids)
+        self.assertEqual([a['action_id'] for a in res], action_ids)
+        self.assertRaises(DocumentExists, self.eng.add_actions,
+                          fake_data_0_user_id, [get_fake_action_0()])
+
+    def test_update_session_raises_DocumentExists_on_stale_version(self):
+        session_id = self.eng.add_session(fake_data_0_user_id,
+                                          get_fake_session_0())
+        version = self.eng.get_session(fake_data_0_user_id,
+                                       session_id)['_version']
+        self.eng.update_session(fake_data_0_user_id, session_id,
+                                {'status': 'running'}, version=version)
+        self.assertRaises(DocumentExists, self.eng.update_session,
+                          fake_data_0_user_id, session_id,
+                          {'status': 'completed'}, version=version)
+        session = self.eng.get_session(fake_data_0_user_id, session_id)
+        self.assertEqual(session['status'], 'running')
+
+    def test_delete_backups_removes_only_the_backups_of_the_user(self):
+        ids = self.add_backups(1, 2, 3)
+        self.assertEqual(self.eng.delete_backups(OTHER_USER_ID, ids), 0)
+        self.assertEqual(self.eng.delete_backups(
+            fake_data_0_user_id, ids[:2] + ['nothere']), 2)
+        res = self.eng.get_backup(fake_data_0_user_id)
+        self.assertEqual([b['backup_id'] for b in res], [ids[2]])
+
+    def test_export_pages_through_the_documents_of_the_user(self):
+        ids = self.add_backups(*range(1, 8))
+        self.eng.add_retention(OTHER_USER_ID, {'keep_last': 1})
+        with patch('freezer_api.storage.elastic.BULK_CHUNK_SIZE', 3):
+            res = list(self.eng.export('backups', fake_data_0_user_id,
+                                       fields=['backup_id']))
+        self.assertEqual(sorted(b['backup_id'] for b in res), sorted(ids))
+        self.assertEqual(list(self.eng.export('backups', OTHER_USER_ID)), [])
+
+    def test_export_of_all_users(self):
+        self.eng.add_retention(fake_data_0_user_id, {'keep_last': 1})
+        self.eng.add_retention(OTHER_USER_ID, {'keep_last': 1,
+                                               'hostname': 'beta'})
+        res = self.eng.export_all('retentions',
+                                  search={'match': [{'hostname': 'beta'}]})
+        self.assertEqual([r['user_id'] for r in res], [OTHER_USER_ID])
+        self.assertRaises(BadDataFormat, self.eng.export_all, 'nothing')
+
+    def test_missing_user_id_reads_and_deletes_nothing(self):
+        ids = self.add_backups(1, 2)
+        self.assertEqual(self.eng.get_backup(None), [])
+        self.assertEqual(self.eng.count_backup(None), 0)
+        self.assertEqual(list(self.eng.export('backups', None)), [])
+        self.assertEqual(self.eng.delete_backup(None, ids[0]), 0)
+        self.assertEqual(self.eng.delete_backups(None, ids), 0)
+        self.assertEqual(self.eng.count_backup(fake_data_0_user_id), 2)
+
+    def test_retention_lifecycle(self):
+        retention_id = self.eng.add_retention(fake_data_0_user_id,
+                                              get_fake_retention_0())
+        self.eng.update_retention(fake_data_0_user_id, retention_id,
+                                  {'keep_days': 90})
+        doc = self.eng.get_retention(fake_data_0_user_id, retention_id)
+        self.assertEqual((doc['keep_last'], doc['keep_days']), (3, 90))
+        self.assertRaises(BadDataFormat, self.eng.add_retention,
+                          fake_data_0_user_id, {'hostname': 'alpha'})
+        self.eng.add_retention(OTHER_USER_ID, {'keep_last': 1})
+        self.assertEqual(len(self.eng.search_retention(fake_data_0_user_id)),
+                         1)
+        self.assertEqual(sorted(r['user_id']
+                                for r in self.eng.scan_retentions()),
+                         sorted([fake_data_0_user_id, OTHER_USER_ID]))
+        self.eng.delete_retention(fake_data_0_user_id, retention_id)
+        self.assertEqual(self.eng.search_retention(fake_data_0_user_id), [])
@@ -33,6 +33,9 @@ class TestActionsCollectionResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_action_0['user_id']
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_actions.ActionsCollectionResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -75,6 +78,7 @@ class TestActionsResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_action_0['user_id']
+        self.mock_req.get_param.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_actions.ActionsResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -121,7 +125,7 @@ class TestActionsResource(unittest.TestCase):
         self.mock_db.update_action.assert_called_with(
             user_id=fake_action_0['user_id'],
             action_id=fake_action_0['action_id'],
-            patch_doc=patch_doc)
+            patch_doc=patch_doc, refresh=None)
         self.assertEqual(self.mock_req.status, falcon.HTTP_200)
         result = self.mock_req.body
         self.assertEqual(result, expected_result)
@@ -0,0 +1,57 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+from mock import Mock, patch
+
+from freezer_api.cmd import api
+
+
+@patch('freezer_api.cmd.api.deploy')
+@patch('freezer_api.cmd.api.config')
+class TestMain(unittest.TestCase):
+
+    def get_conf(self, **opts):
+        mock_conf = Mock()
+        mock_conf.get.side_effect = lambda name, default=None: opts.get(
+            name, default)
+        return mock_conf
+
+    @patch('freezer_api.cmd.api.httpserver')
+    def test_main_serves_with_paste_by_default(self, mock_httpserver,
+                                               mock_config, mock_deploy):
+        with patch('freezer_api.cmd.api.CONF', self.get_conf()):
+            api.main()
+        mock_httpserver.serve.assert_called_once_with(
+            application=mock_deploy.loadapp.return_value,
+            host='0.0.0.0', port=9090)
+
+    @patch('freezer_api.cmd.api.httpserver')
+    @patch('freezer_api.cmd.api.load_eventlet')
+    def test_main_serves_with_eventlet(self, mock_load_eventlet,
+                                       mock_httpserver, mock_config,
+                                       mock_deploy):
+        mock_eventlet = mock_load_eventlet.return_value
+        mock_deploy.loadapp.side_effect = lambda *args, **kwargs: (
+            self.assertTrue(mock_eventlet.monkey_patch.called))
+        conf = self.get_conf(server='eventlet', max_concurrency=500)
+        with patch('freezer_api.cmd.api.CONF', conf):
+            api.main()
+        mock_eventlet.listen.assert_called_once_with(('0.0.0.0', 9090))
+        mock_eventlet.wsgi.server.assert_called_once_with(
+            mock_eventlet.listen.return_value, None, max_size=500)
+        self.assertFalse(mock_httpserver.serve.called)
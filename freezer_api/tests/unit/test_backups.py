@@ -16,6 +16,8 @@ limitations under the License.
 
 """
 
+import io
+import json
 import unittest
 from mock import Mock, patch
 
@@ -32,6 +34,9 @@ class TestBackupsCollectionResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = {'X-User-ID': fake_data_0_user_id}
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = backups.BackupsCollectionResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -54,6 +59,85 @@ class TestBackupsCollectionResource(unittest.TestCase):
         self.assertEqual(result, expected_result)
         self.assertEqual(self.mock_req.status, falcon.HTTP_200)
 
+    def test_on_get_return_next_cursor_when_page_is_full(self):
+        self.mock_req.get_param_as_int.return_value = 1
+        self.mock_db.get_backup.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.resource.on_get(self.mock_req, self.mock_req)
+        result = self.mock_req.body
+        self.assertEqual(result['backups'], [fake_data_0_wrapped_backup_metadata])
+        self.assertEqual(self.resource.make_cursor(fake_data_0_backup_id),
+                         result['next'])
+
+    def test_on_get_uses_cursor_from_request(self):
+        self.mock_req.get_param_as_int.return_value = 10
+        self.mock_req.get_param.return_value = \
+            self.resource.make_cursor(fake_data_0_backup_id)
+        self.mock_db.get_backup.return_value = []
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_db.get_backup.assert_called_with(
+            user_id={'X-User-ID': fake_data_0_user_id}, offset=10, limit=10,
+            search={}, after=fake_data_0_backup_id, fields=None)
+        self.assertEqual(self.mock_req.body, {'backups': []})
+
+    def test_on_get_passes_requested_fields(self):
+        self.mock_req.get_param_as_int.return_value = 10
+        self.mock_req.get_param_as_list.side_effect = lambda name: {
+            'fields': ['backup_id', '-backup_metadata']}.get(name)
+        self.mock_db.get_backup.return_value = []
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(self.mock_db.get_backup.call_args[1]['fields'],
+                         ['backup_id', '-backup_metadata'])
+        self.mock_req.get_param_as_list.assert_called_with('fields')
+
+    def test_on_get_adds_the_total_when_requested(self):
+        self.mock_req.get_param_as_bool.side_effect = lambda name: {
+            'total': True}.get(name)
+        self.mock_db.get_backup.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.mock_db.count_backup.return_value = 42
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_req.get_param_as_bool.assert_called_with('total')
+        self.assertEqual(self.mock_req.body['total'], 42)
+        self.mock_req.set_header.assert_called_once_with('X-Total-Count', '42')
+        self.assertEqual(self.mock_db.count_backup.call_args[1]['search'], {})
+
+    def test_on_get_does_not_count_by_default(self):
+        self.mock_db.get_backup.return_value = []
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertFalse(self.mock_db.count_backup.called)
+        self.assertNotIn('total', self.mock_req.body)
+
+    def test_on_get_latest_gets_the_latest_backup_of_each_set(self):
+        self.mock_req.get_param_as_bool.side_effect = lambda name: {
+            'latest': True}.get(name)
+        self.mock_db.get_latest_backups.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(self.mock_db.get_latest_backups.call_args[1]['search'], {})
+        self.assertEqual(self.mock_req.body,
+                         {'backups': [fake_data_0_wrapped_backup_metadata]})
+        self.assertFalse(self.mock_db.get_backup.called)
+
+    def test_on_get_with_ids_gets_the_backups_by_id(self):
+        self.mock_req.get_param_as_list.side_effect = lambda name: {
+            'ids': ['b1', 'b2']}.get(name)
+        self.mock_db.mget_backup.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(self.mock_db.mget_backup.call_args[1]['backup_ids'],
+                         ['b1', 'b2'])
+        self.assertEqual(self.mock_req.body,
+                         {'backups': [fake_data_0_wrapped_backup_metadata]})
+        self.assertFalse(self.mock_db.get_backup.called)
+
+    def test_on_get_raises_BadDataFormat_when_too_many_ids(self):
+        self.mock_req.get_param_as_list.side_effect = lambda name: {
+            'ids': ['b'] * 1001}.get(name)
+        self.assertRaises(BadDataFormat, self.resource.on_get,
+                          self.mock_req, self.mock_req)
+
+    def test_on_get_raises_BadDataFormat_when_cursor_is_invalid(self):
+        self.mock_req.get_param.return_value = 'not-a-cursor'
+        self.assertRaises(BadDataFormat, self.resource.on_get,
+                          self.mock_req, self.mock_req)
+
     def test_on_post_raises_when_missing_body(self):
         self.mock_db.add_backup.return_value = [fake_data_0_wrapped_backup_metadata['backup_id']]
         expected_result = {'backup_id': fake_data_0_wrapped_backup_metadata['backup_id']}
@@ -69,12 +153,149 @@ class TestBackupsCollectionResource(unittest.TestCase):
         self.assertEqual(self.mock_req.status, falcon.HTTP_201)
 
 
+class TestBackupsBulkResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.get_param.return_value = None
+        self.mock_req.status = falcon.HTTP_200
+        self.resource = backups.BackupsBulkResource(self.mock_db)
+
+    def test_on_post_raises_when_missing_body(self):
+        self.mock_req.content_length = 0
+        self.assertRaises(BadDataFormat, self.resource.on_post, self.mock_req, self.mock_req)
+
+    def test_on_post_accepts_json_array(self):
+        body = json.dumps([fake_data_0_backup_metadata, fake_data_0_backup_metadata])
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+        self.mock_db.add_backups.return_value = [
+            {'backup_id': fake_data_0_backup_id, 'status': 'created'},
+            {'backup_id': fake_data_0_backup_id, 'status': 'conflict'}]
+        self.resource.on_post(self.mock_req, self.mock_req)
+        self.mock_db.add_backups.assert_called_with(
+            user_id=fake_data_0_user_id, user_name=fake_data_0_user_id,
+            docs=[fake_data_0_backup_metadata, fake_data_0_backup_metadata],
+            refresh=None)
+        self.assertEqual(self.mock_req.body,
+                         {'backups': self.mock_db.add_backups.return_value})
+        self.assertEqual(self.mock_req.status, falcon.HTTP_200)
+
+    def test_on_post_accepts_ndjson(self):
+        body = '\n'.join([json.dumps(fake_data_0_backup_metadata),
+                          '',
+                          json.dumps(fake_data_0_backup_metadata)])
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+        self.resource.on_post(self.mock_req, self.mock_req)
+        self.mock_db.add_backups.assert_called_with(
+            user_id=fake_data_0_user_id, user_name=fake_data_0_user_id,
+            docs=[fake_data_0_backup_metadata, fake_data_0_backup_metadata],
+            refresh=None)
+
+    def test_on_post_passes_the_refresh_parameter(self):
+        body = json.dumps([fake_data_0_backup_metadata])
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+        self.mock_req.get_param.return_value = 'none'
+        self.resource.on_post(self.mock_req, self.mock_req)
+        self.mock_db.add_backups.assert_called_with(
+            user_id=fake_data_0_user_id, user_name=fake_data_0_user_id,
+            docs=[fake_data_0_backup_metadata], refresh='none')
+
+    def test_on_post_raises_on_malformed_json(self):
+        body = '{"container": '
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+        self.assertRaises(BadDataFormat, self.resource.on_post,
+                          self.mock_req, self.mock_req)
+
+
+class TestBackupsMgetResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
+        self.mock_req.status = falcon.HTTP_200
+        self.resource = backups.BackupsMgetResource(self.mock_db)
+
+    def set_body(self, doc):
+        body = json.dumps(doc)
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+
+    def test_on_post_gets_the_backups_by_id(self):
+        self.set_body({'ids': ['b1', 'b2']})
+        self.mock_db.mget_backup.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.resource.on_post(self.mock_req, self.mock_req)
+        self.mock_db.mget_backup.assert_called_once_with(
+            user_id=fake_data_0_user_id, backup_ids=['b1', 'b2'], fields=None)
+        self.assertEqual(self.mock_req.body,
+                         {'backups': [fake_data_0_wrapped_backup_metadata]})
+
+    def test_on_post_raises_BadDataFormat_without_list_of_ids(self):
+        for doc in [['b1'], {'ids': 'b1'}, {'ids': [1, 2]}, {}]:
+            self.set_body(doc)
+            self.assertRaises(BadDataFormat, self.resource.on_post,
+                              self.mock_req, self.mock_req)
+        self.assertFalse(self.mock_db.mget_backup.called)
+
+    def test_on_post_raises_BadDataFormat_when_too_many_ids(self):
+        self.set_body({'ids': ['b'] * 1001})
+        self.assertRaises(BadDataFormat, self.resource.on_post,
+                          self.mock_req, self.mock_req)
+
+
+class TestBackupsCountResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.content_length = 0
+        self.resource = backups.BackupsCountResource(self.mock_db)
+
+    def test_on_get_counts_the_backups_matching_the_search(self):
+        search = {'match': [{'backup_metadata.hostname': 'host_x'}]}
+        body = json.dumps(search)
+        self.mock_req.content_length = len(body)
+        self.mock_req.stream = io.BytesIO(body.encode('utf-8'))
+        self.mock_db.count_backup.return_value = 7
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_db.count_backup.assert_called_once_with(
+            user_id=fake_data_0_user_id, search=search)
+        self.assertEqual(self.mock_req.body, {'count': 7})
+
+
+class TestBackupsStatsResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.content_length = 0
+        self.resource = backups.BackupsStatsResource(self.mock_db)
+
+    def test_on_get_returns_the_stats_of_the_backup_sets(self):
+        self.mock_db.get_backup_stats.return_value = [{'count': 3}]
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_db.get_backup_stats.assert_called_once_with(
+            user_id=fake_data_0_user_id, search={})
+        self.assertEqual(self.mock_req.body, {'backup_sets': [{'count': 3}]})
+
+
 class TestBackupsResource(unittest.TestCase):
 
     def setUp(self):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = {'X-User-ID': fake_data_0_user_id}
+        self.mock_req.get_param.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = backups.BackupsResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -102,3 +323,17 @@ class TestBackupsResource(unittest.TestCase):
         expected_result = {'backup_id': fake_data_0_backup_id}
         self.assertEquals(self.mock_req.status, falcon.HTTP_204)
         self.assertEqual(result, expected_result)
+
+    def test_on_delete_passes_the_refresh_parameter(self):
+        self.mock_req.get_param.return_value = 'wait_for'
+        self.resource.on_delete(self.mock_req, self.mock_req, fake_data_0_backup_id)
+        self.mock_req.get_param.assert_called_with('refresh')
+        self.mock_db.delete_backup.assert_called_once_with(
+            user_id=self.mock_req.get_header.return_value,
+            backup_id=fake_data_0_backup_id, refresh='wait_for')
+
+    def test_on_delete_raises_on_invalid_refresh_parameter(self):
+        self.mock_req.get_param.return_value = 'true'
+        self.assertRaises(BadDataFormat, self.resource.on_delete,
+                          self.mock_req, self.mock_req, fake_data_0_backup_id)
+        self.assertFalse(self.mock_db.delete_backup.called)
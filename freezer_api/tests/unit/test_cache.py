@@ -0,0 +1,154 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+from mock import Mock, patch
+
+from freezer_api.api.v1 import metrics as v1_metrics
+from freezer_api.common import metrics
+from freezer_api.common.exceptions import DocumentExists
+from freezer_api.storage import cache
+from freezer_api.storage import elastic
+
+
+class TestDocumentCache(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.cache = cache.DocumentCache('jobs', 2, 30)
+
+    def test_get_returns_a_copy_of_the_cached_document(self):
+        self.cache.put('u', 'j1', {'job_id': 'j1', '_version': 1})
+        doc = self.cache.get('u', 'j1')
+        doc['job_id'] = 'changed'
+        self.assertEqual(self.cache.get('u', 'j1'),
+                         {'job_id': 'j1', '_version': 1})
+        self.assertIsNone(self.cache.get('other', 'j1'))
+        self.assertEqual(metrics.get('jobs_cache_hits'), 2)
+        self.assertEqual(metrics.get('jobs_cache_misses'), 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put('u', 'j1', {'_version': 1})
+        self.cache.put('u', 'j2', {'_version': 1})
+        self.cache.get('u', 'j1')
+        self.cache.put('u', 'j3', {'_version': 1})
+        self.assertIsNone(self.cache.get('u', 'j2'))
+        self.assertIsNotNone(self.cache.get('u', 'j1'))
+        self.assertEqual(metrics.get('jobs_cache_evictions'), 1)
+
+    def test_counters_are_served_by_the_metrics_endpoint(self):
+        self.cache.put('u', 'j1', {'_version': 1})
+        self.cache.get('u', 'j1')
+        self.cache.get('u', 'j2')
+        self.cache.put('u', 'j2', {'_version': 1})
+        self.cache.put('u', 'j3', {'_version': 1})
+        mock_req = Mock()
+        mock_req.env = {'freezer.context': Mock(is_admin=True, roles=[])}
+        v1_metrics.MetricsResource().on_get(mock_req, mock_req)
+        self.assertEqual(mock_req.body['counters'],
+                         {'jobs_cache_hits': 1, 'jobs_cache_misses': 1,
+                          'jobs_cache_evictions': 1})
+
+    @patch('freezer_api.storage.cache.time')
+    def test_entries_expire_after_ttl(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.cache.put('u', 'j1', {'_version': 1})
+        mock_time.time.return_value = 1030
+        self.assertIsNotNone(self.cache.get('u', 'j1'))
+        mock_time.time.return_value = 1031
+        self.assertIsNone(self.cache.get('u', 'j1'))
+
+    def test_read_older_than_a_write_is_not_cached(self):
+        self.cache.invalidate('u', 'j1', 3)
+        self.cache.put('u', 'j1', {'_version': 2})
+        self.assertIsNone(self.cache.get('u', 'j1'))
+        self.cache.put('u', 'j1', {'_version': 3})
+        self.assertEqual(self.cache.get('u', 'j1'), {'_version': 3})
+
+    def test_deleted_document_is_not_cached_again(self):
+        self.cache.put('u', 'j1', {'_version': 1})
+        self.cache.invalidate('u', 'j1')
+        self.cache.put('u', 'j1', {'_version': 1})
+        self.assertIsNone(self.cache.get('u', 'j1'))
+
+
+class TestCachedTypeManager(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_manager = Mock(doc_type='jobs')
+        self.mock_manager.get.side_effect = lambda user_id, doc_id, **kw: {
+            'job_id': doc_id, '_version': 1}
+        self.manager = cache.CachedTypeManager(self.mock_manager, 10, 30)
+
+    def test_get_reads_the_storage_once(self):
+        self.manager.get('u', 'j1')
+        self.assertEqual(self.manager.get('u', 'j1'),
+                         {'job_id': 'j1', '_version': 1})
+        self.mock_manager.get.assert_called_once_with('u', 'j1')
+
+    def test_get_with_fields_bypasses_the_cache(self):
+        self.manager.get('u', 'j1')
+        self.manager.get('u', 'j1', fields=['job_id'])
+        self.mock_manager.get.assert_called_with('u', 'j1',
+                                                 fields=['job_id'])
+
+    def test_update_invalidates(self):
+        self.mock_manager.update.return_value = 2
+        self.manager.get('u', 'j1')
+        self.assertEqual(self.manager.update('u', 'j1', {'a': 1}), 2)
+        self.manager.get('u', 'j1')
+        self.assertEqual(self.mock_manager.get.call_count, 2)
+
+    def test_failed_update_invalidates(self):
+        self.mock_manager.update.side_effect = DocumentExists('conflict')
+        self.manager.get('u', 'j1')
+        self.assertRaises(DocumentExists, self.manager.update,
+                          'u', 'j1', {'a': 1}, version=1)
+        self.manager.get('u', 'j1')
+        self.assertEqual(self.mock_manager.get.call_count, 2)
+
+    def test_replace_and_delete_invalidate(self):
+        self.mock_manager.replace.return_value = (False, 2)
+        self.manager.get('u', 'j1')
+        self.manager.replace('u', 'j1', {'job_id': 'j1'})
+        self.manager.get('u', 'j1')
+        self.manager.delete('u', 'j1')
+        self.manager.get('u', 'j1')
+        self.assertEqual(self.mock_manager.get.call_count, 3)
+
+    def test_other_calls_go_to_the_manager(self):
+        self.manager.search('u', search={})
+        self.mock_manager.search.assert_called_once_with('u', search={})
+
+
+class TestElasticSearchEngineCache(unittest.TestCase):
+
+    @patch('freezer_api.storage.elastic.elasticsearch')
+    def test_jobs_and_actions_are_cached_when_cache_size_is_set(self, mock_es):
+        eng = elastic.ElasticSearchEngine(hosts=['http://es:9200'],
+                                          cache_size=100, cache_ttl=5)
+        self.assertIsInstance(eng.job_manager, cache.CachedTypeManager)
+        self.assertIsInstance(eng.action_manager, cache.CachedTypeManager)
+        self.assertEqual(eng.job_manager.cache.size, 100)
+        self.assertEqual(eng.action_manager.cache.ttl, 5)
+        self.assertIsInstance(eng.session_manager,
+                              elastic.SessionTypeManager)
+
+    @patch('freezer_api.storage.elastic.elasticsearch')
+    def test_cache_is_disabled_by_default(self, mock_es):
+        eng = elastic.ElasticSearchEngine(hosts=['http://es:9200'])
+        self.assertIsInstance(eng.job_manager, elastic.JobTypeManager)
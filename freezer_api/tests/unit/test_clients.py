@@ -22,6 +22,7 @@ from .common import *
 from freezer_api.common.exceptions import *
 
 from freezer_api.api.v1 import clients as v1_clients
+from freezer_api.storage import memory
 
 
 class TestClientsCollectionResource(unittest.TestCase):
@@ -30,6 +31,9 @@ class TestClientsCollectionResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_clients.ClientsCollectionResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -44,6 +48,19 @@ class TestClientsCollectionResource(unittest.TestCase):
         self.assertEqual(result, expected_result)
         self.assertEqual(self.mock_req.status, falcon.HTTP_200)
 
+    def test_on_get_with_client_excluded_builds_the_cursor(self):
+        db = memory.MemoryEngine()
+        db.add_client(fake_data_0_user_id, dict(fake_client_info_0))
+        self.mock_req.get_param_as_list.side_effect = (
+            lambda name: ['-client'] if name == 'fields' else None)
+        self.mock_req.get_param_as_int.side_effect = (
+            lambda name: 1 if name == 'limit' else None)
+        resource = v1_clients.ClientsCollectionResource(db)
+        resource.json_body = self.mock_json_body
+        resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(len(self.mock_req.body['clients']), 1)
+        self.assertIn('next', self.mock_req.body)
+
     def test_on_get_return_correct_list(self):
         self.mock_db.get_client.return_value = [fake_client_entry_0, fake_client_entry_1]
         expected_result = {'clients': [fake_client_entry_0, fake_client_entry_1]}
@@ -71,6 +88,7 @@ class TestClientsResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_data_0_user_id
+        self.mock_req.get_param.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_clients.ClientsResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -68,3 +68,43 @@ class TestStorageDriver(unittest.TestCase):
         mock_CONF.storage.retries = 37
         driver.CONF = mock_CONF
         self.assertRaises(Exception, driver.get_db)
+
+    @patch('freezer_api.storage.driver.get_options')
+    @patch('freezer_api.storage.driver.memory')
+    @patch('freezer_api.storage.driver.logging')
+    def test_get_db_memory(self, mock_logging, mock_memory, mock_get_options):
+        mock_get_options.return_value = {'db': 'memory',
+                                         'hosts': ['localhost']}
+        db = driver.get_db()
+        mock_memory.MemoryEngine.assert_called_with(hosts=['localhost'])
+        self.assertEqual(db, mock_memory.MemoryEngine.return_value)
+
+    @patch('freezer_api.storage.driver.get_options')
+    @patch('freezer_api.storage.driver.sqlite')
+    @patch('freezer_api.storage.driver.logging')
+    def test_get_db_sqlite(self, mock_logging, mock_sqlite, mock_get_options):
+        mock_get_options.return_value = {'db': 'sqlite',
+                                         'hosts': ['localhost'],
+                                         'sqlite_path': '/tmp/freezer.db'}
+        db = driver.get_db()
+        mock_sqlite.SqliteEngine.assert_called_with(
+            sqlite_path='/tmp/freezer.db', hosts=['localhost'])
+        self.assertEqual(db, mock_sqlite.SqliteEngine.return_value)
+
+    @patch('freezer_api.storage.driver.get_options')
+    @patch('freezer_api.storage.driver.logfile')
+    @patch('freezer_api.storage.driver.logging')
+    def test_get_db_logfile_gets_only_its_options(self, mock_logging,
+                                                  mock_logfile,
+                                                  mock_get_options):
+        mock_get_options.return_value = {'db': 'logfile',
+                                         'hosts': ['localhost'],
+                                         'sqlite_path': '/tmp/freezer.db',
+                                         'logfile_path': '/tmp/freezer',
+                                         'logfile_sync': False,
+                                         'logfile_compact_after': 5}
+        db = driver.get_db()
+        mock_logfile.LogFileEngine.assert_called_with(
+            hosts=['localhost'], logfile_path='/tmp/freezer',
+            logfile_sync=False, logfile_compact_after=5)
+        self.assertEqual(db, mock_logfile.LogFileEngine.return_value)
@@ -19,8 +19,10 @@ limitations under the License.
 import unittest
 from mock import Mock, patch
 
+from elasticsearch import NotFoundError
 from elasticsearch import TransportError
 
+from freezer_api.common.utils import BackupMetadataDoc
 from freezer_api.storage import elastic
 from .common import *
 from freezer_api.common.exceptions import *
@@ -32,21 +34,60 @@ class TypeManager(unittest.TestCase):
         self.mock_es = Mock()
         self.type_manager = elastic.TypeManager(self.mock_es, 'base_doc_type', 'freezer')
 
-    def test_get_base_search_filter(self):
+    def test_get_search_query_puts_matches_in_query_part(self):
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
-        q = self.type_manager.get_base_search_filter('my_user_id', search=my_search)
-        expected_q = [{'term': {'user_id': 'my_user_id'}},
-                      {'query':
-                           {'bool':
-                                {'must_not':
-                                     [],
-                                 'must':
-                                     [{'match': {'some_field': 'some text'}},
-                                      {'match': {'description': 'some other text'}}
-                                      ]}}}]
+        q = self.type_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
+    def test_get_search_query_raises_StorageEngineError_on_invalid_search(self):
+        self.assertRaises(StorageEngineError, self.type_manager.get_search_query,
+                          'my_user_id', None, search={'match': 'not a list'})
+
+    def test_count_uses_the_search_query(self):
+        self.mock_es.count.return_value = {'count': 12}
+        my_search = {'match': [{'some_field': 'some text'}]}
+        res = self.type_manager.count('my_user_id', search=my_search)
+        self.assertEqual(res, 12)
+        self.mock_es.count.assert_called_once_with(
+            index='freezer', doc_type='base_doc_type',
+            body=self.type_manager.get_search_query('my_user_id', None,
+                                                    my_search))
+
+    def test_count_raises_StorageEngineError_on_failure(self):
+        self.mock_es.count.side_effect = Exception('regular test failure')
+        self.assertRaises(StorageEngineError, self.type_manager.count,
+                          'my_user_id')
+
+    def test_mget_keeps_found_documents_of_the_user_in_order(self):
+        self.mock_es.mget.return_value = {'docs': [
+            {'_id': 'b', 'found': True,
+             '_source': {'user_id': 'my_user_id', 'id': 'b'}},
+            {'_id': 'c', 'found': False},
+            {'_id': 'a', 'found': True,
+             '_source': {'user_id': 'somebody_else', 'id': 'a'}}]}
+        res = self.type_manager.mget('my_user_id', ['b', 'c', 'b', 'a'],
+                                     fields=['id', '-big'])
+        self.assertEqual(res, [{'user_id': 'my_user_id', 'id': 'b'}])
+        self.mock_es.mget.assert_called_once_with(
+            index='freezer', doc_type='base_doc_type',
+            body={'ids': ['b', 'c', 'a']},
+            _source_include=['id', 'user_id'], _source_exclude=['big'])
+
+    def test_mget_makes_no_request_without_ids(self):
+        self.assertEqual(self.type_manager.mget('my_user_id', []), [])
+        self.assertFalse(self.mock_es.mget.called)
+
+    def test_mget_raises_StorageEngineError_on_failure(self):
+        self.mock_es.mget.side_effect = Exception('regular test failure')
+        self.assertRaises(StorageEngineError, self.type_manager.mget,
+                          'my_user_id', ['a'])
+
     def test_get_ok(self):
         self.mock_es.get.return_value = fake_job_0_elasticsearch_found
         res = self.type_manager.get(user_id=fake_job_0_user_id,
@@ -73,17 +114,11 @@ class TypeManager(unittest.TestCase):
 
     def test_search_ok(self):
         self.mock_es.search.return_value = fake_data_0_elasticsearch_hit
-        expected_q = {'query': {'filtered': {'filter':
-                          {'bool':
-                               {'must':
-                                    [{'term': {'user_id': 'my_user_id'}},
-                                     {'query': {'bool':
-                                               {'must_not':
-                                                    [],
-                                                'must':
-                                                    [{'match': {'some_field': 'some text'}},
-                                                     {'match': {'description': 'some other text'}}]}}}
-                                     ]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
         res = self.type_manager.search(user_id='my_user_id', doc_id='mydocid', search=my_search, offset=7, limit=19)
@@ -99,25 +134,197 @@ class TypeManager(unittest.TestCase):
         test_doc = {'test_key_412': 'test_value_412', '_version': 5}
         res = self.type_manager.insert(doc=test_doc)
         self.assertEqual(res, (True, 15))
-        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None)
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh=True)
 
     def test_insert_raise_StorageEngineError_on_ES_Exception(self):
         self.mock_es.index.side_effect = Exception('regular test failure')
         test_doc = {'test_key_412': 'test_value_412', '_version': 5}
         self.assertRaises(StorageEngineError, self.type_manager.insert, doc=test_doc)
-        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None)
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh=True)
 
     def test_insert_raise_StorageEngineError_on_ES_TransportError_exception(self):
         self.mock_es.index.side_effect = TransportError(500, 'regular test failure')
         test_doc = {'test_key_412': 'test_value_412', '_version': 5}
         self.assertRaises(StorageEngineError, self.type_manager.insert, doc=test_doc)
-        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None)
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh=True)
 
     def test_insert_raise_DocumentExists_on_ES_TransportError409_exception(self):
         self.mock_es.index.side_effect = TransportError(409, 'regular test failure')
         test_doc = {'test_key_412': 'test_value_412', '_version': 5}
         self.assertRaises(DocumentExists, self.type_manager.insert, doc=test_doc)
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh=True)
+
+    def test_insert_with_refresh_policy_none_does_not_refresh(self):
+        type_manager = elastic.TypeManager(self.mock_es, 'base_doc_type',
+                                           'freezer', refresh_policy='none')
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        test_doc = {'test_key_412': 'test_value_412'}
+        type_manager.insert(doc=test_doc)
         self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None)
+        self.assertFalse(self.mock_es.indices.refresh.called)
+
+    def test_insert_with_refresh_policy_wait_for(self):
+        type_manager = elastic.TypeManager(self.mock_es, 'base_doc_type',
+                                           'freezer', refresh_policy='wait_for')
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        test_doc = {'test_key_412': 'test_value_412'}
+        type_manager.insert(doc=test_doc)
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh='wait_for')
+
+    def test_insert_refresh_override_takes_precedence_over_policy(self):
+        type_manager = elastic.TypeManager(self.mock_es, 'base_doc_type',
+                                           'freezer', refresh_policy='none')
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        test_doc = {'test_key_412': 'test_value_412'}
+        type_manager.insert(doc=test_doc, refresh='immediate')
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id=None, refresh=True)
+
+    def test_insert_passes_op_type_when_given(self):
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        test_doc = {'test_key_412': 'test_value_412'}
+        self.type_manager.insert(doc=test_doc, doc_id='mydoc', op_type='create')
+        self.mock_es.index.assert_called_with(index='freezer', doc_type='base_doc_type', body=test_doc, id='mydoc', refresh=True, op_type='create')
+
+    def test_get_passes_source_filter(self):
+        self.mock_es.get.return_value = fake_job_0_elasticsearch_found
+        self.type_manager.sort_field = 'job_id'
+        self.type_manager.get(user_id=fake_job_0_user_id, doc_id=fake_job_0_job_id,
+                              fields=['job_schedule', '-job_actions'])
+        self.mock_es.get.assert_called_with(index=self.type_manager.index,
+                                            doc_type=self.type_manager.doc_type,
+                                            id=fake_job_0_job_id,
+                                            _source_include=['job_schedule', 'user_id', 'job_id'],
+                                            _source_exclude=['job_actions'])
+
+    def test_get_source_filter_never_excludes_required_fields(self):
+        self.type_manager.sort_field = 'job_id'
+        res = self.type_manager.get_source_filter(['-user_id', '-job_id', '-description'])
+        self.assertEqual(res, ([], ['description']))
+
+    def test_get_source_filter_never_excludes_parents_of_required_fields(self):
+        client_manager = elastic.ClientTypeManager(Mock(), 'clients')
+        res = client_manager.get_source_filter(['-client', '-client.config'])
+        self.assertEqual(res, ([], ['client.config']))
+
+    def test_get_source_filter_returns_empty_lists_when_no_fields(self):
+        self.assertEqual(self.type_manager.get_source_filter(None), ([], []))
+
+    @patch('freezer_api.storage.elastic.TypeManager.get_search_query')
+    def test_search_adds_source_filter_to_query(self, mock_get_search_query):
+        mock_get_search_query.return_value = {'query': {'match_all': {}}}
+        self.mock_es.search.return_value = fake_data_0_elasticsearch_hit
+        self.type_manager.search(user_id='my_user_id', fields=['status'])
+        body = self.mock_es.search.call_args[1]['body']
+        self.assertEqual(body['_source'], {'include': ['status', 'user_id'],
+                                           'exclude': []})
+
+    def test_update_raises_AccessForbidden_when_doc_owned_by_other_user(self):
+        self.mock_es.update.return_value = {
+            '_version': 3, 'get': {'fields': {'user_id': ['other_user']}}}
+        self.assertRaises(AccessForbidden, self.type_manager.update,
+                          user_id='my_user_id', doc_id='mydoc',
+                          update_doc={'status': 'sleepy'})
+        self.assertEqual(self.mock_es.update.call_count, 1)
+        self.assertFalse(self.mock_es.get.called)
+
+    def test_update_raises_DocumentNotFound_when_doc_is_missing(self):
+        self.mock_es.update.side_effect = TransportError(404, 'DocumentMissingException')
+        self.assertRaises(DocumentNotFound, self.type_manager.update,
+                          user_id='my_user_id', doc_id='mydoc',
+                          update_doc={'status': 'sleepy'})
+
+    def test_update_falls_back_to_get_when_scripting_is_disabled(self):
+        self.mock_es.update.side_effect = [
+            TransportError(400, 'scripts of type [inline], operation [update] '
+                                'and lang [groovy] are disabled'),
+            {'_version': 4}]
+        self.mock_es.get.return_value = fake_job_0_elasticsearch_found
+        res = self.type_manager.update(user_id=fake_job_0_user_id,
+                                       doc_id=fake_job_0_job_id,
+                                       update_doc={'status': 'sleepy'})
+        self.assertEqual(res, 4)
+        self.assertFalse(self.type_manager.scripted_writes)
+        self.mock_es.update.assert_called_with(index='freezer', doc_type='base_doc_type',
+                                               id=fake_job_0_job_id,
+                                               body={'doc': {'status': 'sleepy'}},
+                                               refresh=True)
+
+    def test_update_sends_expected_version(self):
+        self.mock_es.update.return_value = {
+            '_version': 8, 'get': {'fields': {'user_id': ['my_user_id']}}}
+        self.type_manager.update(user_id='my_user_id', doc_id='mydoc',
+                                 update_doc={'status': 'sleepy'}, version=7)
+        self.assertEqual(self.mock_es.update.call_args[1]['version'], 7)
+
+    def test_update_raises_DocumentExists_on_version_conflict(self):
+        self.mock_es.update.side_effect = TransportError(409, 'VersionConflictEngineException')
+        self.assertRaises(DocumentExists, self.type_manager.update,
+                          user_id='my_user_id', doc_id='mydoc',
+                          update_doc={'status': 'sleepy'}, version=7)
+
+    def test_replace_upserts_doc_and_returns_created(self):
+        self.mock_es.update.return_value = {
+            '_version': 1, 'get': {'fields': {'user_id': ['my_user_id']}}}
+        doc = {'user_id': 'my_user_id', 'name': 'a', '_version': 5}
+        res = self.type_manager.replace(user_id='my_user_id', doc_id='mydoc', doc=doc)
+        self.assertEqual(res, (True, 1))
+        body = self.mock_es.update.call_args[1]['body']
+        self.assertEqual(body['script'], elastic.OWNED_REPLACE_SCRIPT)
+        self.assertEqual(body['upsert'], {'user_id': 'my_user_id', 'name': 'a'})
+        self.assertEqual(body['params']['doc'], body['upsert'])
+
+    def test_replace_raises_AccessForbidden_when_doc_owned_by_other_user(self):
+        self.mock_es.update.return_value = {
+            '_version': 7, 'get': {'fields': {'user_id': ['other_user']}}}
+        self.assertRaises(AccessForbidden, self.type_manager.replace,
+                          user_id='my_user_id', doc_id='mydoc',
+                          doc={'user_id': 'my_user_id'})
+
+    def test_replace_falls_back_to_insert_when_scripting_is_disabled(self):
+        self.type_manager.scripted_writes = False
+        self.mock_es.get.side_effect = TransportError(404, 'not found')
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        doc = {'user_id': 'my_user_id'}
+        res = self.type_manager.replace(user_id='my_user_id', doc_id='mydoc', doc=doc)
+        self.assertEqual(res, (True, 1))
+        self.assertFalse(self.mock_es.update.called)
+
+    def test_get_refresh_param_raises_StorageEngineError_on_unknown_policy(self):
+        self.assertRaises(StorageEngineError, self.type_manager.get_refresh_param, 'sometimes')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_bulk_insert_returns_results_in_order(self, mock_helpers):
+        mock_helpers.streaming_bulk.return_value = iter([
+            (True, {'index': {'_id': 'a', 'status': 201}}),
+            (False, {'index': {'_id': 'b', 'status': 409, 'error': 'exists'}})])
+        docs = [('a', {'name': 'a', '_version': 3}), (None, {'name': 'b'})]
+        res = self.type_manager.bulk_insert(docs)
+        self.assertEqual(res, [(True, {'_id': 'a', 'status': 201}),
+                               (False, {'_id': 'b', 'status': 409, 'error': 'exists'})])
+        expected_actions = [
+            {'_op_type': 'index', '_index': 'freezer', '_type': 'base_doc_type',
+             '_id': 'a', '_source': {'name': 'a'}},
+            {'_op_type': 'index', '_index': 'freezer', '_type': 'base_doc_type',
+             '_source': {'name': 'b'}}]
+        mock_helpers.streaming_bulk.assert_called_with(
+            self.mock_es, expected_actions, chunk_size=elastic.BULK_CHUNK_SIZE,
+            raise_on_error=False, raise_on_exception=False, refresh=True)
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_bulk_insert_uses_given_op_type(self, mock_helpers):
+        mock_helpers.streaming_bulk.return_value = iter([
+            (True, {'create': {'_id': 'a', 'status': 201}})])
+        res = self.type_manager.bulk_insert([('a', {'name': 'a'})],
+                                            op_type='create')
+        self.assertEqual(res, [(True, {'_id': 'a', 'status': 201})])
+        actions = mock_helpers.streaming_bulk.call_args[0][1]
+        self.assertEqual(actions[0]['_op_type'], 'create')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_bulk_insert_raises_StorageEngineError_when_bulk_raises(self, mock_helpers):
+        mock_helpers.streaming_bulk.side_effect = Exception('regular test failure')
+        self.assertRaises(StorageEngineError, self.type_manager.bulk_insert,
+                          [(None, {'name': 'a'})])
 
     @patch('freezer_api.storage.elastic.es_helpers')
     def test_delete_raises_StorageEngineError_on_scan_exception(self, mock_helpers):
@@ -129,22 +336,51 @@ class TypeManager(unittest.TestCase):
     def test_delete_raises_StorageEngineError_on_delete_exception(self, mock_helpers):
         doc_id = 'mydocid345'
         mock_helpers.scan.return_value = [{'_id': 'cicciopassamilolio'}]
-        self.mock_es.delete.side_effect = Exception('regular test failure')
+        mock_helpers.bulk.side_effect = Exception('regular test failure')
         self.assertRaises(StorageEngineError, self.type_manager.delete, user_id='my_user_id', doc_id=doc_id)
 
     @patch('freezer_api.storage.elastic.es_helpers')
-    def test_delete_return_none_when_nothing_is_deleted(self, mock_helpers):
+    def test_delete_raises_StorageEngineError_on_bulk_item_errors(self, mock_helpers):
+        doc_id = 'mydocid345'
+        mock_helpers.scan.return_value = [{'_id': 'cicciopassamilolio'}]
+        mock_helpers.bulk.return_value = (0, [{'delete': {'_id': 'cicciopassamilolio', 'status': 500}}])
+        self.assertRaises(StorageEngineError, self.type_manager.delete, user_id='my_user_id', doc_id=doc_id)
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_delete_return_zero_when_nothing_is_deleted(self, mock_helpers):
         doc_id = 'mydocid345'
         mock_helpers.scan.return_value = []
         res = self.type_manager.delete(user_id='my_user_id', doc_id=doc_id)
-        self.assertIsNone(res)
+        self.assertEqual(res, 0)
+        self.assertFalse(mock_helpers.bulk.called)
 
     @patch('freezer_api.storage.elastic.es_helpers')
-    def test_delete_return_correct_id_on_success(self, mock_helpers):
+    def test_delete_return_number_of_deleted_docs_on_success(self, mock_helpers):
         doc_id = 'mydocid345'
-        mock_helpers.scan.return_value = [{'_id': 'cicciopassamilolio'}]
+        mock_helpers.scan.return_value = [{'_id': 'cicciopassamilolio'},
+                                          {'_id': 'passamilolio'},
+                                          {'_id': 'lolio'}]
+        mock_helpers.bulk.return_value = (2, [{'delete': {'_id': 'lolio', 'status': 404}}])
         res = self.type_manager.delete(user_id='my_user_id', doc_id=doc_id)
-        self.assertEqual(res, 'cicciopassamilolio')
+        self.assertEqual(res, 2)
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_delete_uses_one_bulk_request_and_one_refresh(self, mock_helpers):
+        doc_id = 'mydocid345'
+        mock_helpers.scan.return_value = [{'_id': 'cicciopassamilolio'},
+                                          {'_id': 'passamilolio'}]
+        mock_helpers.bulk.return_value = (2, [])
+        self.type_manager.delete(user_id='my_user_id', doc_id=doc_id)
+        expected_actions = [
+            {'_op_type': 'delete', '_index': 'freezer',
+             '_type': 'base_doc_type', '_id': 'cicciopassamilolio'},
+            {'_op_type': 'delete', '_index': 'freezer',
+             '_type': 'base_doc_type', '_id': 'passamilolio'}]
+        mock_helpers.bulk.assert_called_once_with(
+            self.mock_es, expected_actions, chunk_size=2,
+            raise_on_error=False, refresh=True)
+        self.assertFalse(self.mock_es.delete.called)
+        self.assertFalse(self.mock_es.indices.refresh.called)
 
 
 class TestBackupManager(unittest.TestCase):
@@ -154,27 +390,115 @@ class TestBackupManager(unittest.TestCase):
         self.backup_manager = elastic.BackupTypeManager(self.mock_es, 'backups')
 
     def test_get_search_query(self):
-        my_search = {'match': [{'backup_name': 'my_backup'} , {'mode': 'fs'}],
+        my_search = {'match': [{'backup_metadata.backup_name': 'my_backup'}, {'mode': 'fs'}],
+                     'match_not': [{'backup_metadata.container': 'old'}],
                      "time_before": 1428510506,
                      "time_after": 1428510506
                      }
         q = self.backup_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
-        expected_q = {'query': {'filtered': {'filter':
-                          {'bool':
-                               {'must':
-                                    [{'term': {'user_id': 'my_user_id'}},
-                                     {'query': {'bool': {
-                                         'must_not':
-                                             [],
-                                         'must':
-                                             [{'match': {'backup_name': 'my_backup'}},
-                                              {'match': {'mode': 'fs'}}]}}
-                                     },
-                                     {'term': {'backup_id': 'my_doc_id'}},
-                                     {'range': {'timestamp': {'gte': 1428510506}}},
-                                     {'range': {'timestamp': {'lte': 1428510506}}}]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {
+                'must': [{'term': {'user_id': 'my_user_id'}},
+                         {'term': {'backup_id': 'my_doc_id'}},
+                         {'term': {'backup_metadata.backup_name': 'my_backup'}},
+                         {'range': {'timestamp': {'gte': 1428510506}}},
+                         {'range': {'timestamp': {'lte': 1428510506}}}],
+                'must_not': [{'term': {'backup_metadata.container': 'old'}}]}},
+            'query': {'bool': {'must': [{'match': {'mode': 'fs'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
+    def test_search_sorts_on_backup_id(self):
+        self.mock_es.search.return_value = fake_data_0_elasticsearch_hit
+        self.backup_manager.search(user_id='my_user_id', offset=20, limit=5)
+        query = self.backup_manager.get_search_query('my_user_id', None)
+        query['sort'] = [{'backup_id': {'order': 'asc'}}]
+        self.mock_es.search.assert_called_with(
+            index='freezer', doc_type='backups', size=5, from_=20, body=query)
+
+    def test_search_after_filters_on_sort_field_and_ignores_offset(self):
+        self.mock_es.search.return_value = fake_data_0_elasticsearch_hit
+        self.backup_manager.search(user_id='my_user_id', offset=20, limit=5,
+                                   after='last_backup_id')
+        expected_q = {
+            'query': {'filtered': {'filter': {'bool': {'must': [
+                {'term': {'user_id': 'my_user_id'}},
+                {'range': {'backup_id': {'gt': 'last_backup_id'}}}]}}}},
+            'sort': [{'backup_id': {'order': 'asc'}}]}
+        self.mock_es.search.assert_called_with(
+            index='freezer', doc_type='backups', size=5, from_=0,
+            body=expected_q)
+
+
+class BackupTypeManager(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_es = Mock()
+        self.backup_manager = elastic.BackupTypeManager(self.mock_es, 'backups')
+
+    def test_stats_aggregates_per_backup_set_with_the_query_cache(self):
+        def backup_set(name, count, latest, size):
+            return {'key': name, 'doc_count': count,
+                    'latest_timestamp': {'value': latest},
+                    'backup_size_compressed': {'value': size},
+                    'backup_size_uncompressed': {'value': 0.0},
+                    'total_backup_session_size': {'value': None}}
+        self.mock_es.search.return_value = {'aggregations': {'container': {
+            'buckets': [{'key': 'c1', 'hostname': {'buckets': [
+                {'key': 'h2', 'backup_name': {'buckets': [
+                    backup_set('b1', 3, 1460000000.0, 300.0)]}},
+                {'key': 'h1', 'backup_name': {'buckets': [
+                    backup_set('b2', 1, None, 0.0),
+                    backup_set('b1', 2, 1450000000.0, 20.0)]}}]}}]}}}
+        res = self.backup_manager.stats('my_user_id',
+                                        search={'time_after': 1})
+        self.assertEqual(
+            [(s['hostname'], s['backup_name'], s['count'],
+              s['latest_timestamp'], s['backup_size_compressed'])
+             for s in res],
+            [('h1', 'b1', 2, 1450000000, 20), ('h1', 'b2', 1, None, 0),
+             ('h2', 'b1', 3, 1460000000, 300)])
+        self.assertEqual(res[0]['container'], 'c1')
+        self.assertEqual(res[0]['total_backup_session_size'], 0)
+        kwargs = self.mock_es.search.call_args[1]
+        self.assertEqual(kwargs['search_type'], 'count')
+        self.assertEqual(kwargs['params'], {'query_cache': 'true'})
+        body = kwargs['body']
+        self.assertIn({'range': {'timestamp': {'gte': 1}}},
+                      body['query']['filtered']['filter']['bool']['must'])
+        hostname = body['aggs']['container']['aggs']['hostname']
+        self.assertEqual(hostname['terms']['field'],
+                         'backup_metadata.hostname.raw')
+        metrics = hostname['aggs']['backup_name']['aggs']
+        self.assertEqual(metrics['latest_timestamp'],
+                         {'max': {'field': 'backup_metadata.timestamp'}})
+
+    def test_latest_keeps_the_top_hit_of_each_backup_set(self):
+        self.mock_es.search.return_value = {'aggregations': {'backup_sets': {
+            'buckets': [
+                {'key': 'set_1', 'latest': {'hits': {'hits': [
+                    {'_source': {'backup_id': 'b2'}}]}}},
+                {'key': 'set_2', 'latest': {'hits': {'hits': [
+                    {'_source': {'backup_id': 'b5'}}]}}}]}}}
+        res = self.backup_manager.latest('my_user_id',
+                                         fields=['backup_metadata.timestamp'])
+        self.assertEqual(res, [{'backup_id': 'b2'}, {'backup_id': 'b5'}])
+        kwargs = self.mock_es.search.call_args[1]
+        self.assertEqual(kwargs['search_type'], 'count')
+        backup_sets = kwargs['body']['aggs']['backup_sets']
+        self.assertEqual(backup_sets['terms']['field'], 'backup_set_id')
+        top_hits = backup_sets['aggs']['latest']['top_hits']
+        self.assertEqual(top_hits['size'], 1)
+        self.assertEqual(top_hits['sort'][0]['backup_metadata.timestamp']
+                         ['order'], 'desc')
+        self.assertEqual(top_hits['_source']['include'],
+                         ['backup_metadata.timestamp', 'user_id', 'backup_id'])
+
+    def test_stats_raises_StorageEngineError_on_failure(self):
+        self.mock_es.search.side_effect = Exception('regular test failure')
+        self.assertRaises(StorageEngineError, self.backup_manager.stats,
+                          'my_user_id')
+
 
 class ClientTypeManager(unittest.TestCase):
 
@@ -182,24 +506,30 @@ class ClientTypeManager(unittest.TestCase):
         self.mock_es = Mock()
         self.client_manager = elastic.ClientTypeManager(self.mock_es, 'clients')
 
+    def test_mget_searches_the_client_ids_and_keeps_their_order(self):
+        self.mock_es.search.return_value = {'hits': {'hits': [
+            {'_source': {'user_id': 'my_user_id',
+                         'client': {'client_id': 'c1'}}},
+            {'_source': {'user_id': 'my_user_id',
+                         'client': {'client_id': 'c2'}}}]}}
+        res = self.client_manager.mget('my_user_id', ['c2', 'c3', 'c1'])
+        self.assertEqual([c['client']['client_id'] for c in res],
+                         ['c2', 'c1'])
+        body = self.mock_es.search.call_args[1]['body']
+        self.assertIn({'terms': {'client.client_id': ['c2', 'c3', 'c1']}},
+                      body['query']['filtered']['filter']['bool']['must'])
+        self.assertEqual(self.mock_es.search.call_args[1]['size'], 3)
+
     def test_get_search_query(self):
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
         q = self.client_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
-        expected_q = {'query': {'filtered': {'filter':
-                          {'bool':
-                               {'must':
-                                    [{'term': {'user_id': 'my_user_id'}},
-                                     {'query':
-                                          {'bool':
-                                               {'must_not':
-                                                    [],
-                                                'must':
-                                                    [{'match': {'some_field': 'some text'}},
-                                                     {'match': {'description': 'some other text'}}]}}
-                                      },
-                                      {'term': {'client_id': 'my_doc_id'}}
-                                     ]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}},
+                                         {'term': {'client.client_id': 'my_doc_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
 
@@ -213,19 +543,12 @@ class JobTypeManager(unittest.TestCase):
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
         q = self.job_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
-        expected_q = {'query': {'filtered': {'filter':
-                                                 {'bool':
-                                                      {'must':
-                                                           [{'term': {'user_id': 'my_user_id'}},
-                                                            {'query':
-                                                                 {'bool':
-                                                                      {'must_not':
-                                                                           [],
-                                                                       'must':
-                                                                           [{'match': {'some_field': 'some text'}},
-                                                                            {'match': {'description': 'some other text'}}]}}},
-                                                            {'term': {'job_id': 'my_doc_id'}}
-                                                            ]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}},
+                                         {'term': {'job_id': 'my_doc_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
     def test_update_ok(self):
@@ -233,33 +556,42 @@ class JobTypeManager(unittest.TestCase):
             u'_id': u'd6c1e00d-b9c1-4eb3-8219-1e83c02af101',
             u'_index': u'freezer',
             u'_type': u'jobs',
-            u'_version': 3
+            u'_version': 3,
+            u'get': {u'fields': {u'user_id': [u'my_user_id']}}
         }
-        res = self.job_manager.update(job_id=fake_job_0_job_id,
-                                      job_update_doc={'status': 'sleepy'})
+        res = self.job_manager.update(user_id='my_user_id', doc_id=fake_job_0_job_id,
+                                      update_doc={'status': 'sleepy'})
         self.assertEqual(res, 3)
         self.mock_es.update.assert_called_with(index=self.job_manager.index,
                                                doc_type=self.job_manager.doc_type,
                                                id=fake_job_0_job_id,
-                                               body={"doc": {'status': 'sleepy'}})
+                                               body={'script': elastic.OWNED_UPDATE_SCRIPT,
+                                                     'lang': 'groovy',
+                                                     'params': {'user_id': 'my_user_id',
+                                                                'doc': {'status': 'sleepy'}}},
+                                               fields='user_id',
+                                               refresh=True)
 
     def test_update_raise_DocumentNotFound_when_not_found(self):
         self.mock_es.update.side_effect = TransportError('regular test failure', 1)
         self.assertRaises(DocumentNotFound, self.job_manager.update,
-                          job_id=fake_job_0_job_id,
-                          job_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id=fake_job_0_job_id,
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_DocumentExists_when_elasticsearch_returns_409(self):
         self.mock_es.update.side_effect = TransportError(409, 'regular test failure')
         self.assertRaises(DocumentExists, self.job_manager.update,
-                          job_id=fake_job_0_job_id,
-                          job_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id=fake_job_0_job_id,
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_StorageEngineError_when_db_raises(self):
         self.mock_es.update.side_effect = Exception('regular test failure')
         self.assertRaises(StorageEngineError, self.job_manager.update,
-                          job_id=fake_job_0_job_id,
-                          job_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id=fake_job_0_job_id,
+                          update_doc={'status': 'sleepy'})
 
 
 class ActionTypeManager(unittest.TestCase):
@@ -272,19 +604,12 @@ class ActionTypeManager(unittest.TestCase):
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
         q = self.action_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
-        expected_q = {'query': {'filtered': {'filter':
-                                                 {'bool':
-                                                      {'must':
-                                                           [{'term': {'user_id': 'my_user_id'}},
-                                                            {'query':
-                                                                 {'bool':
-                                                                      {'must_not':
-                                                                           [],
-                                                                       'must':
-                                                                           [{'match': {'some_field': 'some text'}},
-                                                                            {'match': {'description': 'some other text'}}]}}},
-                                                            {'term': {'action_id': 'my_doc_id'}}
-                                                            ]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}},
+                                         {'term': {'action_id': 'my_doc_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
     def test_update_ok(self):
@@ -292,33 +617,42 @@ class ActionTypeManager(unittest.TestCase):
             u'_id': u'd6c1e00d-b9c1-4eb3-8219-1e83c02af101',
             u'_index': u'freezer',
             u'_type': u'actions',
-            u'_version': 3
+            u'_version': 3,
+            u'get': {u'fields': {u'user_id': [u'my_user_id']}}
         }
-        res = self.action_manager.update(action_id='poiuuiop7890',
-                                         action_update_doc={'status': 'sleepy'})
+        res = self.action_manager.update(user_id='my_user_id', doc_id='poiuuiop7890',
+                                         update_doc={'status': 'sleepy'})
         self.assertEqual(res, 3)
         self.mock_es.update.assert_called_with(index=self.action_manager.index,
                                                doc_type=self.action_manager.doc_type,
                                                id='poiuuiop7890',
-                                               body={"doc": {'status': 'sleepy'}})
+                                               body={'script': elastic.OWNED_UPDATE_SCRIPT,
+                                                     'lang': 'groovy',
+                                                     'params': {'user_id': 'my_user_id',
+                                                                'doc': {'status': 'sleepy'}}},
+                                               fields='user_id',
+                                               refresh=True)
 
     def test_update_raise_DocumentNotFound_when_not_found(self):
         self.mock_es.update.side_effect = TransportError('regular test failure', 1)
         self.assertRaises(DocumentNotFound, self.action_manager.update,
-                          action_id='asdfsadf',
-                          action_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='asdfsadf',
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_DocumentExists_when_elasticsearch_returns_409(self):
         self.mock_es.update.side_effect = TransportError(409, 'regular test failure')
         self.assertRaises(DocumentExists, self.action_manager.update,
-                          action_id='pepepepepe2321',
-                          action_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='pepepepepe2321',
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_StorageEngineError_when_db_raises(self):
         self.mock_es.update.side_effect = Exception('regular test failure')
         self.assertRaises(StorageEngineError, self.action_manager.update,
-                          action_id='pepepepepe2321',
-                          action_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='pepepepepe2321',
+                          update_doc={'status': 'sleepy'})
 
 
 class SessionTypeManager(unittest.TestCase):
@@ -331,53 +665,401 @@ class SessionTypeManager(unittest.TestCase):
         my_search = {'match': [{'some_field': 'some text'},
                                {'description': 'some other text'}]}
         q = self.session_manager.get_search_query('my_user_id', 'my_doc_id', search=my_search)
-        expected_q = {'query': {'filtered': {'filter':
-                                                 {'bool':
-                                                      {'must':
-                                                           [{'term': {'user_id': 'my_user_id'}},
-                                                            {'query':
-                                                                 {'bool':
-                                                                      {'must_not':
-                                                                           [],
-                                                                       'must':
-                                                                           [{'match': {'some_field': 'some text'}},
-                                                                            {'match': {'description': 'some other text'}}]}}},
-                                                            {'term': {'session_id': 'my_doc_id'}}
-                                                            ]}}}}}
+        expected_q = {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}},
+                                         {'term': {'session_id': 'my_doc_id'}}]}},
+            'query': {'bool': {'must': [{'match': {'some_field': 'some text'}},
+                                        {'match': {'description': 'some other text'}}],
+                               'must_not': []}}}}}
         self.assertEqual(q, expected_q)
 
     def test_update_ok(self):
         self.mock_es.update.return_value = {
             u'_id': u'd6c1e00d-b9c1-4eb3-8219-1e83c02af101',
             u'_index': u'freezer',
-            u'_type': u'actions',
-            u'_version': 3
+            u'_type': u'sessions',
+            u'_version': 3,
+            u'get': {u'fields': {u'user_id': [u'my_user_id']}}
         }
-        res = self.session_manager.update(session_id='poiuuiop7890',
-                                          session_update_doc={'status': 'sleepy'})
+        res = self.session_manager.update(user_id='my_user_id', doc_id='poiuuiop7890',
+                                          update_doc={'status': 'sleepy'})
         self.assertEqual(res, 3)
         self.mock_es.update.assert_called_with(index=self.session_manager.index,
                                                doc_type=self.session_manager.doc_type,
                                                id='poiuuiop7890',
-                                               body={"doc": {'status': 'sleepy'}})
+                                               body={'script': elastic.OWNED_UPDATE_SCRIPT,
+                                                     'lang': 'groovy',
+                                                     'params': {'user_id': 'my_user_id',
+                                                                'doc': {'status': 'sleepy'}}},
+                                               fields='user_id',
+                                               refresh=True)
 
     def test_update_raise_DocumentNotFound_when_not_found(self):
         self.mock_es.update.side_effect = TransportError('regular test failure', 1)
         self.assertRaises(DocumentNotFound, self.session_manager.update,
-                          session_id='asdfsadf',
-                          session_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='asdfsadf',
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_DocumentExists_when_elasticsearch_returns_409(self):
         self.mock_es.update.side_effect = TransportError(409, 'regular test failure')
         self.assertRaises(DocumentExists, self.session_manager.update,
-                          session_id='pepepepepe2321',
-                          session_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='pepepepepe2321',
+                          update_doc={'status': 'sleepy'})
 
     def test_update_raise_StorageEngineError_when_db_raises(self):
         self.mock_es.update.side_effect = Exception('regular test failure')
         self.assertRaises(StorageEngineError, self.session_manager.update,
-                          session_id='pepepepepe2321',
-                          session_update_doc={'status': 'sleepy'})
+                          user_id='my_user_id',
+                          doc_id='pepepepepe2321',
+                          update_doc={'status': 'sleepy'})
+
+
+# 2016-01-01, 2016-02-01 and 2016-03-15 at midnight
+JAN_2016, FEB_2016, MAR_2016 = 1451606400, 1454284800, 1458000000
+
+
+class MonthlyBackupTypeManager(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_es = Mock()
+        self.mock_es.indices.get_alias.return_value = {
+            'freezer_backups-2015.11': {}, 'freezer_backups-2016.02': {},
+            'freezer_backups-undated': {}}
+        self.backup_manager = elastic.MonthlyBackupTypeManager(
+            self.mock_es, 'backups', index='freezer')
+
+    def test_get_write_index_uses_the_month_of_the_backup_timestamp(self):
+        doc = {'backup_metadata': {'timestamp': FEB_2016 + 10}}
+        self.assertEqual(self.backup_manager.get_write_index(doc),
+                         'freezer_backups-2016.02')
+        self.assertEqual(self.backup_manager.get_write_index(
+            {'backup_metadata': {}}), 'freezer_backups-undated')
+
+    def test_insert_writes_to_the_monthly_index(self):
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        self.backup_manager.insert(
+            {'backup_metadata': {'timestamp': JAN_2016}}, 'backup_id')
+        self.assertEqual(self.mock_es.index.call_args[1]['index'],
+                         'freezer_backups-2016.01')
+
+    def test_get_read_target_uses_the_alias_without_time_range(self):
+        self.assertEqual(self.backup_manager.get_read_target({}),
+                         {'index': 'freezer_backups'})
+        self.assertFalse(self.mock_es.indices.get_alias.called)
+
+    def test_get_read_target_selects_the_months_of_the_time_range(self):
+        target = self.backup_manager.get_read_target(
+            {'time_after': JAN_2016 + 10, 'time_before': MAR_2016})
+        self.assertEqual(target['index'], 'freezer_backups-2016.01,'
+                                          'freezer_backups-2016.02,'
+                                          'freezer_backups-2016.03')
+        self.assertTrue(target['ignore_unavailable'])
+        self.assertTrue(target['allow_no_indices'])
+
+    def test_get_read_target_starts_from_the_oldest_index(self):
+        target = self.backup_manager.get_read_target(
+            {'time_before': JAN_2016})
+        self.assertEqual(target['index'].split(','), [
+            'freezer_backups-2015.11', 'freezer_backups-2015.12',
+            'freezer_backups-2016.01'])
+
+    @patch('freezer_api.storage.elastic.time')
+    def test_get_read_target_goes_up_to_next_month(self, mock_time):
+        mock_time.time.return_value = FEB_2016
+        target = self.backup_manager.get_read_target(
+            {'time_after': JAN_2016})
+        self.assertEqual(target['index'].split(','), [
+            'freezer_backups-2016.01', 'freezer_backups-2016.02',
+            'freezer_backups-2016.03'])
+
+    @patch('freezer_api.storage.elastic.time')
+    def test_get_read_target_stops_at_the_newest_index(self, mock_time):
+        mock_time.time.return_value = FEB_2016
+        target = self.backup_manager.get_read_target(
+            {'time_after': JAN_2016, 'time_before': 4102444800})
+        self.assertEqual(target['index'].split(','), [
+            'freezer_backups-2016.01', 'freezer_backups-2016.02',
+            'freezer_backups-2016.03'])
+        target = self.backup_manager.get_read_target(
+            {'time_after': 4102444800})
+        self.assertEqual(target['index'], 'freezer_backups-2016.03')
+
+    def test_get_read_target_reads_one_month_for_an_empty_range(self):
+        target = self.backup_manager.get_read_target(
+            {'time_after': MAR_2016, 'time_before': JAN_2016})
+        self.assertEqual(target['index'], 'freezer_backups-2016.03')
+
+    def test_get_partitions_is_cached(self):
+        self.backup_manager.get_partitions()
+        self.assertEqual(self.backup_manager.get_partitions(),
+                         [(2015, 11), (2016, 2)])
+        self.assertEqual(self.mock_es.indices.get_alias.call_count, 1)
+
+    def test_get_partitions_returns_empty_list_without_alias(self):
+        self.mock_es.indices.get_alias.side_effect = NotFoundError(404, 'x')
+        self.assertEqual(self.backup_manager.get_partitions(), [])
+
+    def test_search_reads_the_monthly_indices(self):
+        self.mock_es.search.return_value = {'hits': {'hits': []}}
+        self.backup_manager.search('my_user_id', search={
+            'time_after': FEB_2016, 'time_before': FEB_2016 + 10})
+        kwargs = self.mock_es.search.call_args[1]
+        self.assertEqual(kwargs['index'], 'freezer_backups-2016.02')
+        self.assertTrue(kwargs['ignore_unavailable'])
+
+    def test_get_searches_the_backup_by_id(self):
+        self.mock_es.search.return_value = {'hits': {'hits': [
+            {'_source': {'backup_id': 'b1', 'user_id': 'my_user_id'}}]}}
+        res = self.backup_manager.get('my_user_id', 'b1')
+        self.assertEqual(res['backup_id'], 'b1')
+        self.assertEqual(self.mock_es.search.call_args[1]['index'],
+                         'freezer_backups')
+        self.mock_es.search.return_value = {'hits': {'hits': []}}
+        self.assertRaises(DocumentNotFound, self.backup_manager.get,
+                          'my_user_id', 'b2')
+
+    def test_mget_searches_the_backup_ids(self):
+        self.mock_es.search.return_value = {'hits': {'hits': [
+            {'_source': {'backup_id': 'b1', 'user_id': 'my_user_id'}}]}}
+        res = self.backup_manager.mget('my_user_id', ['b2', 'b1'])
+        self.assertEqual(res, [{'backup_id': 'b1', 'user_id': 'my_user_id'}])
+        self.assertFalse(self.mock_es.mget.called)
+
+    def test_get_backup_template_adds_the_monthly_indices_to_the_alias(self):
+        template = elastic.get_backup_template('freezer', {'a': 1}, 2)
+        self.assertEqual(template['template'], 'freezer_backups-*')
+        self.assertEqual(template['aliases'], {'freezer_backups': {}})
+        self.assertEqual(template['mappings'], {'backups': {'a': 1}})
+        self.assertEqual(template['settings'], {'number_of_replicas': 2})
+
+    @patch('freezer_api.storage.elastic.elasticsearch')
+    def test_engine_uses_monthly_indices_when_configured(self,
+                                                         mock_elasticsearch):
+        engine = elastic.ElasticSearchEngine(
+            index='myindex', hosts='http://elasticservaddr:1997',
+            backup_index_interval='month')
+        self.assertIsInstance(engine.backup_manager,
+                              elastic.MonthlyBackupTypeManager)
+        self.assertEqual(engine.backup_manager.alias, 'myindex_backups')
+        engine = elastic.ElasticSearchEngine(
+            index='myindex', hosts='http://elasticservaddr:1997')
+        self.assertNotIsInstance(engine.backup_manager,
+                                 elastic.MonthlyBackupTypeManager)
+
+
+class TestRetentionStorage(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_es = Mock()
+        self.backup_manager = elastic.BackupTypeManager(self.mock_es,
+                                                        'backups')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_mdelete_deletes_the_listed_documents_of_the_user(self,
+                                                              mock_helpers):
+        mock_helpers.scan.return_value = [
+            {'_id': 'a', '_index': 'freezer'},
+            {'_id': 'b', '_index': 'freezer'}]
+        mock_helpers.bulk.return_value = (2, [])
+        res = self.backup_manager.mdelete('my_user_id', ['a', 'b', 'a'],
+                                          refresh=elastic.REFRESH_NONE)
+        self.assertEqual(res, 2)
+        query_dsl = mock_helpers.scan.call_args[1]['query']
+        self.assertIn({'terms': {'backup_id': ['a', 'b']}},
+                      query_dsl['query']['filtered']['filter']['bool']['must'])
+        self.assertIn({'term': {'user_id': 'my_user_id'}},
+                      query_dsl['query']['filtered']['filter']['bool']['must'])
+        self.assertNotIn('refresh', mock_helpers.bulk.call_args[1])
+
+    def test_mdelete_does_nothing_without_ids(self):
+        self.assertEqual(self.backup_manager.mdelete('my_user_id', []), 0)
+        self.assertFalse(self.mock_es.search.called)
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_es = Mock()
+        self.backup_manager = elastic.BackupTypeManager(self.mock_es,
+                                                        'backups')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_export_yields_the_documents_of_all_users(self, mock_helpers):
+        mock_helpers.scan.return_value = [{'_source': {'user_id': 'a'}},
+                                          {'_source': {'user_id': 'b'}}]
+        self.assertEqual(list(self.backup_manager.export_all()),
+                         [{'user_id': 'a'}, {'user_id': 'b'}])
+        query_dsl = mock_helpers.scan.call_args[1]['query']
+        self.assertEqual(
+            query_dsl['query']['filtered']['filter']['bool']['must'],
+            [{'match_all': {}}])
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_export_scrolls_the_documents_of_the_user(self, mock_helpers):
+        mock_helpers.scan.return_value = []
+        list(self.backup_manager.export('my_user_id',
+                                        fields=['backup_id']))
+        kwargs = mock_helpers.scan.call_args[1]
+        self.assertIn({'term': {'user_id': 'my_user_id'}},
+                      kwargs['query']['query']['filtered']['filter']['bool']
+                      ['must'])
+        self.assertEqual(kwargs['query']['_source']['include'],
+                         ['backup_id', 'user_id'])
+        self.assertEqual(kwargs['size'], elastic.EXPORT_SIZE)
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_export_without_user_id_matches_nothing(self, mock_helpers):
+        mock_helpers.scan.return_value = []
+        list(self.backup_manager.export(None))
+        query_dsl = mock_helpers.scan.call_args[1]['query']
+        self.assertIn({'term': {'user_id': None}},
+                      query_dsl['query']['filtered']['filter']['bool']
+                      ['must'])
+
+    def test_export_is_lazy(self):
+        self.backup_manager.export('my_user_id')
+        self.assertFalse(self.mock_es.search.called)
+
+    def test_client_documents_are_imported_with_the_id_of_add_client(self):
+        client_manager = elastic.get_type_manager(self.mock_es, 'clients')
+        doc = {'user_id': 'my_user_id', 'client': {'client_id': 'alpha'}}
+        self.assertEqual(client_manager.get_doc_id(doc), 'my_user_id_alpha')
+
+    def test_get_type_manager_of_monthly_backups(self):
+        backup_manager = elastic.get_type_manager(
+            self.mock_es, 'backups',
+            backup_index_interval=elastic.BACKUP_INDEX_MONTHLY)
+        action = backup_manager.get_bulk_action(
+            {'backup_id': 'b', 'backup_metadata': {'timestamp': JAN_2016}},
+            'b')
+        self.assertEqual(action['_index'], 'freezer_backups-2016.01')
+
+
+class TestUserRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_es = Mock()
+        self.type_manager = elastic.JobTypeManager(
+            self.mock_es, 'jobs', routing=elastic.ROUTING_USER_ID)
+
+    def test_get_routing_is_empty_without_user_routing(self):
+        type_manager = elastic.JobTypeManager(self.mock_es, 'jobs')
+        self.assertEqual(type_manager.get_routing('my_user_id'), {})
+        self.assertEqual(self.type_manager.get_routing('my_user_id'),
+                         {'routing': 'my_user_id'})
+
+    def test_get_is_routed(self):
+        self.mock_es.get.return_value = {'_source': {'user_id': 'my_user_id'},
+                                         '_version': 1}
+        self.type_manager.get('my_user_id', 'my_doc_id')
+        self.assertEqual(self.mock_es.get.call_args[1]['routing'],
+                         'my_user_id')
+
+    def test_mget_routes_each_document(self):
+        self.mock_es.mget.return_value = {'docs': []}
+        self.type_manager.mget('my_user_id', ['a', 'b'])
+        self.assertEqual(self.mock_es.mget.call_args[1]['body'], {'docs': [
+            {'_id': 'a', '_routing': 'my_user_id'},
+            {'_id': 'b', '_routing': 'my_user_id'}]})
+
+    def test_search_and_count_are_routed(self):
+        self.mock_es.search.return_value = {'hits': {'hits': []}}
+        self.mock_es.count.return_value = {'count': 0}
+        self.type_manager.search('my_user_id')
+        self.type_manager.count('my_user_id')
+        self.assertEqual(self.mock_es.search.call_args[1]['routing'],
+                         'my_user_id')
+        self.assertEqual(self.mock_es.count.call_args[1]['routing'],
+                         'my_user_id')
+
+    def test_insert_is_routed_by_the_owner(self):
+        self.mock_es.index.return_value = {'created': True, '_version': 1}
+        self.type_manager.insert({'user_id': 'my_user_id'}, 'my_doc_id')
+        self.assertEqual(self.mock_es.index.call_args[1]['routing'],
+                         'my_user_id')
+
+    def test_update_is_routed(self):
+        self.mock_es.update.return_value = {
+            '_version': 2, 'get': {'fields': {'user_id': ['my_user_id']}}}
+        self.type_manager.update('my_user_id', 'my_doc_id', {'a': 1})
+        self.assertEqual(self.mock_es.update.call_args[1]['routing'],
+                         'my_user_id')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_bulk_insert_routes_each_document(self, mock_helpers):
+        mock_helpers.streaming_bulk.return_value = []
+        self.type_manager.bulk_insert([('a', {'user_id': 'my_user_id'})])
+        actions = mock_helpers.streaming_bulk.call_args[0][1]
+        self.assertEqual(actions[0]['_routing'], 'my_user_id')
+
+    @patch('freezer_api.storage.elastic.es_helpers')
+    def test_delete_scans_and_deletes_on_the_user_shard(self, mock_helpers):
+        mock_helpers.scan.return_value = [{'_id': 'a', '_index': 'freezer'}]
+        mock_helpers.bulk.return_value = (1, [])
+        self.assertEqual(self.type_manager.delete('my_user_id', 'a'), 1)
+        self.assertEqual(mock_helpers.scan.call_args[1]['routing'],
+                         'my_user_id')
+        actions = mock_helpers.bulk.call_args[0][1]
+        self.assertEqual(actions[0]['_routing'], 'my_user_id')
+
+    @patch('freezer_api.storage.elastic.elasticsearch')
+    def test_engine_routes_all_document_types(self, mock_elasticsearch):
+        engine = elastic.ElasticSearchEngine(
+            hosts='http://elasticservaddr:1997', routing='user_id')
+        for manager in [engine.backup_manager, engine.client_manager,
+                        engine.job_manager, engine.action_manager,
+                        engine.session_manager]:
+            self.assertEqual(manager.routing, elastic.ROUTING_USER_ID)
+
+
+class TestClientOptions(unittest.TestCase):
+
+    def test_get_client_options_maps_storage_options(self):
+        opts = elastic.get_client_options(hosts=['http://es:9200'],
+                                          connection_pool_maxsize=25,
+                                          keep_alive=False,
+                                          sniff_on_start=True,
+                                          sniffer_timeout=0,
+                                          dead_timeout=30,
+                                          retries=4)
+        self.assertEqual(opts, {'hosts': ['http://es:9200'],
+                                'connection_class': elastic.HttpConnection,
+                                'maxsize': 25,
+                                'keep_alive': False,
+                                'http_compress': False,
+                                'sniff_on_start': True,
+                                'sniffer_timeout': None,
+                                'dead_timeout': 30,
+                                'max_retries': 4})
+
+    def test_HttpConnection_sets_keep_alive_and_compression_headers(self):
+        conn = elastic.HttpConnection(host='es', keep_alive=False,
+                                      http_compress=True, maxsize=3)
+        self.assertEqual(conn.headers['connection'], 'close')
+        self.assertEqual(conn.headers['accept-encoding'], 'gzip,deflate')
+        self.assertEqual(conn.pool.pool.maxsize, 3)
+        conn = elastic.HttpConnection(host='es')
+        self.assertEqual(conn.headers['connection'], 'keep-alive')
+        self.assertNotIn('accept-encoding', conn.headers)
+
+    @patch('freezer_api.storage.elastic.os')
+    @patch('freezer_api.storage.elastic.elasticsearch')
+    def test_ClientProxy_creates_a_client_in_each_process(self, mock_es,
+                                                          mock_os):
+        mock_es.Elasticsearch.side_effect = [Mock(), Mock()]
+        mock_os.getpid.return_value = 100
+        proxy = elastic.ClientProxy(hosts=['http://es:9200'])
+        self.assertEqual(mock_es.Elasticsearch.call_count, 0)
+        parent_client = proxy.get_client()
+        proxy.ping()
+        self.assertEqual(mock_es.Elasticsearch.call_count, 1)
+        parent_client.ping.assert_called_once_with()
+        mock_os.getpid.return_value = 101
+        self.assertIsNot(proxy.get_client(), parent_client)
+        mock_es.Elasticsearch.assert_called_with(hosts=['http://es:9200'])
+        self.assertEqual(mock_es.Elasticsearch.call_count, 2)
 
 
 class TestElasticSearchEngine_backup(unittest.TestCase):
@@ -389,6 +1071,16 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
         kwargs = {'hosts': 'http://elasticservaddr:1997'}
         self.eng = elastic.ElasticSearchEngine(index='freezer', **kwargs)
         self.eng.backup_manager = Mock()
+        self.eng.backup_manager.get_doc_id.side_effect = \
+            elastic.BackupTypeManager(Mock(), 'backups').get_doc_id
+
+    def test_mget_backup_gets_the_backups_by_id(self):
+        self.eng.backup_manager.mget.return_value = [fake_data_0_wrapped_backup_metadata]
+        res = self.eng.mget_backup(fake_data_0_user_id, ['b1', 'b2'],
+                                   fields=['backup_id'])
+        self.assertEqual(res, [fake_data_0_wrapped_backup_metadata])
+        self.eng.backup_manager.mget.assert_called_once_with(
+            fake_data_0_user_id, ['b1', 'b2'], fields=['backup_id'])
 
     def test_get_backup_userid_and_backup_id_return_ok(self):
         self.eng.backup_manager.search.return_value = [fake_data_0_wrapped_backup_metadata]
@@ -403,7 +1095,7 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
             fake_data_0_wrapped_backup_metadata['user_id'],
             fake_data_0_wrapped_backup_metadata['backup_id'],
             search=my_search,
-            limit=7, offset=3)
+            limit=7, offset=3, after=None, fields=None)
 
     def test_get_backup_list_with_userid_and_search_return_list(self):
         self.eng.backup_manager.search.return_value = [fake_data_0_wrapped_backup_metadata,
@@ -419,7 +1111,7 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
             fake_data_0_wrapped_backup_metadata['user_id'],
             None,
             search=my_search,
-            limit=7, offset=3)
+            limit=7, offset=3, after=None, fields=None)
 
     def test_get_backup_list_with_userid_and_search_return_empty(self):
         self.eng.backup_manager.search.return_value = []
@@ -433,7 +1125,7 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
             fake_data_0_wrapped_backup_metadata['user_id'],
             None,
             search=my_search,
-            limit=7, offset=3)
+            limit=7, offset=3, after=None, fields=None)
 
     def test_get_backup_userid_and_backup_id_not_found_returns_empty(self):
         self.eng.backup_manager.search.return_value = []
@@ -448,7 +1140,7 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
             fake_data_0_wrapped_backup_metadata['user_id'],
             fake_data_0_wrapped_backup_metadata['backup_id'],
             search=my_search,
-            limit=7, offset=3)
+            limit=7, offset=3, after=None, fields=None)
 
     def test_add_backup_raises_when_data_is_malformed(self):
         self.assertRaises(BadDataFormat, self.eng.add_backup,
@@ -457,27 +1149,63 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
                           doc=fake_malformed_data_0_backup_metadata)
 
     def test_add_backup_ok(self):
-        self.eng.backup_manager.search.return_value = []
+        self.eng.backup_manager.insert.return_value = (True, 1)
         res = self.eng.add_backup(fake_data_0_user_id,
                                   user_name=fake_data_0_user_name,
                                   doc=fake_data_0_backup_metadata)
         self.assertEqual(res, fake_data_0_wrapped_backup_metadata['backup_id'])
+        self.assertFalse(self.eng.backup_manager.search.called)
+        args, kwargs = self.eng.backup_manager.insert.call_args
+        self.assertEqual(args[1], '{0}_{1}'.format(
+            fake_data_0_user_id,
+            fake_data_0_wrapped_backup_metadata['backup_id']))
+        self.assertEqual(kwargs, {'op_type': 'create', 'refresh': None})
 
     def test_add_backup_raises_when_doc_exists(self):
-        self.eng.backup_manager.search.return_value = [fake_data_0_wrapped_backup_metadata]
+        self.eng.backup_manager.insert.side_effect = DocumentExists('regular test failure')
         self.assertRaises(DocumentExists, self.eng.add_backup,
                           user_id=fake_data_0_user_id,
                           user_name=fake_data_0_user_name,
                           doc=fake_data_0_backup_metadata)
 
     def test_add_backup_raises_when_manager_insert_raises(self):
-        self.eng.backup_manager.search.return_value = []
         self.eng.backup_manager.insert.side_effect = StorageEngineError('regular test failure')
         self.assertRaises(StorageEngineError, self.eng.add_backup,
                           user_id=fake_data_0_user_id,
                           user_name=fake_data_0_user_name,
                           doc=fake_data_0_backup_metadata)
 
+    def test_add_backups_reports_status_of_each_document(self):
+        doc_1 = get_fake_backup_metadata(time_stamp=1)
+        doc_2 = get_fake_backup_metadata(time_stamp=2)
+        doc_3 = get_fake_backup_metadata(time_stamp=3)
+        id_1 = BackupMetadataDoc(fake_data_0_user_id, '', doc_1).backup_id
+        id_2 = BackupMetadataDoc(fake_data_0_user_id, '', doc_2).backup_id
+        id_3 = BackupMetadataDoc(fake_data_0_user_id, '', doc_3).backup_id
+        self.eng.backup_manager.bulk_insert.return_value = [
+            (True, {'status': 201}),
+            (False, {'status': 409, 'error': 'exists'}),
+            (False, {'status': 500, 'error': 'regular test failure'}),
+            (False, {'status': 409, 'error': 'exists'})]
+        res = self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name,
+                                   [doc_1, doc_2, 'not a backup', doc_3, doc_1])
+        self.assertEqual([r['status'] for r in res],
+                         ['created', 'conflict', 'error', 'error', 'conflict'])
+        self.assertEqual([r['backup_id'] for r in res],
+                         [id_1, id_2, None, id_3, id_1])
+        self.assertFalse(self.eng.backup_manager.search.called)
+        args, kwargs = self.eng.backup_manager.bulk_insert.call_args
+        self.assertEqual([doc_id for doc_id, _ in args[0]],
+                         [fake_data_0_user_id + '_' + backup_id
+                          for backup_id in [id_1, id_2, id_3, id_1]])
+        self.assertEqual(kwargs, {'op_type': 'create', 'refresh': None})
+
+    def test_add_backups_does_not_write_when_all_docs_are_malformed(self):
+        res = self.eng.add_backups(fake_data_0_user_id, fake_data_0_user_name,
+                                   [fake_malformed_data_0_backup_metadata])
+        self.assertEqual(res[0]['status'], 'error')
+        self.assertFalse(self.eng.backup_manager.bulk_insert.called)
+
     def test_delete_backup_ok(self):
         self.eng.backup_manager.delete.return_value = fake_data_0_backup_id
         res = self.eng.delete_backup(user_id=fake_data_0_user_id,
@@ -490,6 +1218,26 @@ class TestElasticSearchEngine_backup(unittest.TestCase):
                           user_id=fake_data_0_user_id,
                           backup_id=fake_data_0_backup_id)
 
+    def test_delete_backup_passes_the_refresh_policy(self):
+        self.eng.delete_backup(user_id=fake_data_0_user_id,
+                               backup_id=fake_data_0_backup_id,
+                               refresh=elastic.REFRESH_WAIT_FOR)
+        self.eng.backup_manager.delete.assert_called_once_with(
+            fake_data_0_user_id, fake_data_0_backup_id,
+            refresh=elastic.REFRESH_WAIT_FOR)
+
+    def test_delete_backups_does_not_refresh_by_default(self):
+        self.eng.delete_backups(fake_data_0_user_id, ['b1', 'b2'])
+        self.eng.backup_manager.mdelete.assert_called_once_with(
+            fake_data_0_user_id, ['b1', 'b2'], refresh=elastic.REFRESH_NONE)
+
+    def test_delete_backups_passes_the_refresh_policy(self):
+        self.eng.delete_backups(fake_data_0_user_id, ['b1', 'b2'],
+                                refresh=elastic.REFRESH_IMMEDIATE)
+        self.eng.backup_manager.mdelete.assert_called_once_with(
+            fake_data_0_user_id, ['b1', 'b2'],
+            refresh=elastic.REFRESH_IMMEDIATE)
+
 
 class TestElasticSearchEngine_client(unittest.TestCase):
 
@@ -514,7 +1262,7 @@ class TestElasticSearchEngine_client(unittest.TestCase):
             fake_client_entry_0['user_id'],
             fake_client_info_0['client_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_get_client_list_with_userid_and_search_return_list(self):
         self.eng.client_manager.search.return_value = [fake_client_entry_0, fake_client_entry_1]
@@ -528,7 +1276,7 @@ class TestElasticSearchEngine_client(unittest.TestCase):
             fake_client_entry_0['user_id'],
             None,
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_get_client_list_with_userid_and_search_return_empty_list(self):
         self.eng.client_manager.search.return_value = []
@@ -542,7 +1290,7 @@ class TestElasticSearchEngine_client(unittest.TestCase):
             fake_client_entry_0['user_id'],
             None,
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_add_client_raises_when_data_is_malformed(self):
         doc = fake_client_info_0.copy()
@@ -552,22 +1300,23 @@ class TestElasticSearchEngine_client(unittest.TestCase):
                           doc=doc)
 
     def test_add_client_raises_when_doc_exists(self):
-        self.eng.client_manager.search.return_value = [fake_client_entry_0]
+        self.eng.client_manager.insert.side_effect = DocumentExists('regular test failure')
         self.assertRaises(DocumentExists, self.eng.add_client,
                           user_id=fake_data_0_user_id,
                           doc=fake_client_info_0)
 
     def test_add_client_ok(self):
-        self.eng.client_manager.search.return_value = []
+        self.eng.client_manager.insert.return_value = (True, 1)
         res = self.eng.add_client(user_id=fake_data_0_user_id,
                                   doc=fake_client_info_0)
         self.assertEqual(res, fake_client_info_0['client_id'])
-        self.eng.client_manager.search.assert_called_with(
-            fake_data_0_user_id,
-            fake_client_info_0['client_id'])
+        self.assertFalse(self.eng.client_manager.search.called)
+        args, kwargs = self.eng.client_manager.insert.call_args
+        self.assertEqual(args[1], '{0}_{1}'.format(
+            fake_data_0_user_id, fake_client_info_0['client_id']))
+        self.assertEqual(kwargs, {'op_type': 'create', 'refresh': None})
 
     def test_add_client_raises_when_manager_insert_raises(self):
-        self.eng.client_manager.search.return_value = []
         self.eng.client_manager.insert.side_effect = StorageEngineError('regular test failure')
         self.assertRaises(StorageEngineError, self.eng.add_client,
                           user_id=fake_data_0_user_id,
@@ -602,7 +1351,8 @@ class TestElasticSearchEngine_job(unittest.TestCase):
         self.assertEqual(res, fake_job_0)
         self.eng.job_manager.get.assert_called_with(
             fake_client_entry_0['user_id'],
-            fake_client_info_0['client_id'])
+            fake_client_info_0['client_id'],
+            fields=None)
 
     def test_get_job_userid_and_job_id_return_none(self):
         self.eng.job_manager.get.return_value = None
@@ -611,7 +1361,8 @@ class TestElasticSearchEngine_job(unittest.TestCase):
         self.assertEqual(res, None)
         self.eng.job_manager.get.assert_called_with(
             fake_client_entry_0['user_id'],
-            fake_client_info_0['client_id'])
+            fake_client_info_0['client_id'],
+            fields=None)
 
     def test_get_job_with_userid_and_search_return_list(self):
         self.eng.job_manager.search.return_value = \
@@ -625,7 +1376,7 @@ class TestElasticSearchEngine_job(unittest.TestCase):
         self.eng.job_manager.search.assert_called_with(
             fake_job_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_get_job_with_userid_and_search_return_empty_list(self):
         self.eng.job_manager.search.return_value = []
@@ -638,7 +1389,7 @@ class TestElasticSearchEngine_job(unittest.TestCase):
         self.eng.job_manager.search.assert_called_with(
             fake_job_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     @patch('freezer_api.storage.elastic.JobDoc')
     def test_add_job_ok(self, mock_jobdoc):
@@ -648,7 +1399,8 @@ class TestElasticSearchEngine_job(unittest.TestCase):
                                doc=get_fake_job_0())
         self.assertEqual(res, fake_job_0_job_id)
         self.eng.job_manager.insert.assert_called_with(fake_job_0,
-                                                       fake_job_0_job_id)
+                                                       fake_job_0_job_id,
+                                                       refresh=None)
 
     def test_add_job_raises_StorageEngineError_when_manager_insert_raises(self):
         self.eng.job_manager.get.return_value = None
@@ -670,7 +1422,7 @@ class TestElasticSearchEngine_job(unittest.TestCase):
                           job_id=fake_job_0_job_id)
 
     def test_update_job_raises_DocumentNotFound_when_doc_not_exists(self):
-        self.eng.job_manager.get.side_effect = DocumentNotFound('regular test failure')
+        self.eng.job_manager.update.side_effect = DocumentNotFound('regular test failure')
         patch = {'job_id': 'black_milk'}
         self.assertRaises(DocumentNotFound, self.eng.update_job,
                           user_id=fake_job_0_user_id,
@@ -678,7 +1430,6 @@ class TestElasticSearchEngine_job(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_job_raises_DocumentNotFound_when_update_raises_DocumentNotFound(self):
-        self.eng.job_manager.get.return_value = get_fake_job_0()
         patch = {'job_id': 'black_milk'}
         self.eng.job_manager.update.side_effect = DocumentNotFound('regular test failure')
         self.assertRaises(DocumentNotFound, self.eng.update_job,
@@ -687,7 +1438,6 @@ class TestElasticSearchEngine_job(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_job_returns_new_doc_version(self):
-        self.eng.job_manager.get.return_value = get_fake_job_0()
         patch = {'job_id': 'group_four'}
         self.eng.job_manager.update.return_value = 11
         res = self.eng.update_job(user_id=fake_job_0_user_id,
@@ -696,29 +1446,44 @@ class TestElasticSearchEngine_job(unittest.TestCase):
         self.assertEqual(res, 11)
 
     def test_replace_job_raises_AccessForbidden_when_job_manager_raises_AccessForbidden(self):
-        self.eng.job_manager.get.side_effect = AccessForbidden('regular test failure')
-        self.eng.job_manager.insert.return_value = (True, 3)
+        self.eng.job_manager.replace.side_effect = AccessForbidden('regular test failure')
         self.assertRaises(AccessForbidden, self.eng.replace_job,
                           user_id=fake_job_0_user_id,
                           job_id=fake_job_0_job_id,
                           doc=get_fake_job_0())
 
     def test_replace_job_returns_ok_when_doc_is_new(self):
-        self.eng.job_manager.get.side_effect = DocumentNotFound('regular test failure')
-        self.eng.job_manager.insert.return_value = (True, 1)
+        self.eng.job_manager.replace.return_value = (True, 1)
         res = self.eng.replace_job(user_id=fake_job_0_user_id,
                                    job_id=fake_job_0_job_id,
                                    doc=get_fake_job_0())
         self.assertEqual(res, 1)
 
     def test_replace_job_returns_version_1_when_doc_is_overwritten(self):
-        self.eng.job_manager.get.return_value = get_fake_job_0()
-        self.eng.job_manager.insert.return_value = (False, 3)
+        self.eng.job_manager.replace.return_value = (False, 3)
         res = self.eng.replace_job(user_id=fake_job_0_user_id,
                                    job_id=fake_job_0_job_id,
                                    doc=get_fake_job_0())
         self.assertEqual(res, 3)
 
+    def test_update_job_passes_the_refresh_policy(self):
+        patch = {'job_id': 'group_four'}
+        self.eng.update_job(user_id=fake_job_0_user_id,
+                            job_id=fake_job_0_job_id,
+                            patch_doc=patch, refresh=elastic.REFRESH_NONE)
+        self.eng.job_manager.update.assert_called_once_with(
+            fake_job_0_user_id, fake_job_0_job_id, patch,
+            refresh=elastic.REFRESH_NONE)
+
+    def test_replace_job_passes_the_refresh_policy(self):
+        self.eng.job_manager.replace.return_value = (True, 1)
+        self.eng.replace_job(user_id=fake_job_0_user_id,
+                             job_id=fake_job_0_job_id,
+                             doc=get_fake_job_0(),
+                             refresh=elastic.REFRESH_WAIT_FOR)
+        args, kwargs = self.eng.job_manager.replace.call_args
+        self.assertEqual(kwargs, {'refresh': elastic.REFRESH_WAIT_FOR})
+
 
 class TestElasticSearchEngine_action(unittest.TestCase):
 
@@ -730,6 +1495,30 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.eng = elastic.ElasticSearchEngine(index='freezer', **kwargs)
         self.eng.action_manager = Mock()
 
+    def test_add_actions_writes_the_actions_with_one_bulk_request(self):
+        self.eng.action_manager.bulk_insert.return_value = [
+            (True, {'status': 201}), (True, {'status': 201})]
+        docs = [get_fake_action_0(), {'freezer_action': {}}]
+        res = self.eng.add_actions(fake_action_0['user_id'], docs)
+        self.assertEqual(res[0], fake_action_0['action_id'])
+        self.assertTrue(res[1])
+        self.eng.action_manager.bulk_insert.assert_called_once_with(
+            [(res[0], docs[0]), (res[1], docs[1])], op_type='create',
+            refresh=None)
+        self.assertEqual(docs[1]['user_id'], fake_action_0['user_id'])
+
+    def test_add_actions_raises_DocumentExists_on_existing_id(self):
+        self.eng.action_manager.bulk_insert.return_value = [
+            (False, {'status': 409, 'error': 'conflict'})]
+        self.assertRaises(DocumentExists, self.eng.add_actions,
+                          fake_action_0['user_id'], [get_fake_action_0()])
+
+    def test_add_actions_raises_StorageEngineError_on_failure(self):
+        self.eng.action_manager.bulk_insert.return_value = [
+            (False, {'status': 500, 'error': 'boom'})]
+        self.assertRaises(StorageEngineError, self.eng.add_actions,
+                          fake_action_0['user_id'], [get_fake_action_0()])
+
     def test_get_action_userid_and_action_id_return_doc(self):
         self.eng.action_manager.get.return_value = get_fake_action_0()
         res = self.eng.get_action(user_id=fake_action_0['user_id'],
@@ -737,7 +1526,8 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.assertEqual(res, fake_action_0)
         self.eng.action_manager.get.assert_called_with(
             fake_action_0['user_id'],
-            fake_action_0['action_id'])
+            fake_action_0['action_id'],
+            fields=None)
 
     def test_get_action_userid_and_action_id_return_none(self):
         self.eng.action_manager.get.return_value = None
@@ -746,7 +1536,8 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.assertEqual(res, None)
         self.eng.action_manager.get.assert_called_with(
             fake_action_0['user_id'],
-            fake_action_0['action_id'])
+            fake_action_0['action_id'],
+            fields=None)
 
     def test_get_action_with_userid_and_search_return_list(self):
         self.eng.action_manager.search.return_value = \
@@ -760,7 +1551,7 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.eng.action_manager.search.assert_called_with(
             fake_action_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_get_action_with_userid_and_search_return_empty_list(self):
         self.eng.action_manager.search.return_value = []
@@ -773,7 +1564,7 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.eng.action_manager.search.assert_called_with(
             fake_action_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     @patch('freezer_api.storage.elastic.ActionDoc')
     def test_add_action_ok(self, mock_actiondoc):
@@ -783,7 +1574,8 @@ class TestElasticSearchEngine_action(unittest.TestCase):
                                   doc=get_fake_action_0())
         self.assertEqual(res, fake_action_0['action_id'])
         self.eng.action_manager.insert.assert_called_with(fake_action_0,
-                                                          fake_action_0['action_id'])
+                                                          fake_action_0['action_id'],
+                                                          refresh=None)
 
     def test_add_action_raises_StorageEngineError_when_manager_insert_raises(self):
         self.eng.action_manager.get.return_value = None
@@ -805,7 +1597,7 @@ class TestElasticSearchEngine_action(unittest.TestCase):
                           action_id=fake_action_0['action_id'])
 
     def test_update_action_raises_DocumentNotFound_when_doc_not_exists(self):
-        self.eng.action_manager.get.side_effect = DocumentNotFound('regular test failure')
+        self.eng.action_manager.update.side_effect = DocumentNotFound('regular test failure')
         patch = {'action_id': 'black_milk'}
         self.assertRaises(DocumentNotFound, self.eng.update_action,
                           user_id=fake_action_0['action_id'],
@@ -813,7 +1605,6 @@ class TestElasticSearchEngine_action(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_action_raises_DocumentNotFound_when_update_raises_DocumentNotFound(self):
-        self.eng.action_manager.get.return_value = get_fake_action_0()
         patch = {'action_id': 'black_milk'}
         self.eng.action_manager.update.side_effect = DocumentNotFound('regular test failure')
         self.assertRaises(DocumentNotFound, self.eng.update_action,
@@ -822,7 +1613,6 @@ class TestElasticSearchEngine_action(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_action_returns_new_doc_version(self):
-        self.eng.action_manager.get.return_value = get_fake_action_0()
         patch = {'action_id': 'group_four'}
         self.eng.action_manager.update.return_value = 11
         res = self.eng.update_action(user_id=fake_action_0['action_id'],
@@ -831,8 +1621,7 @@ class TestElasticSearchEngine_action(unittest.TestCase):
         self.assertEqual(res, 11)
 
     def test_replace_action_raises_AccessForbidden_when_action_manager_raises_AccessForbidden(self):
-        self.eng.action_manager.get.side_effect = AccessForbidden('regular test failure')
-        self.eng.action_manager.insert.return_value = (True, 3)
+        self.eng.action_manager.replace.side_effect = AccessForbidden('regular test failure')
         self.assertRaises(AccessForbidden, self.eng.replace_action,
                           user_id=fake_action_0['action_id'],
                           action_id=fake_action_0['action_id'],
@@ -871,7 +1660,8 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                                    session_id=fake_session_0['session_id'])
         self.assertEqual(res, fake_session_0)
         self.eng.session_manager.get.assert_called_with(fake_session_0['user_id'],
-                                                        fake_session_0['session_id'])
+                                                        fake_session_0['session_id'],
+                                                        fields=None)
 
     def test_get_session_userid_and_session_id_return_none(self):
         self.eng.session_manager.get.return_value = None
@@ -880,7 +1670,8 @@ class TestElasticSearchEngine_session(unittest.TestCase):
         self.assertEqual(res, None)
         self.eng.session_manager.get.assert_called_with(
             fake_session_0['user_id'],
-            fake_session_0['session_id'])
+            fake_session_0['session_id'],
+            fields=None)
 
     def test_get_session_with_userid_and_search_return_list(self):
         self.eng.session_manager.search.return_value = \
@@ -894,7 +1685,7 @@ class TestElasticSearchEngine_session(unittest.TestCase):
         self.eng.session_manager.search.assert_called_with(
             fake_session_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     def test_get_session_with_userid_and_search_return_empty_list(self):
         self.eng.session_manager.search.return_value = []
@@ -907,7 +1698,7 @@ class TestElasticSearchEngine_session(unittest.TestCase):
         self.eng.session_manager.search.assert_called_with(
             fake_session_0['user_id'],
             search=my_search,
-            limit=15, offset=6)
+            limit=15, offset=6, after=None, fields=None)
 
     @patch('freezer_api.storage.elastic.SessionDoc')
     def test_add_session_ok(self, mock_sessiondoc):
@@ -917,7 +1708,8 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                                    doc=get_fake_session_0())
         self.assertEqual(res, fake_session_0['session_id'])
         self.eng.session_manager.insert.assert_called_with(fake_session_0,
-                                                           fake_session_0['session_id'])
+                                                           fake_session_0['session_id'],
+                                                           refresh=None)
 
     def test_add_session_raises_StorageEngineError_when_manager_insert_raises(self):
         self.eng.session_manager.get.return_value = None
@@ -939,7 +1731,7 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                           session_id=fake_session_0['session_id'])
 
     def test_update_session_raises_DocumentNotFound_when_doc_not_exists(self):
-        self.eng.session_manager.get.side_effect = DocumentNotFound('regular test failure')
+        self.eng.session_manager.update.side_effect = DocumentNotFound('regular test failure')
         patch = {'session_id': 'black_milk'}
         self.assertRaises(DocumentNotFound, self.eng.update_session,
                           user_id=fake_session_0['session_id'],
@@ -947,7 +1739,6 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_session_raises_DocumentNotFound_when_update_raises_DocumentNotFound(self):
-        self.eng.session_manager.get.return_value = get_fake_session_0()
         patch = {'session_id': 'black_milk'}
         self.eng.session_manager.update.side_effect = DocumentNotFound('regular test failure')
         self.assertRaises(DocumentNotFound, self.eng.update_session,
@@ -956,7 +1747,6 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                           patch_doc=patch)
 
     def test_update_session_returns_new_doc_version(self):
-        self.eng.session_manager.get.return_value = get_fake_session_0()
         patch = {'session_id': 'group_four'}
         self.eng.session_manager.update.return_value = 11
         res = self.eng.update_session(user_id=fake_session_0['session_id'],
@@ -964,25 +1754,32 @@ class TestElasticSearchEngine_session(unittest.TestCase):
                                      patch_doc=patch)
         self.assertEqual(res, 11)
 
+    def test_update_session_passes_expected_version(self):
+        patch = {'status': 'completed'}
+        self.eng.session_manager.update.return_value = 12
+        self.eng.update_session(user_id=fake_session_0['user_id'],
+                                session_id=fake_session_0['session_id'],
+                                patch_doc=patch, version=11)
+        self.eng.session_manager.update.assert_called_with(
+            fake_session_0['user_id'], fake_session_0['session_id'], patch,
+            version=11, refresh=None)
+
     def test_replace_session_raises_AccessForbidden_when_session_manager_raises_AccessForbidden(self):
-        self.eng.session_manager.get.side_effect = AccessForbidden('regular test failure')
-        self.eng.session_manager.insert.return_value = (True, 3)
+        self.eng.session_manager.replace.side_effect = AccessForbidden('regular test failure')
         self.assertRaises(AccessForbidden, self.eng.replace_session,
                           user_id=fake_session_0['session_id'],
                           session_id=fake_session_0['session_id'],
                           doc=get_fake_session_0())
 
     def test_replace_session_returns_ok_when_doc_is_new(self):
-        self.eng.session_manager.get.side_effect = DocumentNotFound('regular test failure')
-        self.eng.session_manager.insert.return_value = (True, 1)
+        self.eng.session_manager.replace.return_value = (True, 1)
         res = self.eng.replace_session(user_id=fake_session_0['session_id'],
                                       session_id=fake_session_0['session_id'],
                                       doc=get_fake_session_0())
         self.assertEqual(res, 1)
 
     def test_replace_session_returns_version_1_when_doc_is_overwritten(self):
-        self.eng.session_manager.get.return_value = get_fake_session_0()
-        self.eng.session_manager.insert.return_value = (False, 3)
+        self.eng.session_manager.replace.return_value = (False, 3)
         res = self.eng.replace_session(user_id=fake_session_0['session_id'],
                                       session_id=fake_session_0['session_id'],
                                       doc=get_fake_session_0())
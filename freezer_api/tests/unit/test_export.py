@@ -0,0 +1,208 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import io
+import json
+import os
+import tempfile
+import unittest
+from mock import Mock, patch
+
+import falcon
+
+from .common import *
+from freezer_api.common.exceptions import *
+
+from freezer_api.api.v1 import export as v1_export
+from freezer_api.cmd import manage
+from freezer_api.common import export
+from freezer_api.storage import memory
+
+
+class TestIterNdjson(unittest.TestCase):
+
+    def test_iter_ndjson_yields_batches_of_lines(self):
+        docs = ({'n': n} for n in range(5))
+        chunks = list(export.iter_ndjson(docs, batch_size=2))
+        self.assertEqual(len(chunks), 3)
+        lines = b''.join(chunks).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'n': n} for n in range(5)])
+
+    def test_iter_ndjson_yields_nothing_without_documents(self):
+        self.assertEqual(list(export.iter_ndjson([])), [])
+
+
+class TestReadNdjson(unittest.TestCase):
+
+    def test_read_ndjson_skips_blank_lines(self):
+        lines = [b'{"n": 1}\n', b'\n', '{"n": 2}\n']
+        self.assertEqual(list(export.read_ndjson(lines)),
+                         [{'n': 1}, {'n': 2}])
+
+    def test_read_ndjson_raises_on_malformed_lines(self):
+        docs = export.read_ndjson(['{"n": 1}', '{"n":'])
+        self.assertEqual(next(docs), {'n': 1})
+        self.assertRaises(BadDataFormat, next, docs)
+
+
+class TestExportResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_db.export.return_value = iter([get_fake_retention_0()])
+        self.mock_db.export_all.return_value = iter([])
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_retention_0['user_id']
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
+        self.mock_req.env = {'freezer.context': Mock(is_admin=False,
+                                                     roles=['member'])}
+        self.resource = v1_export.ExportResource(self.mock_db, 'retentions')
+        self.resource.json_body = Mock(return_value={})
+
+    def test_on_get_streams_the_documents_of_the_user(self):
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_db.export.assert_called_once_with(
+            'retentions', fake_retention_0['user_id'], search={},
+            fields=None)
+        self.assertEqual(self.mock_req.content_type, 'application/x-ndjson')
+        self.assertEqual(json.loads(b''.join(self.mock_req.stream).decode()),
+                         get_fake_retention_0())
+
+    def test_on_get_all_users_requires_admin(self):
+        self.mock_req.get_param_as_bool.return_value = True
+        self.assertRaises(AccessForbidden, self.resource.on_get,
+                          self.mock_req, self.mock_req)
+        self.assertFalse(self.mock_db.export.called)
+        self.assertFalse(self.mock_db.export_all.called)
+
+    def test_on_get_all_users_for_admins(self):
+        self.mock_req.get_param_as_bool.return_value = True
+        self.mock_req.env['freezer.context'].roles = ['admin']
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.mock_db.export_all.assert_called_once_with(
+            'retentions', search={}, fields=None)
+        self.assertFalse(self.mock_db.export.called)
+        self.assertEqual(self.mock_req.status, falcon.HTTP_200)
+
+
+class TestExportDocuments(unittest.TestCase):
+
+    def test_export_documents_writes_ndjson(self):
+        db = memory.MemoryEngine()
+        db.add_retention('user_a', {'keep_last': 1})
+        db.add_retention('user_b', {'keep_last': 2})
+        out = io.BytesIO()
+        self.assertEqual(manage.export_documents(db, 'retentions', out), 2)
+        docs = [json.loads(line) for line in
+                out.getvalue().decode('utf-8').splitlines()]
+        self.assertEqual([d['user_id'] for d in docs], ['user_a', 'user_b'])
+        out = io.BytesIO()
+        self.assertEqual(manage.export_documents(db, 'retentions', out,
+                                                 user_id='user_b'), 1)
+
+
+@patch('freezer_api.cmd.manage.es_helpers')
+@patch('freezer_api.cmd.manage.CONF')
+class TestImportDocuments(unittest.TestCase):
+
+    def setUp(self):
+        self.elk_manager = manage.ElasticSearchManager.__new__(
+            manage.ElasticSearchManager)
+        self.elk_manager.index = 'freezer'
+        self.elk_manager.elk = Mock()
+        self.elk_manager.elk.indices.get_settings.return_value = {
+            'freezer': {'settings': {'index.refresh_interval': '5s'}}}
+        self.path = self.write_export([get_fake_retention_0()])
+
+    def write_export(self, docs):
+        f = tempfile.NamedTemporaryFile(suffix='.ndjson', delete=False)
+        self.addCleanup(os.remove, f.name)
+        for chunk in export.iter_ndjson(docs):
+            f.write(chunk)
+        f.close()
+        return f.name
+
+    def set_conf(self, mock_conf):
+        mock_conf.storage.backup_index_interval = 'none'
+        mock_conf.storage.routing = 'user_id'
+        mock_conf.storage.number_of_replicas = 2
+
+    def test_import_writes_the_documents_with_their_ids(self, mock_conf,
+                                                        mock_helpers):
+        self.set_conf(mock_conf)
+        mock_helpers.parallel_bulk.side_effect = (
+            lambda client, actions, **kwargs: [(True, a) for a in actions])
+        self.assertEqual(self.elk_manager.import_documents(
+            'retentions', [self.path], thread_count=2), (1, 0))
+        kwargs = mock_helpers.parallel_bulk.call_args[1]
+        self.assertEqual(kwargs['thread_count'], 2)
+        self.assertFalse(kwargs['raise_on_error'])
+
+    def test_import_disables_the_refresh_while_it_runs(self, mock_conf,
+                                                       mock_helpers):
+        self.set_conf(mock_conf)
+        indices = self.elk_manager.elk.indices
+
+        def bulk(client, actions, **kwargs):
+            self.assertEqual(indices.put_settings.call_args[1]['body'],
+                             {'index': {'refresh_interval': '-1',
+                                        'number_of_replicas': 0}})
+            action = list(actions)[0]
+            self.assertEqual(action['_id'],
+                             fake_retention_0['retention_id'])
+            self.assertEqual(action['_routing'], fake_retention_0['user_id'])
+            return [(False, {'error': 'boom'})]
+
+        mock_helpers.parallel_bulk.side_effect = bulk
+        self.assertEqual(self.elk_manager.import_documents(
+            'retentions', [self.path]), (0, 1))
+        indices.put_settings.assert_called_with(
+            index='freezer', body={'index': {'refresh_interval': '5s',
+                                             'number_of_replicas': 2}})
+        indices.refresh.assert_called_once_with(index='freezer')
+
+    def test_import_restores_the_settings_on_failure(self, mock_conf,
+                                                     mock_helpers):
+        self.set_conf(mock_conf)
+        mock_helpers.parallel_bulk.side_effect = Exception('down')
+        self.assertRaises(Exception, self.elk_manager.import_documents,
+                          'retentions', [self.path])
+        self.assertEqual(
+            self.elk_manager.elk.indices.put_settings.call_args[1]['body'],
+            {'index': {'refresh_interval': '5s', 'number_of_replicas': 2}})
+
+    def test_import_restores_a_configured_0_replicas(self, mock_conf,
+                                                     mock_helpers):
+        self.set_conf(mock_conf)
+        mock_conf.storage.number_of_replicas = 0
+        mock_helpers.parallel_bulk.return_value = []
+        self.elk_manager.import_documents('retentions', [self.path])
+        self.assertEqual(
+            self.elk_manager.elk.indices.put_settings.call_args[1]['body'],
+            {'index': {'refresh_interval': '5s', 'number_of_replicas': 0}})
+
+    def test_import_restores_the_default_replicas_when_unset(self, mock_conf,
+                                                             mock_helpers):
+        self.set_conf(mock_conf)
+        mock_conf.storage.number_of_replicas = None
+        mock_helpers.parallel_bulk.return_value = []
+        self.elk_manager.import_documents('retentions', [self.path])
+        self.assertEqual(
+            self.elk_manager.elk.indices.put_settings.call_args[1]['body'],
+            {'index': {'refresh_interval': '5s',
+                       'number_of_replicas': manage.DEFAULT_REPLICAS}})
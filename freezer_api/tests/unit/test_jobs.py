@@ -34,98 +34,82 @@ class TestJobsBaseResource(unittest.TestCase):
         self.mock_db = Mock()
         self.resource = v1_jobs.JobsBaseResource(self.mock_db)
 
-    def test_get_action_returns_found_action(self):
-        self.mock_db.get_action.return_value = 'awesome_result'
-        result = self.resource.get_action('user-id', 'action-id')
-        self.assertEquals(result, 'awesome_result')
-
-    def test_get_action_returns_none_when_action_not_found(self):
-        self.mock_db.get_action.side_effect = DocumentNotFound('regular test failure')
-        result = self.resource.get_action('user-id', 'action-id')
-        self.assertIsNone(result)
-
-    def test_update_actions_in_job_no_action_id(self):
-        self.resource.get_action = Mock()
-        self.resource.get_action.return_value = None
+    def get_action_doc(self, action_id=None, container='freezer_backup_test'):
         action_doc = {
-                #"action_id": "ottonero",
                 "freezer_action": {
                                 "mode" : "mysql",
-                                "container": "freezer_backup_test"
+                                "container": container
                 },
                 "max_retries": 3
             }
-        job_doc = {"job_actions": [action_doc.copy()],
+        if action_id is not None:
+            action_doc['action_id'] = action_id
+        return action_doc
+
+    def test_update_actions_in_job_no_action_id(self):
+        job_doc = {"job_actions": [self.get_action_doc()],
                    "description": "three actions backup"
                    }
         self.resource.update_actions_in_job('duder', job_doc=job_doc)
-        self.mock_db.add_action.assert_called_with(user_id='duder',
-                                                   doc=action_doc)
+        self.mock_db.mget_action.assert_not_called()
+        docs = self.mock_db.add_actions.call_args[1]['docs']
+        self.assertEqual(len(docs), 1)
+        self.assertTrue(docs[0]['action_id'])
+        self.assertEqual(job_doc['job_actions'][0]['action_id'],
+                         docs[0]['action_id'])
 
     def test_update_actions_in_job_action_id_not_found(self):
-        self.resource.get_action = Mock()
-        self.resource.get_action.return_value = None
-        action_doc = {
-                "action_id": "ottonero",
-                "freezer_action": {
-                                "mode" : "mysql",
-                                "container": "freezer_backup_test"
-                },
-                "max_retries": 3
-            }
-        job_doc = {"job_actions": [action_doc.copy()],
+        self.mock_db.mget_action.return_value = []
+        job_doc = {"job_actions": [self.get_action_doc('ottonero')],
                    "description": "three actions backup"
                    }
         self.resource.update_actions_in_job('duder', job_doc=job_doc)
-        self.mock_db.add_action.assert_called_with(user_id='duder',
-                                                   doc=action_doc)
+        self.mock_db.mget_action.assert_called_once_with(
+            user_id='duder', action_ids=['ottonero'],
+            fields=['freezer_action'])
+        self.mock_db.add_actions.assert_called_once_with(
+            user_id='duder', docs=[self.get_action_doc('ottonero')])
 
     def test_update_actions_in_job_action_id_found_and_same_action(self):
-        self.resource.get_action = Mock()
-        action_doc = {
-                "action_id": "ottonero",
-                "freezer_action": {
-                                "mode" : "mysql",
-                                "container": "freezer_backup_test"
-                },
-                "max_retries": 3
-            }
-        job_doc = {"job_actions": [action_doc.copy()],
+        self.mock_db.mget_action.return_value = [
+            self.get_action_doc('ottonero')]
+        job_doc = {"job_actions": [self.get_action_doc('ottonero')],
                    "description": "three actions backup"
                    }
-        self.resource.get_action.return_value = action_doc.copy()
         self.resource.update_actions_in_job('duder', job_doc=job_doc)
-        self.mock_db.add_action.assert_not_called()
+        self.mock_db.add_actions.assert_not_called()
 
     def test_update_actions_in_job_action_id_found_and_different_action(self):
-        self.resource.get_action = Mock()
-        action_doc = {
-                "action_id": "ottonero",
-                "freezer_action": {
-                                "mode" : "mysql",
-                                "container": "freezer_backup_test"
-                },
-                "max_retries": 3
-            }
-        job_doc = {"job_actions": [action_doc.copy()],
+        self.mock_db.mget_action.return_value = [
+            self.get_action_doc('ottonero', container='different_drum')]
+        job_doc = {"job_actions": [self.get_action_doc('ottonero')],
                    "description": "three actions backup"
                    }
-
-        found_action = {
-                "action_id": "ottonero",
-                "freezer_action": {
-                                "mode" : "mysql",
-                                "container": "different_drum"
-                },
-                "max_retries": 4
-            }
-
-        new_doc = action_doc.copy()
-        new_doc['action_id'] = ''
-        self.resource.get_action.return_value = found_action
         self.resource.update_actions_in_job('duder', job_doc=job_doc)
-        self.mock_db.add_action.assert_called_with(user_id='duder',
-                                                   doc=new_doc)
+        docs = self.mock_db.add_actions.call_args[1]['docs']
+        self.assertEqual(len(docs), 1)
+        self.assertNotIn(docs[0]['action_id'], ['ottonero', ''])
+        self.assertEqual(docs[0]['freezer_action']['container'],
+                         'freezer_backup_test')
+
+    def test_update_actions_in_job_reads_and_writes_all_actions_at_once(self):
+        self.mock_db.mget_action.return_value = [
+            self.get_action_doc('a1'),
+            self.get_action_doc('a2', container='different_drum')]
+        job_doc = {"job_actions": [self.get_action_doc('a1'),
+                                   self.get_action_doc('a2'),
+                                   self.get_action_doc('a3'),
+                                   self.get_action_doc('a3'),
+                                   self.get_action_doc()]}
+        self.resource.update_actions_in_job('duder', job_doc=job_doc)
+        self.mock_db.mget_action.assert_called_once_with(
+            user_id='duder', action_ids=['a1', 'a2', 'a3', 'a3'],
+            fields=['freezer_action'])
+        self.assertEqual(self.mock_db.add_actions.call_count, 1)
+        docs = self.mock_db.add_actions.call_args[1]['docs']
+        # a1 is unchanged, the second a3 is the same as the first
+        self.assertEqual(len(docs), 3)
+        self.assertEqual(docs[1]['action_id'], 'a3')
 
 
 class TestJobsCollectionResource(unittest.TestCase):
@@ -136,6 +120,9 @@ class TestJobsCollectionResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_job_0_user_id
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_jobs.JobsCollectionResource(self.mock_db)
         self.resource.json_body = self.mock_json_body
@@ -171,6 +158,7 @@ class TestJobsResource(unittest.TestCase):
     def setUp(self):
         self.mock_db = Mock()
         self.mock_req = Mock()
+        self.mock_req.get_param.return_value = None
         self.mock_req.stream.read.return_value = {}
         self.mock_req.get_header.return_value = fake_job_0_user_id
         self.mock_req.status = falcon.HTTP_200
@@ -214,11 +202,22 @@ class TestJobsResource(unittest.TestCase):
         self.mock_db.update_job.assert_called_with(
             user_id=fake_job_0_user_id,
             job_id=fake_job_0_job_id,
-            patch_doc=patch_doc)
+            patch_doc=patch_doc, refresh=None)
         self.assertEqual(self.mock_req.status, falcon.HTTP_200)
         result = self.mock_req.body
         self.assertEqual(result, expected_result)
 
+    def test_on_patch_passes_the_refresh_parameter(self):
+        patch_doc = {'job_schedule': {}}
+        self.mock_req.stream.read.return_value = json.dumps(patch_doc)
+        self.mock_req.get_param.return_value = 'immediate'
+        self.resource.update_actions_in_job = Mock()
+        self.resource.on_patch(self.mock_req, self.mock_req, fake_job_0_job_id)
+        self.mock_db.update_job.assert_called_with(
+            user_id=fake_job_0_user_id,
+            job_id=fake_job_0_job_id,
+            patch_doc=patch_doc, refresh='immediate')
+
     def test_on_post_ok(self):
         new_version = random.randint(0, 99)
         self.mock_db.replace_job.return_value = new_version
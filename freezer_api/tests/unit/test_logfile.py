@@ -0,0 +1,121 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+from freezer_api.common.exceptions import DocumentNotFound
+from freezer_api.common.exceptions import StorageEngineError
+from freezer_api.storage import logfile
+
+from .common import fake_data_0_user_id
+from .common import get_fake_backup_metadata
+from .common import get_fake_job_0
+from .engine_behaviour import StorageEngineBehaviour
+
+
+class LogFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.eng = self.open_engine()
+
+    def tearDown(self):
+        self.eng.journal.close()
+        shutil.rmtree(self.path)
+
+    def open_engine(self, **kwargs):
+        return logfile.LogFileEngine(logfile_path=self.path, **kwargs)
+
+    def reopen_engine(self, **kwargs):
+        self.eng.journal.close()
+        self.eng = self.open_engine(**kwargs)
+
+    def count_log_entries(self):
+        return len(list(logfile.read_entries(self.eng.journal.log_path)))
+
+
+class TestLogFileEngine(StorageEngineBehaviour, LogFileTestCase):
+    pass
+
+
+class TestLogFileDurability(LogFileTestCase):
+
+    def test_changes_are_replayed_at_startup(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.eng.update_job(fake_data_0_user_id, job_id,
+                            {'description': 'updated'})
+        deleted_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.eng.delete_job(fake_data_0_user_id, deleted_id)
+        self.reopen_engine()
+        job = self.eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['description'], 'updated')
+        self.assertEqual(job['_version'], 2)
+        self.assertRaises(DocumentNotFound, self.eng.get_job,
+                          fake_data_0_user_id, deleted_id)
+        self.assertEqual(
+            [j['job_id'] for j in self.eng.search_job(fake_data_0_user_id)],
+            [job_id])
+
+    def test_log_is_compacted_at_startup(self):
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.assertEqual(self.count_log_entries(), 1)
+        self.reopen_engine()
+        self.assertEqual(self.count_log_entries(), 0)
+        self.assertTrue(os.path.exists(self.eng.journal.snapshot_path))
+        self.assertEqual(len(self.eng.search_job(fake_data_0_user_id)), 1)
+
+    def test_log_is_compacted_after_compact_after_changes(self):
+        self.reopen_engine(logfile_compact_after=3)
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.assertEqual(self.count_log_entries(), 2)
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.assertEqual(self.count_log_entries(), 0)
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.reopen_engine()
+        self.assertEqual(len(self.eng.search_job(fake_data_0_user_id)), 4)
+
+    def test_incomplete_last_entry_is_skipped(self):
+        job_id = self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        with open(self.eng.journal.log_path, 'ab') as f:
+            f.write(b'{"type": "jobs", "id"')
+        self.reopen_engine()
+        self.assertEqual(
+            [j['job_id'] for j in self.eng.search_job(fake_data_0_user_id)],
+            [job_id])
+
+    def test_corrupted_entry_raises(self):
+        self.eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        self.eng.journal.close()
+        with open(self.eng.journal.log_path, 'rb') as f:
+            entry = f.read()
+        with open(self.eng.journal.log_path, 'wb') as f:
+            f.write(b'garbage\n' + entry)
+        self.assertRaises(StorageEngineError, self.open_engine)
+
+    def test_bulk_insert_is_flushed_once(self):
+        docs = [get_fake_backup_metadata(time_stamp=t) for t in range(5)]
+        with patch.object(self.eng.journal, 'flush') as mock_flush:
+            self.eng.add_backups(fake_data_0_user_id, 'name', docs)
+        self.assertEqual(mock_flush.call_count, 1)
+        self.eng.journal.flush()
+        self.assertEqual(self.count_log_entries(), 5)
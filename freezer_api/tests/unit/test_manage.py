@@ -0,0 +1,50 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+import unittest
+from mock import Mock, patch
+
+from freezer_api.cmd import manage
+
+
+@patch('freezer_api.cmd.manage.CONF')
+class TestElasticSearchManager(unittest.TestCase):
+
+    def setUp(self):
+        self.elk_manager = manage.ElasticSearchManager.__new__(
+            manage.ElasticSearchManager)
+        self.elk_manager.index = 'freezer'
+        self.elk_manager.elk = Mock()
+
+    def test_sync_backup_partitions_keeps_0_replicas(self, mock_conf):
+        mock_conf.storage.number_of_replicas = 0
+        self.elk_manager.elk.indices.exists_alias.return_value = False
+        self.elk_manager.sync_backup_partitions({'properties': {}})
+        template = self.elk_manager.elk.indices.put_template.call_args[1]
+        self.assertEqual(template['body']['settings'],
+                         {'number_of_replicas': 0})
+
+    def test_reindex_keeps_0_replicas(self, mock_conf):
+        mock_conf.yes = True
+        mock_conf.storage.number_of_replicas = 0
+        mock_conf.storage.backup_index_interval = 'none'
+        self.elk_manager.mappings = {}
+        self.elk_manager.copy_documents = Mock()
+        self.elk_manager.elk.indices.exists_alias.return_value = True
+        self.elk_manager.elk.indices.get_alias.return_value = {'old': {}}
+        self.elk_manager.reindex()
+        body = self.elk_manager.elk.indices.create.call_args[1]['body']
+        self.assertEqual(body['settings'], {'number_of_replicas': 0})
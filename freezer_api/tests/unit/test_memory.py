@@ -0,0 +1,53 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from freezer_api.storage import memory
+
+from .engine_behaviour import StorageEngineBehaviour
+
+
+class TestMemoryEngine(StorageEngineBehaviour, unittest.TestCase):
+
+    def setUp(self):
+        self.eng = memory.MemoryEngine(hosts=['http://unused:9200'])
+
+
+class TestMemoryHelpers(unittest.TestCase):
+
+    def test_get_field_values_follows_dotted_path_and_lists(self):
+        doc = {'a': {'b': [1, 2]}, 'c': 3}
+        self.assertEqual(memory.get_field_values(doc, 'a.b'), [1, 2])
+        self.assertEqual(memory.get_field_values(doc, 'a.x'), [])
+
+    def test_get_field_values_resolves_nested_field_by_name(self):
+        doc = {'backup_metadata': {'timestamp': 5}}
+        self.assertEqual(memory.get_field_values(doc, 'timestamp'), [5])
+
+    def test_merge_is_recursive(self):
+        doc = {'a': {'b': 1, 'c': 2}, 'd': 3}
+        memory.merge(doc, {'a': {'b': 10}, 'e': 4})
+        self.assertEqual(doc, {'a': {'b': 10, 'c': 2}, 'd': 3, 'e': 4})
+
+    def test_backup_timestamp_index_follows_deletes(self):
+        manager = memory.MemoryBackupManager('backups')
+        manager.insert({'user_id': 'u', 'backup_id': 'b1',
+                        'backup_metadata': {'timestamp': 5}}, 'b1')
+        manager.delete('u', 'b1')
+        self.assertEqual(manager.user_timestamps['u'], [])
+        self.assertEqual(manager.user_keys['u'], [])
@@ -0,0 +1,80 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+import unittest
+from mock import Mock
+
+from freezer_api.api.v1 import metrics as v1_metrics
+from freezer_api.common.exceptions import AccessForbidden
+from freezer_api.common import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_get_returns_0_for_unknown_counter(self):
+        self.assertEqual(metrics.get('never_seen'), 0)
+
+    def test_incr_adds_to_counter(self):
+        metrics.incr('conflicts')
+        metrics.incr('conflicts', 4)
+        self.assertEqual(metrics.get('conflicts'), 5)
+
+    def test_snapshot_returns_a_copy(self):
+        metrics.incr('retries')
+        snap = metrics.snapshot()
+        metrics.incr('retries')
+        self.assertEqual(snap, {'retries': 1})
+        self.assertEqual(metrics.get('retries'), 2)
+
+
+class TestMetricsResource(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+        self.mock_req = Mock()
+        self.mock_req.env = {'freezer.context': Mock(is_admin=False,
+                                                     roles=['admin'])}
+        self.resource = v1_metrics.MetricsResource()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_on_get_returns_the_counters_of_the_worker(self):
+        metrics.incr('session_action_conflicts', 2)
+        metrics.incr('session_action_retries')
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(self.mock_req.body, {
+            'pid': os.getpid(),
+            'counters': {'session_action_conflicts': 2,
+                         'session_action_retries': 1}})
+
+    def test_on_get_requires_admin(self):
+        self.mock_req.env['freezer.context'].roles = ['member']
+        self.assertRaises(AccessForbidden, self.resource.on_get,
+                          self.mock_req, self.mock_req)
+
+    def test_on_get_requires_a_context(self):
+        self.mock_req.env = {}
+        self.assertRaises(AccessForbidden, self.resource.on_get,
+                          self.mock_req, self.mock_req)
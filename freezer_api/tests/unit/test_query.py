@@ -0,0 +1,84 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+
+from freezer_api.common import db_mappings
+from freezer_api.storage import query
+
+
+class TestKeywordFields(unittest.TestCase):
+
+    def test_get_keyword_fields_returns_dotted_not_analyzed_fields(self):
+        fields = query.get_keyword_fields(db_mappings.clients_mapping)
+        self.assertEqual(fields, set(['client.client_id', 'client.config_id',
+                                      'user_id', 'uuid']))
+
+    def test_get_keyword_fields_of_backups(self):
+        fields = query.get_keyword_fields(db_mappings.backups_mapping)
+        self.assertIn('backup_id', fields)
+        self.assertIn('backup_metadata.container', fields)
+        self.assertNotIn('backup_metadata.hostname', fields)
+
+
+class TestQueryBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.builder = query.QueryBuilder.for_doc_type('jobs', 'job_id')
+
+    def test_build_with_user_id_only_uses_filters(self):
+        q = self.builder.build('my_user_id')
+        self.assertEqual(q, {'query': {'filtered': {
+            'filter': {'bool': {'must': [{'term': {'user_id': 'my_user_id'}}]}}}}})
+
+    def test_build_turns_keyword_matches_into_term_filters(self):
+        search = {'match': [{'client_id': 'my_client'}, {'description': 'nightly'}],
+                  'match_not': [{'session_id': 'my_session'}, {'job_event': 'stop'}]}
+        q = self.builder.build('my_user_id', 'my_job_id', search)
+        self.assertEqual(q, {'query': {'filtered': {
+            'filter': {'bool': {
+                'must': [{'term': {'user_id': 'my_user_id'}},
+                         {'term': {'job_id': 'my_job_id'}},
+                         {'term': {'client_id': 'my_client'}}],
+                'must_not': [{'term': {'session_id': 'my_session'}}]}},
+            'query': {'bool': {'must': [{'match': {'description': 'nightly'}}],
+                               'must_not': [{'match': {'job_event': 'stop'}}]}}}}})
+
+    def test_build_without_user_id_keeps_the_owner_filter(self):
+        q = self.builder.build(None)
+        self.assertEqual(q['query']['filtered']['filter']['bool']['must'],
+                         [{'term': {'user_id': None}}])
+
+    def test_build_for_all_users_matches_every_owner(self):
+        q = self.builder.build(None, all_users=True)
+        self.assertEqual(q['query']['filtered']['filter']['bool']['must'],
+                         [{'match_all': {}}])
+
+    def test_build_appends_additional_filters(self):
+        q = self.builder.build('my_user_id', filters=[{'exists': {'field': 'x'}}])
+        self.assertEqual(q['query']['filtered']['filter']['bool']['must'][-1],
+                         {'exists': {'field': 'x'}})
+
+    def test_build_returns_new_query_each_time(self):
+        q = self.builder.build('my_user_id')
+        query.add_filter(q, {'range': {'job_id': {'gt': 'a'}}})
+        self.assertEqual(len(self.builder.build('my_user_id')['query']['filtered']
+                             ['filter']['bool']['must']), 1)
+
+    def test_unknown_doc_type_only_knows_user_id_and_id_field(self):
+        builder = query.QueryBuilder.for_doc_type('sessions', 'session_id')
+        self.assertEqual(builder.keyword_fields, set(['user_id', 'session_id']))
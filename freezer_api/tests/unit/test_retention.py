@@ -0,0 +1,110 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+from mock import patch
+
+from freezer_api.cmd import manage
+from freezer_api.common import retention
+from freezer_api.storage import memory
+
+from .common import get_fake_backup_metadata
+
+DAY = retention.DAY
+
+
+def fake_backup(timestamp, level, hostname='alpha'):
+    return {'backup_id': '{0}_{1}_{2}'.format(hostname, timestamp, level),
+            'backup_metadata': {'container': 'freezer_container',
+                                'hostname': hostname,
+                                'backup_name': 'important_data_backup',
+                                'timestamp': timestamp,
+                                'curr_backup_level': level}}
+
+
+# three chains of alpha: days 1-2, 3-5 and 6
+BACKUPS = [fake_backup(DAY * t, l) for t, l in
+           [(1, 0), (2, 1), (3, 0), (4, 1), (5, 2), (6, 0)]]
+
+
+class TestRetentionRules(unittest.TestCase):
+
+    def test_get_chains_starts_a_chain_at_each_level_0_backup(self):
+        chains = retention.get_chains(reversed(BACKUPS))
+        self.assertEqual([len(chain) for chain in chains], [2, 3, 1])
+
+    def test_keep_last_keeps_the_most_recent_chains(self):
+        expired = retention.get_expired_backups([{'keep_last': 2}], BACKUPS,
+                                                now=DAY * 7)
+        self.assertEqual(expired, ['alpha_172800_1', 'alpha_86400_0'])
+
+    def test_keep_days_keeps_the_chains_with_a_recent_backup(self):
+        expired = retention.get_expired_backups([{'keep_days': 1}], BACKUPS,
+                                                now=DAY * 7)
+        self.assertEqual(len(expired), 5)
+        expired = retention.get_expired_backups([{'keep_days': 3}], BACKUPS,
+                                                now=DAY * 7)
+        # the chain started on day 3 holds a backup of day 5
+        self.assertEqual(expired, ['alpha_172800_1', 'alpha_86400_0'])
+
+    def test_chains_kept_by_any_rule_are_kept(self):
+        expired = retention.get_expired_backups(
+            [{'keep_last': 1}, {'keep_days': 3}], BACKUPS, now=DAY * 7)
+        self.assertEqual(len(expired), 2)
+
+    def test_rules_only_apply_to_the_matching_backup_sets(self):
+        backups = BACKUPS + [fake_backup(DAY, 0, hostname='beta'),
+                             fake_backup(DAY * 2, 0, hostname='beta')]
+        expired = retention.get_expired_backups(
+            [{'keep_last': 1, 'hostname': 'beta'}], backups, now=DAY * 7)
+        self.assertEqual(expired, ['beta_86400_0'])
+
+    def test_iter_expired_backups_batches_the_backups_of_each_user(self):
+        db = memory.MemoryEngine()
+        docs = [get_fake_backup_metadata(time_stamp=t, timestamp=t,
+                                         curr_backup_level=0)
+                for t in range(1, 6)]
+        db.add_backups('user_a', 'name', docs)
+        db.add_retention('user_a', {'keep_last': 2})
+        db.add_retention('user_b', {'keep_last': 1})
+        res = list(retention.iter_expired_backups(db, batch_size=2))
+        self.assertEqual([(user_id, len(ids)) for user_id, ids in res],
+                         [('user_a', 2), ('user_a', 1)])
+
+
+class TestPruneBackups(unittest.TestCase):
+
+    def setUp(self):
+        self.db = memory.MemoryEngine()
+        docs = [get_fake_backup_metadata(time_stamp=t, timestamp=t,
+                                         curr_backup_level=0)
+                for t in range(1, 4)]
+        self.db.add_backups('user_a', 'name', docs)
+        self.db.add_retention('user_a', {'keep_last': 1})
+
+    def test_dry_run_deletes_nothing(self):
+        self.assertEqual(manage.prune_backups(self.db, dry_run=True), 2)
+        self.assertEqual(self.db.count_backup('user_a'), 3)
+
+    @patch('freezer_api.cmd.manage.time')
+    def test_prune_deletes_in_batches_at_the_rate_limit(self, mock_time):
+        mock_time.time.return_value = 100
+        self.assertEqual(manage.prune_backups(self.db, batch_size=1,
+                                              rate_limit=2), 2)
+        self.assertEqual(self.db.count_backup('user_a'), 1)
+        self.assertEqual([c[0][0] for c in mock_time.sleep.call_args_list],
+                         [0.5, 0.5])
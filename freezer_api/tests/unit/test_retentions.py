@@ -0,0 +1,121 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import unittest
+from mock import Mock
+
+import falcon
+
+from .common import *
+from freezer_api.common.exceptions import *
+
+from freezer_api.api.v1 import retentions as v1_retentions
+
+
+class TestRetentionsCollectionResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_retention_0['user_id']
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
+        self.mock_req.status = falcon.HTTP_200
+        self.resource = v1_retentions.RetentionsCollectionResource(
+            self.mock_db)
+        self.mock_json_body = Mock()
+        self.mock_json_body.return_value = {}
+        self.resource.json_body = self.mock_json_body
+
+    def test_on_get_return_correct_list(self):
+        self.mock_db.search_retention.return_value = [get_fake_retention_0()]
+        self.resource.on_get(self.mock_req, self.mock_req)
+        self.assertEqual(self.mock_req.body,
+                         {'retentions': [get_fake_retention_0()]})
+        self.assertEqual(self.mock_req.status, falcon.HTTP_200)
+
+    def test_on_post_raises_when_missing_body(self):
+        self.assertRaises(BadDataFormat, self.resource.on_post,
+                          self.mock_req, self.mock_req)
+
+    def test_on_post_inserts_correct_data(self):
+        self.mock_json_body.return_value = get_fake_retention_0()
+        self.mock_db.add_retention.return_value = 'keepthreechains'
+        self.resource.on_post(self.mock_req, self.mock_req)
+        self.mock_db.add_retention.assert_called_once_with(
+            user_id=fake_retention_0['user_id'], doc=get_fake_retention_0(),
+            refresh=None)
+        self.assertEqual(self.mock_req.status, falcon.HTTP_201)
+        self.assertEqual(self.mock_req.body,
+                         {'retention_id': 'keepthreechains'})
+
+
+class TestRetentionsResource(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_db = Mock()
+        self.mock_req = Mock()
+        self.mock_req.get_header.return_value = fake_retention_0['user_id']
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.status = falcon.HTTP_200
+        self.resource = v1_retentions.RetentionsResource(self.mock_db)
+        self.mock_json_body = Mock()
+        self.mock_json_body.return_value = {}
+        self.resource.json_body = self.mock_json_body
+
+    def test_on_get_return_no_result_and_404_when_not_found(self):
+        self.mock_db.get_retention.return_value = None
+        self.mock_req.body = None
+        self.resource.on_get(self.mock_req, self.mock_req, 'keepthreechains')
+        self.assertIsNone(self.mock_req.body)
+        self.assertEqual(self.mock_req.status, falcon.HTTP_404)
+
+    def test_on_get_return_correct_data(self):
+        self.mock_db.get_retention.return_value = get_fake_retention_0()
+        self.resource.on_get(self.mock_req, self.mock_req, 'keepthreechains')
+        self.assertEqual(self.mock_req.body, get_fake_retention_0())
+
+    def test_on_delete_removes_proper_data(self):
+        self.resource.on_delete(self.mock_req, self.mock_req,
+                                'keepthreechains')
+        self.mock_db.delete_retention.assert_called_once_with(
+            user_id=fake_retention_0['user_id'],
+            retention_id='keepthreechains', refresh=None)
+        self.assertEqual(self.mock_req.status, falcon.HTTP_204)
+
+    def test_on_patch_ok_with_some_fields(self):
+        self.mock_db.update_retention.return_value = 4
+        self.mock_json_body.return_value = {'keep_days': 90}
+        self.resource.on_patch(self.mock_req, self.mock_req,
+                               'keepthreechains')
+        self.mock_db.update_retention.assert_called_once_with(
+            user_id=fake_retention_0['user_id'],
+            retention_id='keepthreechains', patch_doc={'keep_days': 90},
+            refresh=None)
+        self.assertEqual(self.mock_req.body,
+                         {'retention_id': 'keepthreechains', 'version': 4})
+
+    def test_on_post_ok(self):
+        self.mock_db.replace_retention.return_value = 1
+        self.mock_json_body.return_value = get_fake_retention_0()
+        self.resource.on_post(self.mock_req, self.mock_req,
+                              'keepthreechains')
+        self.assertEqual(self.mock_req.status, falcon.HTTP_201)
+        self.assertEqual(self.mock_req.body,
+                         {'retention_id': 'keepthreechains', 'version': 1})
@@ -33,6 +33,9 @@ class TestSessionsCollectionResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_session_0['user_id']
+        self.mock_req.get_param.return_value = None
+        self.mock_req.get_param_as_list.return_value = None
+        self.mock_req.get_param_as_bool.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_sessions.SessionsCollectionResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -74,6 +77,7 @@ class TestSessionsResource(unittest.TestCase):
         self.mock_db = Mock()
         self.mock_req = Mock()
         self.mock_req.get_header.return_value = fake_session_0['user_id']
+        self.mock_req.get_param.return_value = None
         self.mock_req.status = falcon.HTTP_200
         self.resource = v1_sessions.SessionsResource(self.mock_db)
         self.mock_json_body = Mock()
@@ -120,7 +124,7 @@ class TestSessionsResource(unittest.TestCase):
         self.mock_db.update_session.assert_called_with(
             user_id=fake_session_0['user_id'],
             session_id=fake_session_0['session_id'],
-            patch_doc=patch_doc)
+            patch_doc=patch_doc, refresh=None)
         self.assertEqual(self.mock_req.status, falcon.HTTP_200)
         result = self.mock_req.body
         self.assertEqual(result, expected_result)
@@ -308,6 +312,42 @@ class TestSessionsAction(unittest.TestCase):
         self.assertEqual(self.mock_req.status, falcon.HTTP_202)
         self.assertEqual(self.mock_req.body, expected_result)
 
+    @patch('freezer_api.api.v1.sessions.time')
+    def test_on_post_end_action_retries_on_version_conflict(self, mock_time):
+        mock_time.time.return_value = 1000
+        stale_doc = get_fake_session_0()
+        stale_doc['_version'] = 3
+        fresh_doc = get_fake_session_0()
+        fresh_doc['_version'] = 4
+        self.mock_db.get_session.side_effect = [stale_doc, fresh_doc]
+        self.mock_db.update_session.side_effect = [
+            DocumentExists('version conflict'), 5]
+        action = {"end": {
+            "job_id": 'job_id_2',
+            "result": "success"
+        }}
+        self.mock_json_body.return_value = action
+        self.resource.on_post(self.mock_req, self.mock_req, fake_session_0['session_id'])
+        self.assertEqual(self.mock_req.status, falcon.HTTP_202)
+        self.assertEqual(self.mock_db.update_session.call_count, 2)
+        self.assertEqual(self.mock_db.update_session.call_args[1]['version'], 4)
+        self.assertNotIn('_version', self.mock_db.update_session.call_args[1]['patch_doc'])
+
+    @patch('freezer_api.api.v1.sessions.time')
+    def test_on_post_raises_DocumentExists_when_conflicts_persist(self, mock_time):
+        mock_time.time.return_value = 1000
+        self.mock_db.get_session.side_effect = lambda **kw: get_fake_session_0()
+        self.mock_db.update_session.side_effect = DocumentExists('version conflict')
+        action = {"end": {
+            "job_id": 'job_id_2',
+            "result": "success"
+        }}
+        self.mock_json_body.return_value = action
+        self.assertRaises(DocumentExists, self.resource.on_post, self.mock_req,
+                          self.mock_req, fake_session_0['session_id'])
+        self.assertEqual(self.mock_db.update_session.call_count,
+                         v1_sessions.ACTION_MAX_ATTEMPTS)
+
 
 class TestSessions(unittest.TestCase):
 
@@ -0,0 +1,83 @@
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from freezer_api.storage import sqlite
+
+from .common import fake_data_0_user_id
+from .common import get_fake_job_0
+from .engine_behaviour import StorageEngineBehaviour
+
+
+class TestSqliteEngine(StorageEngineBehaviour, unittest.TestCase):
+
+    def setUp(self):
+        self.eng = sqlite.SqliteEngine()
+
+    def tearDown(self):
+        self.eng.db.close()
+
+    def test_tables_have_indexes_on_user_and_sort_key_and_timestamp(self):
+        with self.eng.db.transaction() as conn:
+            indexes = set(row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name = 'backups'"))
+        self.assertIn('backups_user_sort_key', indexes)
+        self.assertIn('backups_user_timestamp', indexes)
+
+    def test_search_by_time_uses_the_timestamp_index(self):
+        with self.eng.db.transaction() as conn:
+            plan = ' '.join(str(row) for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT doc FROM backups '
+                'WHERE user_id = ? AND timestamp >= ?', ('u', 1)))
+        self.assertIn('backups_user_timestamp', plan)
+
+    def test_keyword_match_without_json1_extension(self):
+        self.eng.db.json1 = False
+        self.test_get_backup_matches_exact_keyword_and_any_word()
+
+    def test_keyword_match_on_array_values(self):
+        self.eng.job_manager.insert({'user_id': fake_data_0_user_id,
+                                     'job_id': 'j1',
+                                     'client_id': ['c1', 'c2']}, 'j1')
+        res = self.eng.search_job(fake_data_0_user_id,
+                                  search={'match': [{'client_id': 'c2'}]})
+        self.assertEqual([j['job_id'] for j in res], ['j1'])
+
+
+class TestSqliteEngineFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'freezer-api.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_documents_survive_reopening_the_database(self):
+        eng = sqlite.SqliteEngine(sqlite_path=self.path)
+        job_id = eng.add_job(fake_data_0_user_id, get_fake_job_0())
+        eng.db.close()
+        eng = sqlite.SqliteEngine(sqlite_path=self.path)
+        job = eng.get_job(fake_data_0_user_id, job_id)
+        self.assertEqual(job['job_id'], job_id)
+        self.assertEqual(job['_version'], 1)
+        eng.db.close()
@@ -109,6 +109,16 @@ class TestBackupMetadataDoc(unittest.TestCase):
         self.backup_metadata.data['container'] = 'different'
         self.assertNotEqual(self.backup_metadata.backup_id, DATA_backup_id)
 
+    def test_serialize_stores_the_backup_set_id(self):
+        backup_metadata = utils.BackupMetadataDoc(
+            user_id=DATA_user_id,
+            user_name=DATA_user_name,
+            data=dict(DATA_backup_metadata, container='my_container'))
+        doc = backup_metadata.serialize()
+        self.assertEqual(doc['backup_set_id'],
+                         'my_container_alpha_important_data_backup')
+        self.assertEqual(doc['backup_id'], backup_metadata.backup_id)
+
 
 class TestJobDoc(unittest.TestCase):
 
@@ -0,0 +1,399 @@
+#!/usr/bin/env python
+"""
+(c) Copyright 2016 Hewlett-Packard Enterprise Development Company, L.P.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+Storage benchmarks for freezer-api.
+
+Runs against a live elasticsearch cluster, using a dedicated index that
+is created at start and removed at the end of each scenario. Example:
+
+  # python tools/benchmark.py --hosts http://localhost:9200 refresh
+  # python tools/benchmark.py --count 20000 --threads 5 query
+
+The engines scenario also runs the common calls on the sqlite engine,
+using a scratch database file. The http scenario polls the jobs of a
+running freezer-api, to compare its servers under many connections:
+
+  # python tools/benchmark.py --url http://localhost:9090 \
+        --token $OS_TOKEN --threads 1000 --count 20000 http
+
+The jobs scenario times the creation of jobs holding 1, 10 and 100
+actions, reconciling the actions one at a time and in batch.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import elasticsearch
+from six.moves.urllib import request as urllib_request
+
+from freezer_api.api.v1 import jobs
+from freezer_api.common import db_mappings
+from freezer_api.common import exceptions as freezer_api_exc
+from freezer_api.storage import elastic
+from freezer_api.storage import sqlite
+
+DEFAULT_INDEX = 'freezer_benchmark'
+
+
+def fake_backup_metadata(n):
+    return {
+        'container': 'freezer_benchmark',
+        'hostname': 'host_{0}'.format(n % 50),
+        'backup_name': 'backup_{0}'.format(n % 7),
+        'time_stamp': 1460000000 + n,
+        'timestamp': 1460000000 + n,
+        'curr_backup_level': n % 5,
+        'backup_session': 1460000000 + n,
+        'max_level': 5,
+        'mode': 'fs',
+        'fs_real_path': '/var/lib/data',
+        'backup_size_uncompressed': 4096 + n,
+        'backup_size_compressed': 1024 + n,
+        'compression_alg': 'gzip',
+        'client_os': 'linux',
+    }
+
+
+def create_index(es, index):
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body={'number_of_replicas': 0})
+    for doc_type, mapping in db_mappings.get_mappings().items():
+        es.indices.put_mapping(index=index, doc_type=doc_type, body=mapping)
+
+
+def drop_index(es, index):
+    es.indices.delete(index=index, ignore=[404])
+
+
+def get_engine(args, **kwargs):
+    engine = elastic.ElasticSearchEngine(index=args.index,
+                                         hosts=args.hosts.split(','),
+                                         **kwargs)
+    for manager in [engine.backup_manager, engine.client_manager,
+                    engine.job_manager, engine.action_manager,
+                    engine.session_manager]:
+        manager.index = args.index
+    return engine
+
+
+def run_threads(count, target):
+    threads = [threading.Thread(target=target, args=(i,))
+               for i in range(count)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.time() - start
+
+
+def report(name, operations, elapsed):
+    print('{0:<30} {1:>8} ops {2:>10.2f} s {3:>12.1f} ops/s'.format(
+        name, operations, elapsed, operations / elapsed))
+
+
+def bench_refresh(args):
+    """
+    Writes per second of add_backup for every refresh policy. Before
+    Elasticsearch 5.0, wait_for is sent as a plain refresh and measures
+    the same thing as immediate.
+    """
+    es = elasticsearch.Elasticsearch(hosts=args.hosts.split(','))
+    es_version = es.info()['version']['number']
+    wait_for_is_immediate = int(es_version.split('.')[0]) < 5
+    for policy in elastic.REFRESH_POLICIES:
+        create_index(es, args.index)
+        engine = get_engine(args, refresh_policy=policy)
+        per_thread = args.count // args.threads
+
+        def writer(thread_n):
+            user_id = uuid.uuid4().hex
+            for n in range(per_thread):
+                engine.add_backup(user_id, 'benchmark',
+                                  fake_backup_metadata(n))
+
+        elapsed = run_threads(args.threads, writer)
+        report('refresh_policy={0}'.format(policy),
+               per_thread * args.threads, elapsed)
+        if policy == elastic.REFRESH_WAIT_FOR and wait_for_is_immediate:
+            print('  elasticsearch {0}: wait_for behaves like immediate '
+                  'before 5.0'.format(es_version))
+    drop_index(es, args.index)
+
+
+def legacy_search_query(user_id, search):
+    """
+    Query built by the type managers before the query builder: the whole
+    search, match clauses included, wrapped in the filter part
+    """
+    match_list = [{"match": m} for m in search.get('match', [])]
+    match_not_list = [{"match": m} for m in search.get('match_not', [])]
+    base_filter = [{"term": {"user_id": user_id}},
+                   {"query": {"bool": {"must": match_list,
+                                       "must_not": match_not_list}}}]
+    return {'query': {'filtered': {'filter': {'bool': {'must': base_filter}}}}}
+
+
+def bench_query(args):
+    """
+    Elasticsearch 'took' time of the backup searches, with the former
+    query layout and with the query builder
+    """
+    es = elasticsearch.Elasticsearch(hosts=args.hosts.split(','))
+    create_index(es, args.index)
+    engine = get_engine(args, refresh_policy=elastic.REFRESH_NONE)
+    users = [uuid.uuid4().hex for _ in range(10)]
+    docs = [fake_backup_metadata(n) for n in range(args.count)]
+    for n, user_id in enumerate(users):
+        engine.add_backups(user_id, 'benchmark', docs[n::len(users)])
+    es.indices.refresh(index=args.index)
+
+    searches = [{}]
+    searches += [{'match': [{'backup_metadata.hostname': 'host_{0}'.format(n)}]}
+                 for n in range(5)]
+    searches += [{'match': [{'backup_metadata.container': 'freezer_benchmark'},
+                            {'backup_metadata.backup_name': 'backup_{0}'
+                             .format(n)}]} for n in range(5)]
+    builder = engine.backup_manager
+    layouts = [('legacy', legacy_search_query),
+               ('query_builder',
+                lambda user_id, search: builder.get_search_query(
+                    user_id, None, search))]
+    for name, make_query in layouts:
+        es.indices.clear_cache(index=args.index)
+        took = [0] * args.threads
+
+        def searcher(thread_n):
+            for user_id in users:
+                for search in searches:
+                    res = es.search(index=args.index, doc_type='backups',
+                                    body=make_query(user_id, search),
+                                    size=10)
+                    took[thread_n] += res['took']
+
+        elapsed = run_threads(args.threads, searcher)
+        report('query={0}'.format(name),
+               args.threads * len(users) * len(searches), elapsed)
+        print('{0:<30} {1:>8} ms took in total'.format('', sum(took)))
+    drop_index(es, args.index)
+
+
+def bench_engines(args):
+    """
+    Operations per second of the common calls on elasticsearch and on the
+    sqlite engine
+    """
+    es = elasticsearch.Elasticsearch(hosts=args.hosts.split(','))
+    create_index(es, args.index)
+    tmp_dir = tempfile.mkdtemp()
+    engines = [
+        ('elasticsearch', get_engine(args)),
+        ('sqlite', sqlite.SqliteEngine(
+            sqlite_path=os.path.join(tmp_dir, 'benchmark.db'))),
+    ]
+    per_thread = args.count // args.threads
+    operations = per_thread * args.threads
+    job = {'job_actions': [], 'job_schedule': {}, 'client_id': 'benchmark'}
+    for name, engine in engines:
+        users = [uuid.uuid4().hex for _ in range(args.threads)]
+        job_ids = [engine.add_job(user_id, dict(job)) for user_id in users]
+
+        def add_backup(thread_n):
+            for n in range(per_thread):
+                engine.add_backup(users[thread_n], 'benchmark',
+                                  fake_backup_metadata(n))
+
+        def list_backups(thread_n):
+            for n in range(per_thread):
+                engine.get_backup(users[thread_n], offset=n % 100, limit=10)
+
+        def search_backups(thread_n):
+            for n in range(per_thread):
+                engine.get_backup(users[thread_n], limit=10, search={
+                    'match': [{'backup_metadata.hostname':
+                               'host_{0}'.format(n % 50)}],
+                    'time_after': 1460000000 + n})
+
+        def update_job(thread_n):
+            for n in range(per_thread):
+                engine.update_job(users[thread_n], job_ids[thread_n],
+                                  {'description': 'update {0}'.format(n)})
+
+        calls = [('add_backup', add_backup),
+                 ('list_backups', list_backups),
+                 ('search_backups', search_backups),
+                 ('update_job', update_job)]
+        for call, target in calls:
+            elapsed = run_threads(args.threads, target)
+            report('{0} {1}'.format(name, call), operations, elapsed)
+    drop_index(es, args.index)
+    shutil.rmtree(tmp_dir)
+
+
+def fake_job(action_count):
+    return {
+        'description': 'benchmark job',
+        'client_id': 'benchmark',
+        'job_schedule': {},
+        'job_actions': [
+            {'freezer_action': {'action': 'backup',
+                                'mode': 'fs',
+                                'path_to_backup': '/var/lib/data_{0}'
+                                .format(n),
+                                'container': 'freezer_benchmark'},
+             'max_retries': 3}
+            for n in range(action_count)],
+    }
+
+
+def legacy_update_actions_in_job(db, user_id, job_doc):
+    """
+    Reconciliation of the job actions before the batched one: a get and,
+    for the new or changed actions, an indexing request per action
+    """
+    for action in jobs.Job(job_doc).actions():
+        if action.action_id:
+            try:
+                found = db.get_action(user_id=user_id,
+                                      action_id=action.action_id)
+            except freezer_api_exc.DocumentNotFound:
+                found = None
+            if found:
+                if action == jobs.Action(found):
+                    continue
+                action.create_new_action_id()
+        db.add_action(user_id=user_id, doc=action.doc)
+
+
+def bench_jobs(args):
+    """
+    Latency of the job creation, actions included, with 1, 10 and 100
+    actions per job. Half of the jobs reuse the actions of a stored job.
+    """
+    es = elasticsearch.Elasticsearch(hosts=args.hosts.split(','))
+    create_index(es, args.index)
+    engine = get_engine(args)
+    resource = jobs.JobsBaseResource(engine)
+    layouts = [
+        ('one_by_one', lambda user_id, doc: legacy_update_actions_in_job(
+            engine, user_id, doc)),
+        ('batch', resource.update_actions_in_job),
+    ]
+    per_thread = max(1, args.count // args.threads)
+    for action_count in [1, 10, 100]:
+        for name, update_actions in layouts:
+            latencies = [[] for _ in range(args.threads)]
+
+            def creator(thread_n):
+                user_id = uuid.uuid4().hex
+                stored = None
+                for n in range(per_thread):
+                    doc = fake_job(action_count)
+                    if stored is not None and n % 2:
+                        doc['job_actions'] = stored
+                    start = time.time()
+                    update_actions(user_id, doc)
+                    engine.add_job(user_id, doc)
+                    latencies[thread_n].append(time.time() - start)
+                    stored = doc['job_actions']
+
+            elapsed = run_threads(args.threads, creator)
+            latencies = sorted(sum(latencies, []))
+            report('{0} actions {1}'.format(action_count, name),
+                   len(latencies), elapsed)
+            print('{0:<30} p50 {1:.1f} ms, p99 {2:.1f} ms'.format(
+                '', latencies[len(latencies) // 2] * 1000,
+                latencies[int(len(latencies) * 0.99)] * 1000))
+    drop_index(es, args.index)
+
+
+def bench_http(args):
+    """
+    Requests per second and latencies of GET /v1/jobs, the poll of the
+    schedulers, with one connection in flight per thread
+    """
+    url = args.url.rstrip('/') + '/v1/jobs?limit=10'
+    headers = {'Accept': 'application/json'}
+    if args.token:
+        headers['X-Auth-Token'] = args.token
+    per_thread = max(1, args.count // args.threads)
+    latencies = [[] for _ in range(args.threads)]
+    errors = [0] * args.threads
+
+    def poller(thread_n):
+        for n in range(per_thread):
+            start = time.time()
+            try:
+                urllib_request.urlopen(
+                    urllib_request.Request(url, headers=headers),
+                    timeout=60).read()
+            except Exception:
+                errors[thread_n] += 1
+            latencies[thread_n].append(time.time() - start)
+
+    elapsed = run_threads(args.threads, poller)
+    latencies = sorted(sum(latencies, []))
+    report('GET /v1/jobs', len(latencies), elapsed)
+    print('{0:<30} p50 {1:.1f} ms, p99 {2:.1f} ms, {3} errors'.format(
+        '', latencies[len(latencies) // 2] * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000, sum(errors)))
+
+
+SCENARIOS = {
+    'engines': bench_engines,
+    'http': bench_http,
+    'jobs': bench_jobs,
+    'query': bench_query,
+    'refresh': bench_refresh,
+}
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='freezer-api benchmarks')
+    parser.add_argument('--hosts', default='http://localhost:9200',
+                        help='Comma separated elasticsearch hosts')
+    parser.add_argument('--index', default=DEFAULT_INDEX,
+                        help='Scratch index used by the benchmark '
+                             '(default "{0}"). It is deleted at the end'
+                             .format(DEFAULT_INDEX))
+    parser.add_argument('--url', default='http://localhost:9090',
+                        help='freezer-api endpoint of the http scenario')
+    parser.add_argument('--token', default=None,
+                        help='Keystone token sent by the http scenario')
+    parser.add_argument('--count', type=int, default=2000,
+                        help='Number of documents per scenario')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Number of concurrent clients')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS.keys()))
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    SCENARIOS[args.scenario](args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())